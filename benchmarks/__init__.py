@@ -0,0 +1,15 @@
+"""End-to-end driver benchmarks against emulated devices.
+
+Each benchmark serves an :class:`~runze_control.emulator.EmulatedBus` on a
+pseudo-terminal and drives it with the real driver classes, so results
+include pyserial and the kernel tty path. (Linux/macOS only.)
+
+Run every benchmark and save the results as a JSON baseline with::
+
+    python -m benchmarks --save benchmarks/baselines/latest.json
+
+and check a later run against it with::
+
+    python -m benchmarks --compare benchmarks/baselines/latest.json
+
+"""
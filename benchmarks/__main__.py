@@ -0,0 +1,120 @@
+"""Run the benchmarks. Optionally save or compare against a JSON baseline."""
+from benchmarks import baudrate_upgrade, latency, scaling
+from benchmarks.harness import BAUDRATE
+from datetime import datetime, timezone
+import argparse
+import json
+import platform
+import sys
+
+# Metrics where bigger is better. Every other metric is a time.
+HIGHER_IS_BETTER = {"cmds_per_s", "polls_per_device_per_s"}
+# Tail latencies are recorded but too noisy on shared hosts to gate on.
+COMPARED_METRICS = ("p50_ms", "cmds_per_s", "cpu_per_cmd_ms",
+                    "polls_per_device_per_s")
+
+
+def run(count: int, duration_s: float, device_counts, baudrate: int):
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "baudrate": baudrate,
+        },
+        "latency": latency.run(count, baudrate),
+        "scaling": scaling.run(device_counts, duration_s, baudrate),
+        "baudrate_upgrade": baudrate_upgrade.run(count),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Return a description of every metric that is worse than the baseline
+    by more than `tolerance` (a fraction)."""
+    pairs = [(f"latency.{cmd}", results["latency"][cmd], summary)
+             for cmd, summary in baseline["latency"].items()
+             if cmd in results["latency"]]
+    scaling_results = {s["devices"]: s for s in results["scaling"]}
+    pairs += [(f"scaling.{s['devices']}_devices",
+               scaling_results[s["devices"]], s)
+              for s in baseline["scaling"] if s["devices"] in scaling_results]
+    regressions = []
+    for name, new, old in pairs:
+        for metric in COMPARED_METRICS:
+            if metric not in old or not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(f"{name}.{metric}: {old[metric]:.3f} -> "
+                                   f"{new[metric]:.3f} ({change:+.0%} worse)")
+    return regressions
+
+
+def print_results(results: dict):
+    print(f"{'command':<20}{'p50[ms]':>9}{'p90[ms]':>9}{'p99[ms]':>9}"
+          f"{'cmds/s':>9}{'cpu/cmd[ms]':>13}")
+    for cmd, s in results["latency"].items():
+        print(f"{cmd:<20}{s['p50_ms']:>9.3f}{s['p90_ms']:>9.3f}"
+              f"{s['p99_ms']:>9.3f}{s['cmds_per_s']:>9.0f}"
+              f"{s['cpu_per_cmd_ms']:>13.3f}")
+    print()
+    print(f"{'devices':<9}{'p50[ms]':>9}{'p99[ms]':>9}{'cmds/s':>9}"
+          f"{'polls/dev/s':>13}{'cpu/cmd[ms]':>13}")
+    for s in results["scaling"]:
+        print(f"{s['devices']:<9}{s['p50_ms']:>9.3f}{s['p99_ms']:>9.3f}"
+              f"{s['cmds_per_s']:>9.0f}{s['polls_per_device_per_s']:>13.1f}"
+              f"{s['cpu_per_cmd_ms']:>13.3f}")
+    upgrade = results.get("baudrate_upgrade")
+    if upgrade is not None:
+        print()
+        print(f"{'baud rate':<20}{'p50[ms]':>9}{'p90[ms]':>9}{'p99[ms]':>9}"
+              f"{'cmds/s':>9}")
+        for label, rate in (("before", "old_baudrate"),
+                            ("after", "new_baudrate")):
+            s = upgrade[label]
+            print(f"{upgrade[rate]:<20}{s['p50_ms']:>9.3f}{s['p90_ms']:>9.3f}"
+                  f"{s['p99_ms']:>9.3f}{s['cmds_per_s']:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description=__doc__)
+    parser.add_argument("--count", type=int, default=500,
+                        help="samples per command in the latency benchmark.")
+    parser.add_argument("--duration", type=float, default=2.0,
+                        help="seconds per device count in the scaling "
+                             "benchmark.")
+    parser.add_argument("--devices", type=int, nargs="+",
+                        default=list(scaling.DEVICE_COUNTS),
+                        help="device counts for the scaling benchmark.")
+    parser.add_argument("--baudrate", type=int, default=BAUDRATE)
+    parser.add_argument("--save", metavar="PATH",
+                        help="save results as a JSON baseline.")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="exit with an error if results are worse than "
+                             "this JSON baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed regression as a fraction of the "
+                             "baseline (default: %(default)s).")
+    args = parser.parse_args()
+
+    results = run(args.count, args.duration, args.devices, args.baudrate)
+    print_results(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} of "
+              f"{args.compare}.")
+
+
+if __name__ == "__main__":
+    main()
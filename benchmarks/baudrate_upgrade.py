@@ -0,0 +1,37 @@
+"""Query round trip before and after a baud rate upgrade."""
+from benchmarks.harness import summarize, time_calls, SYRINGE_VOLUME_UL
+from runze_control.baudrate import upgrade_baudrate
+from runze_control.emulator import EmulatedBus, EmulatedSY08
+from runze_control.runze_bus import RunzeBus
+from runze_control.syringe_pump import SY08
+
+START_BAUDRATE = 9600  # Factory default.
+
+
+def run(count: int = 500, device_count: int = 4):
+    """Upgrade a bus of emulated SY08s from the factory default rate. Return
+    a summary (see :func:`~benchmarks.harness.summarize`) of motor status
+    queries before and after, and the rates negotiated.
+
+    Unlike the other benchmarks, this one connects in-process (through
+    :meth:`~runze_control.emulator.EmulatedBus.serial`) since a pty can't
+    change rates.
+    """
+    emulated_bus = EmulatedBus([EmulatedSY08(address=address,
+                                             syringe_volume_ul=SYRINGE_VOLUME_UL,
+                                             baudrate=START_BAUDRATE)
+                                for address in range(device_count)])
+    bus = RunzeBus(emulated_bus.serial(START_BAUDRATE))
+    try:
+        pumps = [SY08(bus, address=address,
+                      syringe_volume_ul=SYRINGE_VOLUME_UL)
+                 for address in range(device_count)]
+        before = summarize(*time_calls(pumps[0].get_motor_status, count))
+        upgrade = upgrade_baudrate(pumps, benchmark_count=0)
+        after = summarize(*time_calls(pumps[0].get_motor_status, count))
+    finally:
+        bus.close()
+        emulated_bus.close()
+    return {"old_baudrate": upgrade.old_baudrate,
+            "new_baudrate": upgrade.new_baudrate,
+            "before": before, "after": after}
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Measure the CPU time the driver spends waiting on syringe moves.
+
+A stand-in device replies over a pseudo-terminal after a fixed move duration,
+so the measurement includes the real pyserial and kernel tty path.
+(Linux/macOS only.)
+"""
+
+import argparse
+import os
+import threading
+import tty
+from time import perf_counter, process_time, sleep
+
+from runze_control.syringe_pump import SY08
+
+MOVE_CMDS = {0x42, 0x4D, 0x4E}  # RunInCW, RunInCCW, MoveSyringeAbsolute
+
+
+def reply_frame(address: int, parameter: int = 0):
+    b3, b4 = parameter.to_bytes(2, 'little')
+    frame = bytes([0xCC, address, 0x00, b3, b4, 0xDD])
+    return frame + sum(frame).to_bytes(2, 'little')
+
+
+def serve(master_fd: int, move_time_s: float, stop: threading.Event):
+    """Reply to every 8-byte command, delaying replies to move commands."""
+    while not stop.is_set():
+        try:
+            cmd = os.read(master_fd, 8)
+        except OSError:
+            return
+        if len(cmd) < 8:
+            continue
+        if cmd[2] in MOVE_CMDS:
+            sleep(move_time_s)
+        os.write(master_fd, reply_frame(cmd[1], cmd[1] if cmd[2] == 0x20 else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--moves", type=int, default=10)
+    parser.add_argument("--move-time", type=float, default=0.5,
+                        help="simulated duration of each move in seconds.")
+    args = parser.parse_args()
+
+    master_fd, slave_fd = os.openpty()
+    tty.setraw(slave_fd)
+    stop = threading.Event()
+    server = threading.Thread(target=serve, daemon=True,
+                              args=(master_fd, args.move_time, stop))
+    server.start()
+
+    pump = SY08(os.ttyname(slave_fd), baudrate=115200, address=0x00,
+                syringe_volume_ul=25000)
+    wall_start_s = perf_counter()
+    cpu_start_s = process_time()
+    for i in range(args.moves):
+        pump.dispense_steps(100)
+    cpu_s = process_time() - cpu_start_s
+    wall_s = perf_counter() - wall_start_s
+    stop.set()
+
+    print(f"moves: {args.moves}, move time: {args.move_time:.3f}[s]")
+    print(f"wall time per move: {wall_s / args.moves * 1e3:.2f}[ms]")
+    print(f"CPU time per move: {cpu_s / args.moves * 1e3:.2f}[ms] "
+          f"({cpu_s / wall_s * 100:.1f}% of one core)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Shared setup and statistics for the benchmarks."""
+from contextlib import contextmanager
+from runze_control.emulator import EmulatedBus, EmulatedSY08
+from runze_control.runze_bus import RunzeBus
+from runze_control.syringe_pump import SY08
+from time import perf_counter, process_time
+
+SYRINGE_VOLUME_UL = 5000
+BAUDRATE = 115200
+
+
+@contextmanager
+def emulated_pumps(device_count: int = 1, baudrate: int = BAUDRATE):
+    """Yield `device_count` SY08 drivers sharing one bus to the same number
+    of emulated SY08s served on a pty."""
+    emulated_bus = EmulatedBus([EmulatedSY08(address=address,
+                                             syringe_volume_ul=SYRINGE_VOLUME_UL,
+                                             baudrate=baudrate)
+                                for address in range(device_count)])
+    bus = RunzeBus(emulated_bus.pty(baudrate), baudrate)
+    try:
+        yield [SY08(bus, address=address, syringe_volume_ul=SYRINGE_VOLUME_UL)
+               for address in range(device_count)]
+    finally:
+        bus.close()
+        emulated_bus.close()
+
+
+def time_calls(fn, count: int):
+    """Call `fn()` `count` times. Return the latency of each call [s] and the
+    total CPU time spent [s]."""
+    latencies_s = []
+    cpu_start_s = process_time()
+    for _ in range(count):
+        start_s = perf_counter()
+        fn()
+        latencies_s.append(perf_counter() - start_s)
+    return latencies_s, process_time() - cpu_start_s
+
+
+def summarize(latencies_s, cpu_s: float, wall_s: float = None):
+    """Latency percentiles [ms], throughput and CPU per command of a run."""
+    samples = sorted(latencies_s)
+    count = len(samples)
+    if wall_s is None:
+        wall_s = sum(samples)
+
+    def percentile(p):
+        return samples[min(count - 1, round(p / 100 * (count - 1)))] * 1e3
+
+    return {
+        "count": count,
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "max_ms": samples[-1] * 1e3,
+        "cmds_per_s": count / wall_s,
+        "cpu_per_cmd_ms": cpu_s / count * 1e3,
+    }
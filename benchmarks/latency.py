@@ -0,0 +1,20 @@
+"""Round-trip latency per command type for one device on one bus."""
+from benchmarks.harness import emulated_pumps, summarize, time_calls, BAUDRATE
+
+
+def run(count: int = 500, baudrate: int = BAUDRATE):
+    """Return a summary (see :func:`~benchmarks.harness.summarize`) per
+    command. RunInCW moves one step at full speed, so its latency includes
+    about 0.5[ms] of plunger travel."""
+    with emulated_pumps(1, baudrate) as (pump,):
+        pump.set_speed_percent(100)
+        pump.aspirate_steps(count)  # Leave room to dispense 1 step per call.
+        commands = \
+        {
+            "GetMotorStatus": pump.get_motor_status,
+            "GetSyringePosition": pump.get_position_steps,
+            "RunInCW": lambda: pump.dispense_steps(1),
+            "SetDynamicSpeed": lambda: pump.set_speed_percent(100),
+        }
+        return {name: summarize(*time_calls(fn, count))
+                for name, fn in commands.items()}
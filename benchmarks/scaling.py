@@ -0,0 +1,46 @@
+"""Throughput of one bus as the number of devices on it grows."""
+from benchmarks.harness import emulated_pumps, summarize, BAUDRATE
+from threading import Barrier, Thread
+from time import perf_counter, process_time
+
+DEVICE_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def run(device_counts=DEVICE_COUNTS, duration_s: float = 2.0,
+        baudrate: int = BAUDRATE):
+    """Poll every device's motor status from its own thread for `duration_s`.
+    Return a summary (see :func:`~benchmarks.harness.summarize`) per device
+    count, plus the poll rate each device gets."""
+    return [dict(devices=device_count,
+                 **_run_once(device_count, duration_s, baudrate))
+            for device_count in device_counts]
+
+
+def _run_once(device_count: int, duration_s: float, baudrate: int):
+    with emulated_pumps(device_count, baudrate) as pumps:
+        latencies_s = [[] for _ in pumps]
+        start = Barrier(device_count + 1)
+
+        def poll(pump, samples):
+            start.wait()
+            while perf_counter() < deadline_s:
+                call_start_s = perf_counter()
+                pump.get_motor_status()
+                samples.append(perf_counter() - call_start_s)
+
+        threads = [Thread(target=poll, args=(pump, samples), daemon=True)
+                   for pump, samples in zip(pumps, latencies_s)]
+        for thread in threads:
+            thread.start()
+        deadline_s = perf_counter() + duration_s
+        cpu_start_s = process_time()
+        wall_start_s = perf_counter()
+        start.wait()
+        for thread in threads:
+            thread.join()
+        wall_s = perf_counter() - wall_start_s
+        cpu_s = process_time() - cpu_start_s
+    summary = summarize([s for samples in latencies_s for s in samples],
+                        cpu_s, wall_s)
+    summary["polls_per_device_per_s"] = summary["cmds_per_s"] / device_count
+    return summary
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import logging
+
+from runze_control.discovery import discover
+
+logging.basicConfig(level=logging.INFO)
+
+
+# Scan every serial port on the system at every valid baud rate.
+# (For an RS485 bus with several devices, specify which addresses to probe:
+#  discover(["/dev/ttyUSB0"], addresses=range(16)).)
+for device in discover():
+    print(f"{device.port}: address 0x{device.address:02x} at "
+          f"{device.baudrate}[bps], firmware version: "
+          f"{device.firmware_version}")
@@ -0,0 +1,382 @@
+"""asyncio interface to Runze devices."""
+from runze_control.protocol import Protocol
+from runze_control.runze_bus import RunzeBus
+from runze_control.runze_device import RunzeDevice
+from runze_control.syringe_pump import SyringePump, MiniSY04
+from runze_control.multichannel_syringe_pump import MultiChannelSyringePump
+from runze_control.rotary_valve import RotaryValve
+from runze_control.runze_protocol import ReplyStatus
+from serial import SerialException
+from time import perf_counter
+import asyncio
+import weakref
+
+
+class AsyncBusReader:
+    """Delivers replies from a :class:`RunzeBus` to coroutines awaiting them.
+
+    The bus's file descriptor is registered with the event loop, so replies
+    are read only when the port becomes readable. No threads are involved.
+    One reader exists per bus; every async device on the bus shares it.
+    """
+
+    _readers = weakref.WeakKeyDictionary()  # bus -> reader
+
+    def __init__(self, bus: RunzeBus, loop: asyncio.AbstractEventLoop):
+        self.bus = bus
+        self.loop = loop
+        self._waiters = []  # (address, future) in the order they were added.
+        try:
+            self._fileno = bus.ser.fileno()
+        except (AttributeError, OSError, ValueError) as e:
+            raise NotImplementedError("asyncio support requires a serial port "
+                                      "with a selectable file descriptor.") from e
+        loop.add_reader(self._fileno, self._on_readable)
+
+    @classmethod
+    def for_bus(cls, bus: RunzeBus):
+        """Return the reader for this bus on the running event loop, creating
+        one if needed."""
+        loop = asyncio.get_running_loop()
+        reader = cls._readers.get(bus)
+        if reader is None or reader.loop is not loop:
+            if reader is not None:
+                reader.close()
+            reader = cls(bus, loop)
+            cls._readers[bus] = reader
+        return reader
+
+    def close(self):
+        """Stop watching the port and cancel any pending waiters."""
+        if not self.loop.is_closed():
+            self.loop.remove_reader(self._fileno)
+        for _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+        if self.__class__._readers.get(self.bus) is self:
+            del self.__class__._readers[self.bus]
+
+    async def get_reply(self, address: int = None, timeout_s: float = 0):
+        """Return the oldest reply from `address` (or any address if None),
+        waiting up to `timeout_s` for it to arrive. Return an empty reply if
+        none arrives in time."""
+        # Polling may pick up replies that other coroutines are waiting on.
+        self._on_readable()
+        reply = self.bus.pop_reply(address)
+        if reply is not None or timeout_s <= 0:
+            return reply if reply is not None else bytes()
+        waiter = (address, self.loop.create_future())
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout_s)
+        except asyncio.TimeoutError:
+            return bytes()
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _on_readable(self):
+        """Pull new bytes off the port and hand replies to their waiters."""
+        if not self.bus.poll():
+            return
+        for waiter in list(self._waiters):
+            address, future = waiter
+            if future.done():
+                continue
+            reply = self.bus.pop_reply(address)
+            if reply is not None:
+                self._waiters.remove(waiter)
+                future.set_result(reply)
+
+
+class AsyncRunzeDevice:
+    """asyncio interface to a connected :class:`RunzeDevice`.
+
+    Commands are encoded and written by the wrapped device, so all device
+    state (address, position, speed) stays in one place. Replies are awaited
+    on the event loop instead of blocking a thread.
+
+    .. code-block:: python
+
+        pump = AsyncSyringePump(SY08("/dev/ttyUSB0", address=0x00,
+                                     syringe_volume_ul=25000))
+        await pump.dispense(100)
+
+    """
+
+    def __init__(self, device: RunzeDevice):
+        self.device = device
+        self.log = device.log
+
+    @property
+    def address(self):
+        return self.device.address
+
+    def close(self):
+        """Stop watching the bus and close the device's port if it owns it."""
+        reader = AsyncBusReader._readers.get(self.device.bus)
+        if reader is not None:
+            reader.close()
+        self.device.close()
+
+    def is_busy(self):
+        """True if a command was previously issued without waiting, and the
+        reply has not yet been received. (Does not touch the port.)"""
+        return self.device.cmd_send_time_s is not None
+
+    async def wait_for_reply(self, force: bool = False):
+        reply = await self._get_reply(protocol=self.device.protocol,
+                                      force=force)
+        if len(reply) == 0:
+            raise SerialException("No reply received from device.")
+        return self.device._parse_runze_reply(reply)
+
+    async def get_address(self):
+        reply = await self._send_query_runze(
+            self.device.codes.CommonCmd.GetAddress)
+        return reply.parameter
+
+    async def get_firmware_version(self):
+        reply = await self._send_query_runze(
+            self.device.codes.CommonCmd.GetFirmwareVersion)
+        b3, b4 = reply.parameter.to_bytes(2, 'little')
+        return float(f"{b3}.{b4}")
+
+    async def _send_common_cmd_runze(self, func: int, param_value: int = 0,
+                                     force: bool = False):
+        """Send a common command over Runze Protocol and return the reply."""
+        self.device._send_common_cmd_runze(func, param_value, wait=False,
+                                           force=force)
+        return await self.wait_for_reply()
+
+    async def _send_query_runze(self, func: int, param_value: int = 0x0000,
+                                force: bool = False):
+        """Send a query over Runze Protocol and return the reply."""
+        return await self._send_common_cmd_runze(func, param_value, force)
+
+    async def _send(self, packet: bytes, protocol: Protocol = Protocol.RUNZE,
+                    force: bool = False):
+        """Send a message over the specified protocol and return the reply."""
+        self.device._send(packet, protocol=protocol, wait=False, force=force)
+        reply = await self._get_reply(protocol)
+        if len(reply) == 0:
+            raise SerialException("No reply received from device.")
+        return reply
+
+    async def _get_reply(self, protocol: Protocol = Protocol.RUNZE,
+                         force: bool = False):
+        """Await the reply from a previously-issued command for up to the
+        device's timeout period. Return an empty reply on timeout."""
+        device = self.device
+        if device.cmd_send_time_s is None and not force:
+            raise SerialException("Cannot retrieve a reply. "
+                                  "No command has been issued.")
+        if protocol != Protocol.RUNZE:
+            raise NotImplementedError(f"{protocol} protocol is not yet "
+                                      "supported over asyncio.")
+        start_time_s = device.cmd_send_time_s \
+            if device.cmd_send_time_s is not None else perf_counter()
+        timeout_s = device._timeout_s - (perf_counter() - start_time_s)
+        reader = AsyncBusReader.for_bus(device.bus)
+        reply = await reader.get_reply(device.address, timeout_s)
+        return device._accept_reply(reply)
+
+
+class AsyncSyringePump(AsyncRunzeDevice):
+    """asyncio interface to a connected :class:`SyringePump`."""
+
+    def __init__(self, device: SyringePump):
+        super().__init__(device)
+
+    async def _finish_move(self, wait: bool):
+        """Await the reply to a move the wrapped device just issued (if it
+        issued one)."""
+        if wait and self.device.cmd_send_time_s is not None:
+            await self.wait_for_reply()
+
+    async def reset_syringe_position(self):
+        """Reset and home the syringe."""
+        device = self.device
+        await self.set_speed_percent(device.__class__.DEFAULT_SPEED_PERCENT)
+        await self._send_query_runze(device.codes.CommonCmd.ResetSyringePosition)
+        await self._send_query_runze(
+            device.codes.CommonCmd.SynchronizeSyringePosition)
+        device.driver_steps = 0
+
+    async def get_position_steps(self):
+        """return the syringe position in linear steps."""
+        reply = await self._send_query_runze(
+            self.device.codes.CommonCmd.GetSyringePosition)
+        self.device.driver_steps = reply.parameter
+        return self.device.driver_steps
+
+    async def get_position_ul(self):
+        device = self.device
+        return (await self.get_position_steps() * device.syringe_volume_ul
+                / device.max_position_steps)
+
+    async def get_position_percent(self):
+        return (await self.get_position_steps() * 100.0
+                / self.device.max_position_steps)
+
+    async def aspirate(self, microliters: float, wait: bool = True):
+        self.device.aspirate(microliters, wait=False)
+        await self._finish_move(wait)
+
+    async def withdraw(self, microliters: float, wait: bool = True):
+        return await self.aspirate(microliters, wait)
+
+    async def dispense(self, microliters: float, wait: bool = True):
+        self.device.dispense(microliters, wait=False)
+        await self._finish_move(wait)
+
+    async def aspirate_steps(self, steps: int, wait: bool = True):
+        self.device.aspirate_steps(steps, wait=False)
+        await self._finish_move(wait)
+
+    async def withdraw_steps(self, steps: int, wait: bool = True):
+        return await self.aspirate_steps(steps, wait)
+
+    async def dispense_steps(self, steps: int, wait: bool = True):
+        self.device.dispense_steps(steps, wait=False)
+        await self._finish_move(wait)
+
+    async def move_absolute_in_steps(self, steps: int, wait: bool = True):
+        self.device.move_absolute_in_steps(steps, wait=False)
+        await self._finish_move(wait)
+        # Match the blocking driver, which resyncs accumulated step error on
+        # devices without a native absolute move.
+        if wait and isinstance(self.device, MiniSY04):
+            await self.get_position_steps()
+
+    async def move_absolute_in_percent(self, percent: float,
+                                       wait: bool = True):
+        if (percent > 100) or (percent < 0):
+            raise ValueError(f"Requested plunger movement ({percent}) "
+                             "is out of range [0 - 100].")
+        steps = round(percent / 100.0 * self.device.max_position_steps)
+        await self.move_absolute_in_steps(steps, wait=wait)
+
+    async def set_speed_percent(self, percent: float):
+        self.device.set_speed_percent(percent, wait=False)
+        await self.wait_for_reply()
+
+    def get_speed_percent(self):
+        return self.device.get_speed_percent()
+
+    async def get_motor_status(self):
+        reply = await self._send_common_cmd_runze(
+            self.device.codes.CommonCmd.GetMotorStatus)
+        return reply.parameter
+
+    async def is_busy(self):
+        if super().is_busy() or self.device.motion.is_moving():
+            return True
+        if await self.get_motor_status() == ReplyStatus.MotorBusy:
+            return True
+        self.device.motion.cancel()
+        return False
+
+    async def wait_until_idle(self, timeout_s: float = None):
+        """Wait until the plunger stops. Sleeps until the move's predicted
+        end, then confirms with a motor status query."""
+        device = self.device
+        if timeout_s is None:
+            timeout_s = device.LONG_TIMEOUT_S
+        deadline_s = perf_counter() + timeout_s
+        if device.cmd_send_time_s is not None:
+            await self.wait_for_reply()
+        while True:
+            end_time_s = device.motion.end_time_s
+            if end_time_s is not None:
+                await asyncio.sleep(max(0, min(end_time_s, deadline_s)
+                                        - perf_counter()))
+            if not await self.is_busy():
+                return
+            if perf_counter() >= deadline_s:
+                raise SerialException("Timed out waiting for the plunger to "
+                                      "stop.")
+            await asyncio.sleep(device.POLL_INTERVAL_S)
+
+    async def force_stop(self):
+        """Halt the syringe pump in its current location."""
+        was_busy = super().is_busy()
+        self.device.motion.cancel()
+        await self._send_common_cmd_runze(
+            self.device.codes.CommonCmd.ForceStop, force=True)
+        # Clear the residual reply from the aborted move (SY08).
+        if was_busy and not isinstance(self.device, MiniSY04):
+            await self.wait_for_reply(force=True)
+        await self.get_position_steps()
+
+    async def halt(self):
+        return await self.force_stop()
+
+
+class AsyncMultiChannelSyringePump(AsyncSyringePump):
+    """asyncio interface to a connected :class:`MultiChannelSyringePump`."""
+
+    def __init__(self, device: MultiChannelSyringePump):
+        super().__init__(device)
+
+    async def move_valve_to_position(self, position: int, wait: bool = True):
+        self.device.move_valve_to_position(position, wait=False)
+        await self._finish_move(wait)
+
+
+class AsyncRotaryValve(AsyncRunzeDevice):
+    """asyncio interface to a connected :class:`RotaryValve`."""
+
+    def __init__(self, device: RotaryValve):
+        super().__init__(device)
+
+    async def _finish_move(self, wait: bool):
+        if wait and self.device.cmd_send_time_s is not None:
+            try:
+                await self.wait_for_reply()
+            except RuntimeError:
+                self.device._position = None
+                raise
+
+    async def get_position(self):
+        """Return the port the rotor is at."""
+        reply = await self._send_query_runze(
+            self.device.codes.CommonCmd.GetCurrentChannelAddress)
+        self.device._position = reply.parameter
+        return reply.parameter
+
+    async def move_to_position(self, position, wait: bool = True):
+        """Move to a port by whichever direction passes the fewest ports."""
+        device = self.device
+        if device.rotations is not None and device._position is None:
+            await self.get_position()  # Plan without blocking on a query.
+        device.move_to_position(position, wait=False)
+        await self._finish_move(wait)
+
+    async def move_clockwise_to_position(self, position, wait: bool = True):
+        self.device.move_clockwise_to_position(position, wait=False)
+        await self._finish_move(wait)
+
+    async def move_counterclockwise_to_position(self, position,
+                                                wait: bool = True):
+        self.device.move_counterclockwise_to_position(position, wait=False)
+        await self._finish_move(wait)
+
+    async def get_motor_status(self):
+        reply = await self._send_query_runze(
+            self.device.codes.CommonCmd.GetMotorStatus)
+        return reply.parameter
+
+    async def is_busy(self):
+        if super().is_busy():
+            return True
+        return await self.get_motor_status() == ReplyStatus.MotorBusy
+
+    async def force_stop(self):
+        """Halt the rotor. (It may stop between ports.)"""
+        self.device._position = None
+        await self._send_common_cmd_runze(
+            self.device.codes.CommonCmd.ForceStop, force=True)
+
+    async def halt(self):
+        return await self.force_stop()
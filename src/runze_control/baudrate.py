@@ -0,0 +1,191 @@
+"""Move devices to a faster baud rate and back."""
+from contextlib import contextmanager
+from runze_control.protocol import Protocol
+from runze_control.registry import DeviceRegistry
+from runze_control.runze_device import RunzeDevice
+from serial import SerialException
+from statistics import median
+from time import perf_counter, sleep
+from typing import Iterable, List, NamedTuple, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+INTERFACES = ("RS232", "RS485")
+SETTLE_TIME_S = 0.01  # Time for devices to switch rates after replying.
+VERIFY_QUERY_COUNT = 3  # Queries per device that must succeed at a new rate.
+
+
+class BaudrateUpgrade(NamedTuple):
+    old_baudrate: int
+    new_baudrate: int  # Equal to old_baudrate if no faster rate verified.
+    round_trip_before_s: float  # Median query round trip at each rate.
+    round_trip_after_s: float
+
+
+def upgrade_baudrate(devices: Union[RunzeDevice, Iterable[RunzeDevice]],
+                     baudrates: Iterable[int] = None,
+                     interface: str = "RS232",
+                     registry: DeviceRegistry = None,
+                     benchmark_count: int = 20) -> BaudrateUpgrade:
+    """Move a device (or every device on a bus) to the fastest baud rate that
+    verifies cleanly.
+
+    Faster rates are tried from the fastest down. For each, every device is
+    told to switch, the bus follows, and every device must then answer
+    `VERIFY_QUERY_COUNT` queries with its own address and the new rate.
+    If any device fails, all of them are rolled back to the old rate before
+    the next rate is tried.
+
+    .. code-block:: python
+
+        result = upgrade_baudrate([pump_a, pump_b], registry=registry)
+        print(f"{result.old_baudrate} -> {result.new_baudrate}[bps]: "
+              f"{result.round_trip_before_s * 1e3:.1f} -> "
+              f"{result.round_trip_after_s * 1e3:.1f}[ms] per query")
+
+    :param devices: a device, or every device on one bus. Devices on the bus
+        that are left out keep the old rate and will be unreachable.
+    :param baudrates: rates to consider. Defaults to every valid Runze
+        Protocol rate faster than the current one.
+    :param interface: "RS232" or "RS485": which of the device's interfaces
+        to set the rate of (the one the bus is connected through).
+    :param registry: if given, record each device's new settings in it.
+    :param benchmark_count: queries per device to time the round trip with
+        before and after. 0 to skip the benchmark.
+    :raises SerialException: if a device can't be reached at the old rate
+        after a rollback.
+    """
+    devices = [devices] if isinstance(devices, RunzeDevice) else list(devices)
+    if not devices:
+        raise ValueError("No devices specified.")
+    bus = devices[0].bus
+    if any(d.bus is not bus for d in devices):
+        raise ValueError("Devices must share one bus.")
+    if any(d.protocol != Protocol.RUNZE for d in devices):
+        raise NotImplementedError("Baud rates can only be changed over Runze "
+                                  "protocol.")
+    if interface not in INTERFACES:
+        raise ValueError(f"Interface ({interface}) must be one of: "
+                         f"{list(INTERFACES)}.")
+    old_baudrate = bus.baudrate
+    if baudrates is None:
+        baudrates = RunzeDevice.VALID_BAUDRATES[Protocol.RUNZE]
+    candidates = sorted((b for b in baudrates if b > old_baudrate),
+                        reverse=True)
+    before_s = measure_round_trip_s(devices, benchmark_count)
+    new_baudrate = old_baudrate
+    with _short_timeouts(devices):
+        for baudrate in candidates:
+            logger.info(f"Trying {baudrate}[bps] on {bus.com_port}.")
+            if _switch(devices, interface, baudrate) \
+                    and _verify(devices, interface, baudrate):
+                new_baudrate = baudrate
+                break
+            logger.warning(f"{baudrate}[bps] failed to verify on "
+                           f"{bus.com_port}. Rolling back to "
+                           f"{old_baudrate}[bps].")
+            _roll_back(devices, interface, baudrate, old_baudrate)
+    after_s = before_s if new_baudrate == old_baudrate \
+        else measure_round_trip_s(devices, benchmark_count)
+    if registry is not None:
+        for device in devices:
+            registry.record(device)
+    return BaudrateUpgrade(old_baudrate, new_baudrate, before_s, after_s)
+
+
+def measure_round_trip_s(devices: List[RunzeDevice], count: int = 20):
+    """Return the median round trip [s] of `count` address queries per
+    device (or None if `count` is 0)."""
+    if count <= 0:
+        return None
+    round_trips_s = []
+    for _ in range(count):
+        for device in devices:
+            start_s = perf_counter()
+            device.get_address()
+            round_trips_s.append(perf_counter() - start_s)
+    return median(round_trips_s)
+
+
+@contextmanager
+def _short_timeouts(devices: List[RunzeDevice]):
+    """Fail fast on devices that don't answer (instead of waiting out the
+    timeout long moves need)."""
+    timeouts_s = [d._timeout_s for d in devices]
+    for device in devices:
+        device._timeout_s = RunzeDevice.DEFAULT_TIMEOUT_S
+    try:
+        yield
+    finally:
+        for device, timeout_s in zip(devices, timeouts_s):
+            device._timeout_s = timeout_s
+
+
+def _set_baudrate(device: RunzeDevice, interface: str, baudrate: int):
+    if interface == "RS232":
+        device.set_rs232_baudrate(baudrate)
+    else:
+        device.set_rs485_baudrate(baudrate)
+
+
+def _get_baudrate(device: RunzeDevice, interface: str):
+    if interface == "RS232":
+        return device.get_rs232_baudrate()
+    return device.get_rs485_baudrate()
+
+
+def _switch(devices: List[RunzeDevice], interface: str, baudrate: int):
+    """Tell every device to switch rates, then switch the bus. Return False
+    if a device rejected the rate (the bus switches regardless, so rollback
+    can reach the devices that accepted it)."""
+    accepted = True
+    for device in devices:
+        try:
+            _set_baudrate(device, interface, baudrate)
+        except (SerialException, RuntimeError) as e:
+            device.cmd_send_time_s = None
+            logger.warning(f"Device 0x{device.address:02x} did not accept "
+                           f"{baudrate}[bps]: {e}")
+            accepted = False
+            break
+    sleep(SETTLE_TIME_S)
+    devices[0].bus.baudrate = baudrate
+    devices[0].bus.reset_buffers()
+    return accepted
+
+
+def _verify(devices: List[RunzeDevice], interface: str, baudrate: int):
+    """True if every device answers queries correctly at `baudrate`."""
+    for device in devices:
+        try:
+            for _ in range(VERIFY_QUERY_COUNT):
+                if device.get_address() != device.address:
+                    return False
+            if _get_baudrate(device, interface) != baudrate:
+                return False
+        except (SerialException, RuntimeError) as e:
+            device.cmd_send_time_s = None
+            logger.debug(f"Device 0x{device.address:02x} failed to verify at "
+                         f"{baudrate}[bps]: {e}")
+            return False
+    return True
+
+
+def _roll_back(devices: List[RunzeDevice], interface: str, baudrate: int,
+               old_baudrate: int):
+    """Return every device (and the bus) to `old_baudrate`."""
+    bus = devices[0].bus
+    # Devices that switched are listening at the new rate.
+    for device in devices:
+        try:
+            _set_baudrate(device, interface, old_baudrate)
+        except (SerialException, RuntimeError):
+            device.cmd_send_time_s = None  # Didn't switch (or can't hear us).
+    sleep(SETTLE_TIME_S)
+    bus.baudrate = old_baudrate
+    bus.reset_buffers()
+    if not _verify(devices, interface, old_baudrate):
+        raise SerialException(f"Could not restore {old_baudrate}[bps] on "
+                              f"{bus.com_port}. Devices may be left at "
+                              f"{baudrate}[bps].")
@@ -0,0 +1,293 @@
+"""Record a port's frames to a binary capture file, read them back, and
+replay them into the driver.
+
+File layout (all little-endian)::
+
+    header: magic (8 bytes, b"RUNZECAP"), version (uint16),
+            capture start time (float64, seconds since the epoch)
+    record: time since capture start [s] (float64), direction (uint8,
+            TX = host to device, RX = device to host, STRAY = device to
+            host bytes that didn't frame into a reply), address (uint8),
+            frame length (uint16), frame bytes
+
+Records are appended as frames cross the bus, so a capture that was cut
+short (i.e: by a crash) is still readable up to its last complete record.
+"""
+from runze_control.trace import RX, STRAY, TX
+from struct import Struct
+from threading import Condition, Event, Lock, Thread
+from time import perf_counter, time
+from typing import NamedTuple, Union
+from pathlib import Path
+import heapq
+import logging
+import mmap
+
+HEADER = Struct("<8sHd")
+RECORD = Struct("<dBBH")
+MAGIC = b"RUNZECAP"
+VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+class CapturedFrame(NamedTuple):
+    time_s: float  # Time since the start of the capture.
+    direction: int  # TX, RX or STRAY.
+    address: int
+    data: bytes
+
+
+class CaptureWriter:
+    """Appends frames to a capture file.
+
+    Writes are buffered. A background thread flushes the buffer to disk
+    within `flush_interval_s` of any write, so the frames leading up to a
+    stall are on disk even if no frame follows them. The buffer is also
+    flushed on close.
+    """
+
+    def __init__(self, path: Union[str, Path], flush_interval_s: float = 1.0):
+        self.path = Path(path)
+        self.flush_interval_s = flush_interval_s
+        self._lock = Lock()
+        self._file = open(self.path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, time()))
+        self._start_time_s = perf_counter()
+        self._unflushed = False  # True if written to since the last flush.
+        self._closed = Event()
+        self.frame_count = 0
+        self._flusher = Thread(target=self._run, daemon=True,
+                               name="CaptureWriter")
+        self._flusher.start()
+
+    def write_frame(self, direction: int, frame: bytes):
+        """Append one frame (or STRAY bytes), timestamped now."""
+        now_s = perf_counter()
+        address = frame[1] if len(frame) > 1 and direction != STRAY else 0
+        with self._lock:
+            self._file.write(RECORD.pack(now_s - self._start_time_s, direction,
+                                         address, len(frame)))
+            self._file.write(frame)
+            self.frame_count += 1
+            self._unflushed = True
+
+    def flush(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            self._unflushed = False
+
+    def close(self):
+        self._closed.set()
+        self._flusher.join()
+        with self._lock:
+            self._file.close()
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval_s):
+            if self._unflushed:
+                self.flush()
+
+
+class CaptureReader:
+    """Memory-mapped reader of a capture file.
+
+    Frames are decoded one at a time as they are iterated over, so captures
+    much larger than RAM can be scanned.
+
+    .. code-block:: python
+
+        with CaptureReader("overnight.rzcap") as capture:
+            for frame in capture.frames(address=0x03, direction=RX):
+                ...
+
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError as e:  # Empty file.
+            self._file.close()
+            raise ValueError(f"{self.path} is not a capture file.") from e
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{self.path} is not a capture file.")
+        magic, version, self.start_time_s = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a capture file.")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Capture file version ({version}) is not "
+                             f"supported.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __iter__(self):
+        buffer = self._map
+        end = len(buffer)
+        offset = HEADER.size
+        unpack_from = RECORD.unpack_from
+        while offset + RECORD.size <= end:
+            time_s, direction, address, length = unpack_from(buffer, offset)
+            offset += RECORD.size
+            if offset + length > end:  # Truncated last record.
+                return
+            yield CapturedFrame(time_s, direction, address,
+                                buffer[offset:offset + length])
+            offset += length
+
+    def frames(self, direction: int = None, address: int = None,
+               start_s: float = None, end_s: float = None):
+        """Iterate over the frames that match every filter specified.
+
+        :param direction: TX, RX or STRAY.
+        :param address: device address.
+        :param start_s: earliest time since the start of the capture.
+        :param end_s: latest time since the start of the capture.
+        """
+        for frame in self:
+            if end_s is not None and frame.time_s > end_s:
+                return  # Records are in time order.
+            if (direction is not None and frame.direction != direction) \
+                    or (address is not None and frame.address != address) \
+                    or (start_s is not None and frame.time_s < start_s):
+                continue
+            yield frame
+
+
+class CaptureReplay:
+    """Stands in for the devices in a capture.
+
+    Each frame the host writes is matched to the next TX frame in the
+    capture, and the RX frames (and STRAY bytes) that followed it are sent
+    back after the same delays (divided by `speed`). Run the driver against it through
+    :meth:`serial`:
+
+    .. code-block:: python
+
+        replay = CaptureReplay("overnight.rzcap", speed=10)
+        pump = SY08(replay.serial(), address=0x00, syringe_volume_ul=25000)
+
+    """
+
+    def __init__(self, path: Union[str, Path], speed: float = 1.0,
+                 strict: bool = False):
+        """Init.
+
+        :param path: capture file to replay.
+        :param speed: playback speed. 1 for the original timing, higher to
+            play back faster.
+        :param strict: if True, raise a ValueError when the host writes a
+            frame that differs from the one captured. Otherwise, log it.
+        """
+        if speed <= 0:
+            raise ValueError(f"Playback speed ({speed}) must be positive.")
+        self.speed = speed
+        self.strict = strict
+        self.mismatch_count = 0  # Frames written that differ from capture.
+        self._reader = CaptureReader(path)
+        self._frames = iter(self._reader)
+        self._next_frame = next(self._frames, None)
+        self._cond = Condition()
+        self._outbox = []  # heap of (due time, sequence number, frame)
+        self._sequence = 0
+        self._sink = None
+        self._closed = False
+        self._worker = None
+
+    def serial(self, baudrate: int = 9600):
+        """Return a Serial-like port connected to the replay."""
+        from runze_control.emulator import EmulatedSerial
+        return EmulatedSerial(self, baudrate)
+
+    @property
+    def done(self):
+        """True once every captured frame has been replayed."""
+        with self._cond:
+            return self._next_frame is None and not self._outbox
+
+    def receive(self, data: bytes, baudrate: int):
+        """Accept a frame written by the host and schedule the replies that
+        followed it in the capture."""
+        now_s = perf_counter()
+        with self._cond:
+            # Skip to the next frame the host sent in the capture.
+            while self._next_frame is not None \
+                    and self._next_frame.direction != TX:
+                self._next_frame = next(self._frames, None)
+            sent = self._next_frame
+            if sent is None:
+                logger.warning(f"Capture exhausted. Ignoring frame: "
+                               f"{data.hex(' ')}.")
+                return
+            if sent.data != data:
+                self.mismatch_count += 1
+                msg = (f"Frame written ({data.hex(' ')}) differs from the "
+                       f"one captured ({sent.data.hex(' ')}).")
+                if self.strict:
+                    raise ValueError(msg)
+                logger.warning(msg)
+            self._next_frame = next(self._frames, None)
+            while self._next_frame is not None \
+                    and self._next_frame.direction in (RX, STRAY):
+                reply = self._next_frame
+                due_s = now_s + (reply.time_s - sent.time_s) / self.speed
+                heapq.heappush(self._outbox, (due_s, self._sequence,
+                                              reply.data))
+                self._sequence += 1
+                self._next_frame = next(self._frames, None)
+            self._cond.notify_all()
+
+    def attach(self, sink):
+        """Deliver replayed bytes to `sink(data)`."""
+        with self._cond:
+            self._sink = sink
+            if self._worker is None:
+                self._worker = Thread(target=self._run, daemon=True,
+                                      name="CaptureReplay")
+                self._worker.start()
+
+    def detach(self, sink):
+        with self._cond:
+            if self._sink == sink:
+                self._sink = None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+        self._frames = iter(())
+        self._reader.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if not self._outbox:
+                    self._cond.wait()
+                    continue
+                wait_s = self._outbox[0][0] - perf_counter()
+                if wait_s > 0:
+                    self._cond.wait(wait_s)
+                    continue
+                _, _, data = heapq.heappop(self._outbox)
+                sink = self._sink
+            if sink is not None:
+                sink(data)
@@ -0,0 +1,90 @@
+"""Per-device queue of pipelined commands."""
+from concurrent.futures import Future
+from queue import SimpleQueue
+from threading import Lock, Thread
+import logging
+
+
+class CommandQueue:
+    """Executes queued device calls back-to-back on a worker thread.
+
+    Each submitted call returns a :class:`~concurrent.futures.Future` that
+    resolves to the call's return value once the device replies. The next
+    queued call is issued as soon as the previous reply lands, so the gap
+    between back-to-back moves does not depend on how quickly the caller
+    wakes up.
+
+    If a call raises, its future holds the exception, and every call still
+    queued behind it is cancelled rather than run against a device in an
+    unknown state.
+    """
+
+    _SHUTDOWN = object()  # Sentinel to stop the worker.
+
+    def __init__(self, name: str = None):
+        self.log = logging.getLogger(f"{self.__class__.__name__}.{name}")
+        self._name = name
+        self._queue = SimpleQueue()
+        self._lock = Lock()
+        self._worker = None
+        self._closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` and return a Future for its result."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a closed command queue.")
+            self._queue.put((future, fn, args, kwargs))
+            if self._worker is None:
+                self._worker = Thread(target=self._run, daemon=True,
+                                      name=f"CommandQueue-{self._name}")
+                self._worker.start()
+        return future
+
+    def cancel_pending(self):
+        """Cancel every queued call that has not started yet.
+        Return the number of calls cancelled."""
+        cancelled = 0
+        pending = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is self._SHUTDOWN:
+                pending.append(item)
+                continue
+            item[0].cancel()
+            cancelled += 1
+        for item in pending:
+            self._queue.put(item)
+        return cancelled
+
+    def close(self, wait: bool = True):
+        """Stop accepting calls. Let queued calls finish, then stop the
+        worker."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            worker = self._worker
+            self._queue.put(self._SHUTDOWN)
+        if wait and worker is not None:
+            worker.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._SHUTDOWN:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                cancelled = self.cancel_pending()
+                if cancelled:
+                    self.log.error(f"Queued command failed ({e!r}). "
+                                   f"Cancelled {cancelled} pending command(s).")
+                continue
+            future.set_result(result)
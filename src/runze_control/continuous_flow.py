@@ -0,0 +1,323 @@
+"""Uninterrupted flow from two alternating syringe pumps."""
+from runze_control.rotary_valve import rotation_table
+from runze_control.syringe_pump import SyringePump
+from threading import Event, Thread
+from time import perf_counter, sleep
+from typing import Sequence, Union
+import logging
+
+
+class ContinuousFlow:
+    """Two syringe pumps that take turns dispensing, so one refills while
+    the other delivers, and flow never stops for a refill.
+
+    .. code-block:: python
+
+        flow = ContinuousFlow(pump_a, pump_b, flow_rate_ul_per_min=500)
+        flow.start()
+        ...  # Hours later.
+        flow.stop()
+        print(flow.dispensed_ul)
+
+    Each pump dispenses a stroke with an absolute move to 0 (issued without
+    waiting). The standby pump's stroke is issued `handoff_overlap_s`
+    before the active pump is predicted to finish (per its
+    :class:`~runze_control.motion_model.MotionModel`, which learns from
+    every completed stroke), so the command latency is hidden inside a
+    short overlap rather than showing up as a gap.
+
+    Between strokes, each pump's position is read back. Volume lost to
+    missed steps or speed rounding (or gained) is made up by starting the
+    next stroke a little early (or late), so the delivered volume tracks
+    ``flow_rate * elapsed time``. (Speed is set in whole rpm, often too
+    coarse to make up drift by itself. It is adjusted only for drift that
+    timing can't make up.)
+
+    If the pumps draw from and deliver to the same lines through check
+    valves, no valves need to be specified. Otherwise, pass one rotary
+    valve per pump with the ports that connect its syringe to the reservoir
+    and to the output.
+    """
+
+    HANDOFF_OVERLAP_S = 0.02  # Default time both pumps dispense at once.
+    COMMAND_ALLOWANCE_S = 0.02  # Round trip allowed per command that a
+                                # device's metrics haven't measured yet
+                                # (about one query at 9600[bps]).
+    MAX_RATE_CORRECTION = 0.1  # Max fraction of a stroke's duration by
+                               # which drift correction moves its start
+                               # (and of its flow rate by which it changes
+                               # its speed).
+
+    def __init__(self, pump_a: SyringePump, pump_b: SyringePump,
+                 flow_rate_ul_per_min: float, stroke_ul: float = None,
+                 valves: Sequence = None,
+                 refill_port: Union[str, int] = None,
+                 dispense_port: Union[str, int] = None,
+                 handoff_overlap_s: float = None,
+                 refill_speed_percent: float = None):
+        """Init.
+
+        :param pump_a: first pump. Dispenses first.
+        :param pump_b: second pump.
+        :param flow_rate_ul_per_min: target flow rate.
+        :param stroke_ul: volume per stroke. Defaults to the smaller
+            syringe's volume. Longer strokes mean fewer handoffs.
+        :param valves: a valve (with a ``move_to_position(port)`` method)
+            per pump, or None if the pumps are plumbed through check
+            valves.
+        :param refill_port: valve port that connects a syringe to the
+            reservoir.
+        :param dispense_port: valve port that connects a syringe to the
+            output.
+        :param handoff_overlap_s: time both pumps dispense at once at each
+            handoff. Defaults to `HANDOFF_OVERLAP_S`.
+        :param refill_speed_percent: plunger speed to refill at. Defaults to
+            each pump's `MAX_ASPIRATE_SPEED_PERCENT`.
+        :raises ValueError: if a pump can't refill (including the commands
+            and valve moves around the refill) within one stroke of the
+            other at this flow rate.
+        """
+        self.pumps = (pump_a, pump_b)
+        if any(p.syringe_volume_ul is None for p in self.pumps):
+            raise ValueError("Syringe volume must be specified for both "
+                             "pumps.")
+        if valves is not None and len(valves) != 2:
+            raise ValueError("Specify one valve per pump.")
+        self.valves = valves
+        self.refill_port = refill_port
+        self.dispense_port = dispense_port
+        self.flow_rate_ul_per_min = flow_rate_ul_per_min
+        self.handoff_overlap_s = self.__class__.HANDOFF_OVERLAP_S \
+            if handoff_overlap_s is None else handoff_overlap_s
+        self.refill_speed_percent = [
+            p.MAX_ASPIRATE_SPEED_PERCENT if refill_speed_percent is None
+            else refill_speed_percent for p in self.pumps]
+        if stroke_ul is None:
+            stroke_ul = min(p.syringe_volume_ul for p in self.pumps)
+        self.stroke_ul = stroke_ul
+        self._stroke_steps = [round(stroke_ul * p.max_position_steps
+                                    / p.syringe_volume_ul)
+                              for p in self.pumps]
+        if any(not 0 < steps <= p.max_position_steps
+               for steps, p in zip(self._stroke_steps, self.pumps)):
+            raise ValueError(f"Stroke volume ({stroke_ul} [uL]) must fit in "
+                             "both syringes.")
+        self._check_refill_time()
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.dispensed_ul = 0  # Volume delivered by completed strokes.
+        self.stroke_count = 0
+        self.start_time_s = None
+        self._behind_ul = 0  # Target volume minus volume delivered as of
+                             # the last completed stroke.
+        self._behind_time_s = None  # Time the last completed stroke ended.
+        self._stop = Event()
+        self._thread = None
+        self.error = None  # Exception that stopped the flow, if any.
+
+    def _stroke_duration_s(self, pump: SyringePump, steps: int,
+                           speed_percent: float):
+        speed_rpm = max(1, round(speed_percent * pump.max_speed_rpm / 100.0))
+        return pump.motion.duration_s(steps, speed_rpm)
+
+    def _check_refill_time(self):
+        for index, pump in enumerate(self.pumps):
+            other = self.pumps[1 - index]
+            dispense_s = self._stroke_duration_s(
+                other, self._stroke_steps[1 - index],
+                other._flow_rate_to_speed_percent(self.flow_rate_ul_per_min))
+            refill_s = self._stroke_duration_s(
+                pump, self._stroke_steps[index],
+                self.refill_speed_percent[index])
+            # Between strokes, the pump also reads its position twice and
+            # sets its speed twice, and its valve (if any) turns twice.
+            refill_s += 5 * self._command_overhead_s(
+                pump, ("GetSyringePosition", "SetDynamicSpeed"))
+            if self.valves is not None:
+                refill_s += 2 * self._valve_move_s(self.valves[index])
+            # Drift correction may start the next stroke a little early.
+            window_s = dispense_s * (1 - self.__class__.MAX_RATE_CORRECTION) \
+                - self.handoff_overlap_s
+            if refill_s >= window_s:
+                raise ValueError(f"Pumps cannot refill ({refill_s:.2f}[s]) "
+                                 f"within a stroke ({dispense_s:.2f}[s]) at "
+                                 f"{self.flow_rate_ul_per_min} [uL/min]. "
+                                 f"Lower the flow rate or lengthen strokes.")
+
+    def _command_overhead_s(self, device, cmd_names: Sequence[str]):
+        """Slowest round trip [s] that `device`'s metrics measured for any of
+        the commands `cmd_names`, or `COMMAND_ALLOWANCE_S` if none were
+        measured."""
+        overhead_s = None
+        metrics = getattr(device, "metrics", None)
+        codes = getattr(device, "codes", None)
+        for name in cmd_names:
+            try:
+                stats = metrics.commands.get(int(codes.CommonCmd[name]))
+            except (AttributeError, KeyError):
+                continue
+            p99_s = None if stats is None \
+                else stats.reply_latency.percentile(99)
+            if p99_s is not None:
+                overhead_s = max(overhead_s or 0, p99_s)
+        return self.__class__.COMMAND_ALLOWANCE_S if overhead_s is None \
+            else overhead_s
+
+    def _valve_move_s(self, valve):
+        """Estimated time [s] for `valve` to turn between the refill and
+        dispense ports."""
+        if self.refill_port is None and self.dispense_port is None:
+            return 0
+        move_s = self._command_overhead_s(valve, ("GetCurrentChannelAddress",))
+        if self.refill_port is None or self.dispense_port is None \
+                or not hasattr(valve, "_to_port"):
+            return move_s
+        ports = [valve._to_port(p)
+                 for p in (self.refill_port, self.dispense_port)]
+        position_count = getattr(valve, "position_count", None)
+        if position_count is None:  # Assume it doesn't wrap around.
+            travel_ports = abs(ports[0] - ports[1])
+        else:
+            travel_ports = \
+                rotation_table(position_count)[ports[0]][ports[1]].ports
+        return move_s + travel_ports * getattr(valve, "SECONDS_PER_PORT", 0)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Fill both syringes and start flowing (on a background thread)."""
+        if self.running:
+            raise RuntimeError("Continuous flow is already running.")
+        self._stop.clear()
+        self.error = None
+        self._thread = Thread(target=self._run, daemon=True,
+                              name=self.__class__.__name__)
+        self._thread.start()
+
+    def stop(self, wait: bool = True):
+        """Stop after the stroke underway. If `wait`, block until it ends.
+
+        :raises: the exception that stopped the flow early, if any.
+        """
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self, duration_s: float):
+        """Flow for `duration_s`, then stop. (Blocks.)"""
+        self.start()
+        self._stop.wait(duration_s)
+        self.stop()
+
+    def _move_valve(self, index: int, port):
+        if self.valves is not None and port is not None:
+            self.valves[index].move_to_position(port)
+
+    def _refill(self, index: int):
+        """Fill a pump for its next stroke. Return its position [steps]."""
+        pump = self.pumps[index]
+        self._move_valve(index, self.refill_port)
+        pump.set_speed_percent(self.refill_speed_percent[index])
+        pump.move_absolute_in_steps(self._stroke_steps[index])
+        position_steps = pump.get_position_steps()  # Correct for drift.
+        self._move_valve(index, self.dispense_port)
+        return position_steps
+
+    def _run(self):
+        try:
+            self._flow()
+        except Exception as e:
+            self.error = e
+            self.log.error(f"Continuous flow stopped: {e!r}")
+            for pump in self.pumps:
+                if pump.cmd_send_time_s is not None:
+                    pump.force_stop()
+
+    def _flow(self):
+        start_steps = [self._refill(0), self._refill(1)]
+        active = 0
+        pump = self.pumps[active]
+        pump.set_speed_percent(pump._flow_rate_to_speed_percent(
+            self.flow_rate_ul_per_min))
+        self.start_time_s = perf_counter()
+        self._behind_time_s = self.start_time_s
+        pump.move_absolute_in_steps(0, wait=False)
+        while True:
+            standby = 1 - active
+            pump, next_pump = self.pumps[active], self.pumps[standby]
+            if self._stop.is_set():
+                pump.wait_for_reply()
+                self._finish_stroke(active, start_steps[active])
+                return
+            # Hand off just before the active stroke is predicted to end,
+            # moved earlier (or later) to make up for drift.
+            end_time_s = pump.motion.end_time_s
+            if end_time_s is None:  # The stroke already ended.
+                end_time_s = perf_counter()
+            speed_percent, drift_lead_s = self._drift_correction(
+                end_time_s, pump._steps_to_ul(start_steps[active]),
+                standby, start_steps[standby])
+            next_pump.set_speed_percent(speed_percent)
+            lead_s = self.handoff_overlap_s + drift_lead_s
+            handoff_s = end_time_s - lead_s
+            sleep(max(0, handoff_s - perf_counter()))
+            if lead_s > 0 \
+                    and (pump.cmd_send_time_s is None or not pump.is_busy()):
+                self.log.warning(f"Stroke ended before handoff. Flow paused "
+                                 f"for up to "
+                                 f"{perf_counter() - handoff_s:.3f}[s].")
+            next_pump.move_absolute_in_steps(0, wait=False)
+            if pump.cmd_send_time_s is not None:
+                pump.wait_for_reply()
+            self._finish_stroke(active, start_steps[active])
+            start_steps[active] = self._refill(active)
+            if not next_pump.is_busy():
+                self.log.warning("Refill finished after the next stroke "
+                                 "ended. Flow paused.")
+            active = standby
+
+    def _finish_stroke(self, index: int, start_steps: int):
+        """Account for a completed stroke from the pump's actual position."""
+        pump = self.pumps[index]
+        _, end_time_s = pump.bus.reply_times[pump.address]
+        end_steps = pump.get_position_steps()
+        self.dispensed_ul += pump._steps_to_ul(start_steps - end_steps)
+        self.stroke_count += 1
+        self._behind_ul = self.flow_rate_ul_per_min \
+            * (end_time_s - self.start_time_s) / 60.0 - self.dispensed_ul
+        self._behind_time_s = end_time_s
+
+    def _drift_correction(self, end_time_s: float, stroke_ul: float,
+                          index: int, start_steps: int):
+        """Return the speed [%] for pump `index`'s next stroke and how long
+        [s] before the active stroke's end to start it (negative: after), so
+        that the next stroke ends with the delivered volume on target.
+
+        :param end_time_s: predicted end of the active stroke.
+        :param stroke_ul: volume of the active stroke.
+        :param index: pump to dispense next.
+        :param start_steps: its position before the stroke.
+        """
+        pump = self.pumps[index]
+        flow_rate = self.flow_rate_ul_per_min
+        bound = self.__class__.MAX_RATE_CORRECTION
+        speed_percent = pump._flow_rate_to_speed_percent(flow_rate)
+        next_stroke_ul = pump._steps_to_ul(start_steps)
+        next_stroke_s = self._stroke_duration_s(pump, start_steps,
+                                                speed_percent)
+        # Volume behind the target by the end of the next stroke if it
+        # started right as the active one ends.
+        behind_ul = self._behind_ul - stroke_ul - next_stroke_ul + flow_rate \
+            * (end_time_s + next_stroke_s - self._behind_time_s) / 60.0
+        bound_s = bound * next_stroke_s
+        lead_s = min(bound_s, max(-bound_s, behind_ul / flow_rate * 60.0))
+        # Make up what timing can't by speed.
+        correction = (behind_ul - flow_rate * lead_s / 60.0) / next_stroke_ul
+        if correction:
+            correction = min(bound, max(-bound, correction))
+            speed_percent = pump._flow_rate_to_speed_percent(
+                flow_rate * (1 + correction))
+        return speed_percent, lead_s
@@ -0,0 +1,177 @@
+"""Send one command to several devices at once via a multicast address."""
+from runze_control.runze_device import RunzeDevice
+from runze_control import runze_protocol
+from serial import SerialException
+from time import perf_counter, sleep
+from typing import Sequence
+import logging
+
+
+class DeviceGroup:
+    """Devices on one bus that share a multicast address.
+
+    A command sent to the group is a single frame, so every member starts
+    acting on it at the same moment, rather than one serial round trip
+    after the previous member.
+
+    .. code-block:: python
+
+        group = DeviceGroup([pump_a, pump_b, pump_c], multicast_address=0x80)
+        group.configure(multicast_channel=1)  # Once. Persists on the devices.
+        group.dispense_steps(1200)
+        group.wait()
+
+    **Replies:** members do not reply to group frames (several devices
+    answering at once would collide on the bus). Group commands therefore
+    return immediately, and :meth:`wait` confirms completion by querying
+    each member's motor status. Any frame that does come back from the
+    multicast address is discarded.
+    """
+
+    POLL_INTERVAL_S = 0.05  # Time between motor status checks in wait().
+
+    def __init__(self, devices: Sequence[RunzeDevice], multicast_address: int):
+        """Init.
+
+        :param devices: members of the group. They must share a bus.
+        :param multicast_address: address that the members listen on
+            (in addition to their own).
+        """
+        if not devices:
+            raise ValueError("A device group needs at least one device.")
+        self.devices = list(devices)
+        self.bus = self.devices[0].bus
+        if any(d.bus is not self.bus for d in self.devices):
+            raise ValueError("All devices in a group must share a bus.")
+        member_addresses = {d.address for d in self.devices}
+        if multicast_address in member_addresses:
+            raise ValueError(f"Multicast address (0x{multicast_address:02x}) "
+                             "collides with a member's own address.")
+        self.multicast_address = multicast_address
+        self.send_time_s = None  # Time the last group command was sent.
+        self.log = logging.getLogger(f"{self.__class__.__name__}."
+                                     f"{self.bus.com_port}."
+                                     f"0x{multicast_address:02x}")
+
+    def configure(self, multicast_channel: int = 1):
+        """Assign the group's multicast address to a multicast channel on
+        every member."""
+        for device in self.devices:
+            device.set_multicast_address(multicast_channel,
+                                         self.multicast_address)
+
+    def send_common_cmd(self, cmd_name: str, param_value: int = 0):
+        """Send one common command frame to every member at once.
+
+        :param cmd_name: name of the command in the members' codes (i.e:
+            ``"RunInCW"``). Every member must map it to the same code.
+        :param param_value: command parameter.
+        """
+        func = self._common_code(cmd_name)
+        for device in self.devices:
+            if device.cmd_send_time_s is not None:
+                raise RuntimeError(f"Cannot issue a group command while "
+                                   f"device 0x{device.address:02x} is waiting "
+                                   "on a reply.")
+        packet = runze_protocol.encode_common_frame_into(
+            bytearray(runze_protocol.COMMON_FRAME.size),
+            self.multicast_address, func, param_value)
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Sending (hex): %s", packet.hex(' '))
+        self.bus.write(packet)
+        self.send_time_s = perf_counter()
+
+    def dispense_steps(self, steps: int):
+        """Relative plunger move on every member (syringe pumps whose
+        RunInCW/RunInCCW commands move the plunger, i.e: not SY01B)."""
+        self._check_run_cmds_move_plunger()
+        self.send_common_cmd("RunInCW", steps)
+        for device in self.devices:
+            device._predict_move(steps)
+            device.driver_steps -= steps
+
+    def aspirate_steps(self, steps: int):
+        """Relative plunger move on every member (syringe pumps whose
+        RunInCW/RunInCCW commands move the plunger, i.e: not SY01B)."""
+        self._check_run_cmds_move_plunger()
+        self.send_common_cmd("RunInCCW", steps)
+        for device in self.devices:
+            device._predict_move(steps)
+            device.driver_steps += steps
+
+    def withdraw_steps(self, steps: int):
+        return self.aspirate_steps(steps)
+
+    def move_absolute_in_steps(self, steps: int):
+        """Absolute plunger move on every member (syringe pumps with a native
+        absolute move command, i.e: SY08)."""
+        for device in self.devices:
+            if (steps > device.max_position_steps) or (steps < 0):
+                raise ValueError(f"Requested plunger movement ({steps}) is "
+                                 f"out of range [0 - {device.max_position_steps}].")
+        self.send_common_cmd("MoveSyringeAbsolute", steps)
+        for device in self.devices:
+            device._predict_move(steps - device.driver_steps)
+            device.driver_steps = steps
+
+    def force_stop(self):
+        """Halt every member."""
+        self.send_common_cmd("ForceStop")
+        for device in self.devices:
+            device.motion.cancel()
+
+    def is_busy(self):
+        """True if any member's motor is still running. (Members whose move
+        is predicted to still be underway are not queried.)"""
+        self._discard_replies()
+        return any(d.is_busy() for d in self.devices)
+
+    def wait(self, timeout_s: float = RunzeDevice.LONG_TIMEOUT_S):
+        """Block until every member's motor has stopped.
+
+        Sleeps until the last member's move is predicted to end before
+        querying anyone, so a group move costs about one status query per
+        member.
+        """
+        deadline_s = perf_counter() + timeout_s
+        pending = list(self.devices)
+        end_times_s = [d.motion.end_time_s for d in pending
+                       if getattr(d, "motion", None) is not None
+                       and d.motion.end_time_s is not None]
+        if end_times_s:
+            sleep(max(0, min(max(end_times_s), deadline_s) - perf_counter()))
+        while True:
+            self._discard_replies()
+            pending = [d for d in pending if d.is_busy()]
+            if not pending:
+                return
+            if perf_counter() >= deadline_s:
+                raise SerialException(
+                    f"Timed out waiting on group members: "
+                    f"{[hex(d.address) for d in pending]}.")
+            sleep(self.POLL_INTERVAL_S)
+
+    def _discard_replies(self):
+        """Drop any frames that came back from the multicast address."""
+        self.bus.poll()
+        while self.bus.pop_reply(self.multicast_address) is not None:
+            self.log.debug("Discarded reply from multicast address.")
+
+    def _check_run_cmds_move_plunger(self):
+        others = [d for d in self.devices
+                  if not getattr(d, "RUN_CMDS_MOVE_PLUNGER", False)]
+        if others:
+            raise ValueError(f"RunInCW/RunInCCW don't move the plunger of "
+                             f"group members: "
+                             f"{[hex(d.address) for d in others]}.")
+
+    def _common_code(self, cmd_name: str):
+        try:
+            codes = {int(d.codes.CommonCmd[cmd_name]) for d in self.devices}
+        except KeyError as e:
+            raise ValueError(f"Command {cmd_name} is not supported by every "
+                             "group member.") from e
+        if len(codes) != 1:
+            raise ValueError(f"Group members use different codes for "
+                             f"{cmd_name}: {sorted(hex(c) for c in codes)}.")
+        return codes.pop()
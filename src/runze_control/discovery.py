@@ -0,0 +1,124 @@
+"""Discover Runze devices across serial ports."""
+from concurrent.futures import ThreadPoolExecutor
+from runze_control.protocol import Protocol
+from runze_control.protocol_codes.common_codes import CommonCmd
+from runze_control.runze_bus import RunzeBus
+from runze_control.runze_device import RunzeDevice
+from runze_control import runze_protocol
+from serial import SerialException
+from serial.tools import list_ports
+from typing import Iterable, List, NamedTuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROBE_TIMEOUT_S = 0.05  # Devices reply to queries within a few [ms].
+
+
+class DiscoveredDevice(NamedTuple):
+    port: str
+    baudrate: int
+    address: int
+    model: str  # None if the device can't report it. (Runze Protocol has no
+                # model query.)
+    firmware_version: float
+
+
+def discover(ports: Iterable[str] = None, baudrates: Iterable[int] = None,
+             addresses: Iterable[int] = None,
+             probe_timeout_s: float = DEFAULT_PROBE_TIMEOUT_S,
+             max_workers: int = None) -> List[DiscoveredDevice]:
+    """Find every Runze Protocol device on the specified ports.
+
+    Ports are scanned concurrently (one thread each). On each port, baud
+    rates are tried in turn until one of them gets a reply. Every probe waits
+    at most `probe_timeout_s`, so a port with nothing on it costs
+    ``len(baudrates) * probe_timeout_s`` rather than the 0.5[s] per baud rate
+    a device constructor spends.
+
+    :param ports: ports to scan. Defaults to every serial port on the system.
+    :param baudrates: baud rates to try. Defaults to all valid Runze Protocol
+        baud rates.
+    :param addresses: addresses to probe individually (i.e: for an RS485
+        bus with several devices). If None, one address query is sent per
+        baud rate, and the device (RS232) answers with its own address.
+    :param probe_timeout_s: how long to wait for a reply to each probe.
+    :param max_workers: max ports to scan at once. Defaults to all of them.
+    :return: one entry per device found, sorted by port then address.
+    """
+    if ports is None:
+        ports = [p.device for p in list_ports.comports()]
+    ports = list(ports)
+    if baudrates is None:
+        baudrates = RunzeDevice.VALID_BAUDRATES[Protocol.RUNZE]
+    baudrates = list(baudrates)
+    addresses = None if addresses is None else list(addresses)
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers or len(ports)) as pool:
+        results = pool.map(lambda port: discover_port(port, baudrates,
+                                                      addresses,
+                                                      probe_timeout_s),
+                           ports)
+        devices = [device for port_devices in results
+                   for device in port_devices]
+    return sorted(devices, key=lambda d: (d.port, d.address))
+
+
+def discover_port(port: str, baudrates: Iterable[int] = None,
+                  addresses: Iterable[int] = None,
+                  probe_timeout_s: float = DEFAULT_PROBE_TIMEOUT_S):
+    """Find every Runze Protocol device on one port.
+    See :func:`discover` for parameter details."""
+    if baudrates is None:
+        baudrates = RunzeDevice.VALID_BAUDRATES[Protocol.RUNZE]
+    try:
+        bus = RunzeBus(port, next(iter(baudrates)))
+    except SerialException as e:
+        logger.debug(f"Skipping {port}. Could not open it: {e}")
+        return []
+    try:
+        for baudrate in baudrates:
+            bus.baudrate = baudrate
+            bus.reset_buffers()
+            if addresses is None:  # Let the device tell us its address.
+                reply = _probe(bus, 0x00, CommonCmd.GetAddress,
+                               probe_timeout_s, any_address=True)
+                found = [] if reply is None else [reply.parameter]
+            else:
+                found = [a for a in addresses
+                         if _probe(bus, a, CommonCmd.GetAddress,
+                                   probe_timeout_s) is not None]
+            if not found:
+                continue
+            logger.debug(f"Found {len(found)} device(s) on {port} at "
+                         f"{baudrate}[bps].")
+            return [DiscoveredDevice(port, baudrate, address, None,
+                                     _get_firmware_version(bus, address,
+                                                           probe_timeout_s))
+                    for address in found]
+        return []
+    finally:
+        bus.close()
+
+
+def _probe(bus: RunzeBus, address: int, func: int, timeout_s: float,
+           any_address: bool = False):
+    """Send a parameterless query. Return the parsed reply or None if no
+    valid reply arrived in time."""
+    bus.write(runze_protocol.encode_query_frame(address, func))
+    reply = bus.get_reply(None if any_address else address, timeout_s)
+    if not reply:
+        return None
+    try:
+        return runze_protocol.parse_reply(reply)
+    except ValueError:  # The bus delivers corrupted replies too.
+        return None
+
+
+def _get_firmware_version(bus: RunzeBus, address: int, timeout_s: float):
+    reply = _probe(bus, address, CommonCmd.GetFirmwareVersion, timeout_s)
+    if reply is None:
+        return None
+    b3, b4 = reply.parameter.to_bytes(2, 'little')
+    return float(f"{b3}.{b4}")
@@ -1,5 +1,7 @@
 """Runze Fluid device codes common across devices."""
+from contextlib import contextmanager
 from enum import Enum, IntEnum
+from typing import NamedTuple
 try:
     from enum import StrEnum  # a 3.11+ feature.
 except ImportError:
@@ -12,6 +14,8 @@ class PacketFields(StrEnum):
     FRAME_START = '/'  # 0x2F
     FRAME_END = '\r'  # 0x0D
     REPLY_FRAME_END = '\r\n'
+    REPLY_ETX = '\x03'  # Ends the data field of a reply.
+    HOST_ADDRESS = '0'  # Address that replies are sent from.
 
 
 class Commands(StrEnum):
@@ -19,3 +23,191 @@ class Commands(StrEnum):
     RelativePickup = "P"    # Move relative in the withdraw direction.
     RelativeDispense = "D"  # Move relative in the dispense direction.
     InitClockwise = "Z"
+    Execute = "R"  # Run the command string (appended automatically).
+    LoopStart = "g"  # Mark the start of a repeated sequence.
+    LoopEnd = "G"  # Repeat from the last loop start [n] times (0: forever).
+    Delay = "M"  # Wait [n] milliseconds.
+    Terminate = "T"  # Stop the command string being executed.
+    ValvePort = "I"  # Move the valve to port [n] (clockwise on a valve).
+    ValvePortCounterclockwise = "O"  # Move the valve to port [n]
+                                     # counterclockwise.
+    QueryPlungerPosition = "?"
+    QueryValvePosition = "?6"
+    QueryStatus = "Q"
+    QueryFirmwareVersion = "&"
+
+
+class Status(IntEnum):
+    """Error codes in the low nibble of a reply's status byte."""
+    NoError = 0
+    InitializationError = 1
+    InvalidCommand = 2
+    InvalidOperand = 3
+    InvalidCommandSequence = 4
+    EEPROMFailure = 6
+    NotInitialized = 7
+    PlungerOverload = 9
+    ValveOverload = 10
+    PlungerMoveNotAllowed = 11
+    CommandOverflow = 15
+
+
+STATUS_READY_BIT = 0x20  # Set in the status byte when the device is idle.
+STATUS_ERROR_MASK = 0x0F
+MAX_LOOP_DEPTH = 10  # Max nesting of loops in one command string.
+
+
+class DTReply(NamedTuple):
+    """Reply to a DT Protocol command string."""
+    status: int  # Raw status byte.
+    data: str  # Reply data (i.e: a queried value). Empty if none.
+
+    @property
+    def ready(self):
+        """True if the device was idle when it replied."""
+        return bool(self.status & STATUS_READY_BIT)
+
+    @property
+    def error(self):
+        return self.status & STATUS_ERROR_MASK
+
+
+def encode_command(address: str, cmd_str: str, execute: bool = True):
+    """Encode a command string addressed to a device.
+
+    :param address: ASCII address of the device (i.e: ``'1'``).
+    :param cmd_str: one or more commands (i.e: ``"P100D100"``).
+    :param execute: append the execute command so the device runs the
+        string right away.
+    """
+    execute_cmd = Commands.Execute if execute else ""
+    return (f"{PacketFields.FRAME_START}{address}{cmd_str}{execute_cmd}"
+            f"{PacketFields.FRAME_END}").encode("ascii")
+
+
+def parse_reply(frame: bytes):
+    """Parse a complete reply frame (through the trailing CR LF).
+
+    :raises ValueError: if the frame is malformed.
+    """
+    if len(frame) < 5 or frame[0] != ord(PacketFields.FRAME_START) \
+            or not frame.endswith(PacketFields.REPLY_FRAME_END.encode()):
+        raise ValueError(f"Reply frame is malformed: {frame!r}.")
+    body = frame[3:-2]
+    etx = body.rfind(PacketFields.REPLY_ETX.encode())
+    if etx >= 0:
+        body = body[:etx]
+    return DTReply(frame[2], body.decode("ascii", errors="replace"))
+
+
+class ReplyFramer:
+    """Splits a stream of partial reads into DT reply frames, discarding
+    anything before a frame start (see
+    :class:`runze_control.runze_protocol.ReplyFramer`)."""
+
+    _START = PacketFields.FRAME_START.encode()
+    _END = PacketFields.REPLY_FRAME_END.encode()
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.resync_count = 0
+        self.discarded_bytes = 0
+        self.stray = bytearray()  # Bytes dropped by the last call to feed().
+
+    @property
+    def buffered_bytes(self):
+        return len(self._buffer)
+
+    def reset(self):
+        self._buffer.clear()
+
+    def feed(self, data: bytes):
+        """Add newly received bytes and return a list of the complete frames
+        (as bytes) that they finish, in order of arrival."""
+        buffer = self._buffer
+        buffer += data
+        self.stray.clear()
+        frames = []
+        while True:
+            start = buffer.find(self._START)
+            if start != 0:
+                discard = len(buffer) if start < 0 else start
+                if discard:
+                    self.resync_count += 1
+                    self.discarded_bytes += discard
+                    self.stray += buffer[:discard]
+                    del buffer[:discard]
+                if start < 0:
+                    break
+            end = buffer.find(self._END)
+            if end < 0:
+                break
+            frames.append(bytes(buffer[:end + len(self._END)]))
+            del buffer[:end + len(self._END)]
+        return frames
+
+
+class Program:
+    """Builder for a command string the device runs on its own.
+
+    Loops run on the device, so a 100-cycle aspirate/dispense is one
+    command string (and one round trip) instead of 200.
+
+    .. code-block:: python
+
+        program = Program()
+        with program.repeat(100):
+            program.pickup(1000).dispense(1000)
+        pump.run_dt_program(program)  # i.e: "gP1000D1000G100"
+
+    """
+
+    def __init__(self):
+        self._commands = []
+        self._depth = 0
+
+    def __str__(self):
+        return "".join(self._commands)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({str(self)!r})"
+
+    def command(self, cmd: str, operand: int = None):
+        """Append any command (with an optional integer operand)."""
+        self._commands.append(cmd if operand is None else f"{cmd}{operand}")
+        return self
+
+    def initialize(self):
+        return self.command(Commands.InitClockwise)
+
+    def move_absolute(self, steps: int):
+        return self.command(Commands.AbsolutePosition, steps)
+
+    def pickup(self, steps: int):
+        return self.command(Commands.RelativePickup, steps)
+
+    def dispense(self, steps: int):
+        return self.command(Commands.RelativeDispense, steps)
+
+    def valve_port(self, port: int):
+        return self.command(Commands.ValvePort, port)
+
+    def delay(self, milliseconds: int):
+        return self.command(Commands.Delay, milliseconds)
+
+    @contextmanager
+    def repeat(self, count: int):
+        """Repeat the commands added inside the block `count` times (0:
+        forever, until terminated)."""
+        if count < 0:
+            raise ValueError(f"Repeat count ({count}) must not be negative.")
+        if self._depth >= MAX_LOOP_DEPTH:
+            raise ValueError(f"Loops cannot be nested more than "
+                             f"{MAX_LOOP_DEPTH} deep.")
+        self.command(Commands.LoopStart)
+        self._depth += 1
+        try:
+            yield self
+        finally:
+            self._depth -= 1
+        self.command(Commands.LoopEnd, count)
@@ -0,0 +1,719 @@
+"""In-process emulation of Runze devices for testing without hardware.
+
+An :class:`EmulatedBus` holds any number of emulated devices at distinct
+addresses and speaks the Runze binary protocol (checksums, reply status
+codes, factory commands, multicast). Move replies are withheld until the
+move would finish given the commanded speed [rpm] and step count, and
+bytes take as long as they would on the wire at the port's baud rate.
+
+:meth:`EmulatedBus.serial` returns a Serial-like port that plugs in
+anywhere a com port or :class:`~runze_control.runze_bus.RunzeBus` does.
+:meth:`EmulatedBus.pty` serves the bus on a pseudo-terminal instead, so the
+kernel tty path and pyserial are exercised too:
+
+.. code-block:: python
+
+    bus = EmulatedBus()
+    bus.add_device(EmulatedSY08(address=0x00, syringe_volume_ul=25000))
+    bus.add_device(EmulatedSY08(address=0x01, syringe_volume_ul=25000))
+    shared_bus = RunzeBus(bus.serial())
+    pump = SY08(shared_bus, address=0x01, syringe_volume_ul=25000)
+
+"""
+from runze_control.multichannel_syringe_pump import SY01B
+from runze_control.protocol_codes import common_codes
+from runze_control.protocol_codes import mini_sy04_codes
+from runze_control.protocol_codes import rotary_valve_codes
+from runze_control.protocol_codes import sy01_codes
+from runze_control.protocol_codes import sy08_codes
+from runze_control.runze_protocol import ReplyStatus, RS232BaudrateReply
+from runze_control.syringe_pump import MiniSY04, SY08
+from runze_control import runze_protocol
+from itertools import count
+from threading import Condition, Thread
+from time import perf_counter
+import heapq
+import os
+import select
+
+BITS_PER_BYTE = 10  # 8N1 framing: start bit + 8 data bits + stop bit.
+COMMON_FRAME_SIZE = runze_protocol.COMMON_FRAME.size
+FACTORY_FRAME_SIZE = runze_protocol.FACTORY_FRAME.size
+BAUDRATE_CODES = {baudrate: code for code, baudrate in RS232BaudrateReply.items()}
+
+
+class EmulatedDevice:
+    """A Runze device that answers the commands common to all devices."""
+
+    CODES = common_codes
+    PROCESSING_TIME_S = 0.001  # Time to turn around a reply to a query.
+
+    def __init__(self, address: int = 0x00, baudrate: int = 9600,
+                 firmware_version: tuple = (1, 0)):
+        self.address = address
+        self.baudrate = baudrate
+        self.firmware_version = firmware_version
+        self.multicast_addresses = [None] * 4
+        self._outbox = []  # heap of (due time, sequence number, reply frame).
+        self._sequence = count()
+        self._next_baudrate = None  # Applied once the reply is sent.
+        self._replying = True  # False while handling a multicast frame.
+        self.corrupt_next_reply = False  # If True, the next reply is sent
+                                         # with a bad checksum.
+
+    # Bus-facing interface.
+    def receive(self, func: int, param: int, now_s: float, reply: bool = True):
+        """Act on a common command frame. Queue a reply if `reply`."""
+        try:
+            name = self.CODES.CommonCmd(func).name
+        except ValueError:
+            name = None
+        handler = getattr(self, f"_on_{name}", None)
+        self._replying = reply
+        if handler is None:
+            result = (ReplyStatus.CommandRejected, 0, 0)
+        else:
+            result = handler(param, now_s)
+        self._replying = True
+        if result is not None and reply:
+            status, parameter, delay_s = result
+            self._reply(now_s + self.PROCESSING_TIME_S + delay_s, status,
+                        parameter)
+
+    def receive_factory(self, func: int, param: int, now_s: float,
+                        reply: bool = True):
+        """Act on a factory command frame. Queue a reply if `reply`."""
+        FactoryCmd = common_codes.FactoryCmd
+        status = ReplyStatus.NormalState
+        if func == FactoryCmd.SetAddress:
+            self.address = param & 0xFF
+        elif func in (FactoryCmd.SetRS232Baudrate, FactoryCmd.SetRS485Baudrate):
+            if param not in RS232BaudrateReply:
+                status = ReplyStatus.ParameterError
+            else:
+                self._next_baudrate = RS232BaudrateReply[param]
+        elif FactoryCmd.MulticastCh1Address <= func <= FactoryCmd.MulticastCh4Address:
+            self.multicast_addresses[func - FactoryCmd.MulticastCh1Address] = \
+                param & 0xFF
+        else:
+            status = ReplyStatus.CommandRejected
+        if reply:
+            self._reply(now_s + self.PROCESSING_TIME_S, status, 0)
+        elif self._next_baudrate is not None:
+            self.baudrate, self._next_baudrate = self._next_baudrate, None
+
+    def next_due_s(self):
+        """Time the next queued reply is due or None."""
+        return self._outbox[0][0] if self._outbox else None
+
+    def pop_due_replies(self, now_s: float):
+        """Remove and return every reply frame due by `now_s`."""
+        replies = []
+        while self._outbox and self._outbox[0][0] <= now_s:
+            replies.append(heapq.heappop(self._outbox)[2])
+        if replies and self._next_baudrate is not None:
+            self.baudrate, self._next_baudrate = self._next_baudrate, None
+        return replies
+
+    def listens_on(self, address: int):
+        return address in self.multicast_addresses
+
+    # Helpers.
+    def _reply(self, due_s: float, status: int, parameter: int = 0):
+        """Queue a reply. Return its entry or None if replies are muted."""
+        if not self._replying:
+            return None
+        frame = reply_frame(self.address, status, parameter)
+        if self.corrupt_next_reply:
+            self.corrupt_next_reply = False
+            frame = frame[:-1] + bytes([frame[-1] ^ 0xFF])
+        entry = (due_s, next(self._sequence), frame)
+        heapq.heappush(self._outbox, entry)
+        return entry
+
+    def _cancel_reply(self, entry):
+        if entry in self._outbox:
+            self._outbox.remove(entry)
+            heapq.heapify(self._outbox)
+
+    def _reschedule_reply(self, entry, due_s: float):
+        if entry is None:
+            return
+        self._cancel_reply(entry)
+        heapq.heappush(self._outbox, (due_s,) + entry[1:])
+
+    # Common command handlers. Each returns (status, parameter, delay [s]) or
+    # None if the handler queued its own reply.
+    def _on_GetAddress(self, param, now_s):
+        return ReplyStatus.NormalState, self.address, 0
+
+    def _on_GetRS232Baudrate(self, param, now_s):
+        return ReplyStatus.NormalState, BAUDRATE_CODES[self.baudrate], 0
+
+    _on_GetRS485Baudrate = _on_GetRS232Baudrate
+
+    def _on_GetFirmwareVersion(self, param, now_s):
+        major, minor = self.firmware_version
+        return ReplyStatus.NormalState, major | (minor << 8), 0
+
+    def _on_multicast_query(self, channel):
+        address = self.multicast_addresses[channel - 1]
+        return ReplyStatus.NormalState, address or 0, 0
+
+    def _on_GetMulticastChannel1Address(self, param, now_s):
+        return self._on_multicast_query(1)
+
+    def _on_GetMulticastChannel2Address(self, param, now_s):
+        return self._on_multicast_query(2)
+
+    def _on_GetMulticastChannel3Address(self, param, now_s):
+        return self._on_multicast_query(3)
+
+    def _on_GetMulticastChannel4Address(self, param, now_s):
+        return self._on_multicast_query(4)
+
+
+class EmulatedSyringePump(EmulatedDevice):
+    """A syringe pump with a plunger that takes realistic time to move."""
+
+    MODEL = None  # Driver class this device emulates.
+    RESIDUAL_REPLY_ON_FORCE_STOP = True  # Reply to an aborted move after a
+                                         # ForceStop (as the SY08 does).
+
+    def __init__(self, address: int = 0x31, syringe_volume_ul: int = None,
+                 baudrate: int = 9600, firmware_version: tuple = (1, 0)):
+        super().__init__(address=address, baudrate=baudrate,
+                         firmware_version=firmware_version)
+        model = self.MODEL
+        if syringe_volume_ul not in model.SYRINGE_VOLUME_TO_MAX_RPM:
+            raise ValueError(f"Syringe volume ({syringe_volume_ul} [uL]) must "
+                             "be one of: "
+                             f"{list(model.SYRINGE_VOLUME_TO_MAX_RPM.keys())}.")
+        self.syringe_volume_ul = syringe_volume_ul
+        self.max_speed_rpm = model.SYRINGE_VOLUME_TO_MAX_RPM[syringe_volume_ul]
+        self.max_position_steps = model.MAX_POSITION_STEPS[syringe_volume_ul]
+        self.steps_per_revolution = model.STEPS_PER_REVOLUTION
+        self.speed_rpm = round(model.DEFAULT_SPEED_PERCENT / 100.0
+                               * self.max_speed_rpm)
+        # Plunger motion is linear from start to target over [start, end].
+        self._start_steps = 0
+        self._target_steps = 0
+        self._move_start_s = 0
+        self._move_end_s = 0
+        self._move_reply = None  # Reply withheld until the move finishes.
+
+    def position_at(self, now_s: float):
+        """Plunger position [steps] at time `now_s`."""
+        if now_s >= self._move_end_s:
+            return self._target_steps
+        fraction = ((now_s - self._move_start_s)
+                    / (self._move_end_s - self._move_start_s))
+        return round(self._start_steps
+                     + fraction * (self._target_steps - self._start_steps))
+
+    def is_moving(self, now_s: float):
+        return now_s < self._move_end_s
+
+    def move_duration_s(self, steps: int):
+        """Time to move the plunger `steps` at the current speed."""
+        return abs(steps) / self.steps_per_revolution / self.speed_rpm * 60.0
+
+    def _start_move(self, target_steps: int, now_s: float):
+        if self.is_moving(now_s):
+            return ReplyStatus.MotorBusy, 0, 0
+        if not 0 <= target_steps <= self.max_position_steps:
+            return ReplyStatus.ParameterError, 0, 0
+        self._start_steps = self.position_at(now_s)
+        self._target_steps = target_steps
+        self._move_start_s = now_s
+        self._move_end_s = now_s + self.move_duration_s(
+            target_steps - self._start_steps)
+        self._move_reply = self._reply(self._move_end_s + self.PROCESSING_TIME_S,
+                                       ReplyStatus.NormalState, 0)
+        return None
+
+    def _on_GetMotorStatus(self, param, now_s):
+        status = ReplyStatus.MotorBusy if self.is_moving(now_s) \
+            else ReplyStatus.NormalState
+        return ReplyStatus.NormalState, status, 0
+
+    def _on_GetSyringePosition(self, param, now_s):
+        return ReplyStatus.NormalState, self.position_at(now_s), 0
+
+    def _on_SynchronizeSyringePosition(self, param, now_s):
+        return ReplyStatus.NormalState, 0, 0
+
+    def _on_RunInCW(self, param, now_s):  # Dispense.
+        if param == 0:
+            return ReplyStatus.ParameterError, 0, 0
+        return self._start_move(self.position_at(now_s) - param, now_s)
+
+    def _on_RunInCCW(self, param, now_s):  # Aspirate.
+        if param == 0:
+            return ReplyStatus.ParameterError, 0, 0
+        return self._start_move(self.position_at(now_s) + param, now_s)
+
+    def _on_ResetSyringePosition(self, param, now_s):
+        if self.position_at(now_s) == 0 and not self.is_moving(now_s):
+            return ReplyStatus.NormalState, 0, 0
+        return self._start_move(0, now_s)
+
+    def _on_SetDynamicSpeed(self, param, now_s):
+        if not 1 <= param <= self.max_speed_rpm:
+            return ReplyStatus.ParameterError, 0, 0
+        self.speed_rpm = param
+        return ReplyStatus.NormalState, 0, 0
+
+    def _on_ForceStop(self, param, now_s):
+        if self.is_moving(now_s):
+            position = self.position_at(now_s)
+            self._start_steps = self._target_steps = position
+            self._move_end_s = now_s
+            if self.RESIDUAL_REPLY_ON_FORCE_STOP:
+                self._reschedule_reply(self._move_reply, now_s)
+            else:
+                self._cancel_reply(self._move_reply)
+        self._move_reply = None
+        return ReplyStatus.NormalState, 0, 0
+
+
+class EmulatedSY08(EmulatedSyringePump):
+    MODEL = SY08
+    CODES = sy08_codes
+
+    def _on_MoveSyringeAbsolute(self, param, now_s):
+        if param == self.position_at(now_s) and not self.is_moving(now_s):
+            return ReplyStatus.NormalState, 0, 0
+        return self._start_move(param, now_s)
+
+
+class EmulatedMiniSY04(EmulatedSyringePump):
+    MODEL = MiniSY04
+    CODES = mini_sy04_codes
+    RESIDUAL_REPLY_ON_FORCE_STOP = False
+    SUBDIVISION = 8
+
+    def _on_GetFirmwareVersion(self, param, now_s):
+        return ReplyStatus.NormalState, self.firmware_version[0], 0
+
+    def _on_GetFirmwareSubVersion(self, param, now_s):
+        return ReplyStatus.NormalState, self.firmware_version[1], 0
+
+    def _on_GetMaxSpeed(self, param, now_s):
+        return ReplyStatus.NormalState, self.max_speed_rpm, 0
+
+    def _on_GetSubdivision(self, param, now_s):
+        return ReplyStatus.NormalState, self.SUBDIVISION, 0
+
+
+class EmulatedSY01B(EmulatedSyringePump):
+    """SY01B syringe pump with an integrated rotary valve."""
+    MODEL = SY01B
+    CODES = sy01_codes
+    VALVE_SECONDS_PER_PORT = 0.05  # Rotor travel time between adjacent ports.
+    VALVE_STEPS_PER_PORT = 100  # Valve encoder steps between adjacent ports.
+                                # (Nominal. Not published by Runze.)
+
+    def __init__(self, address: int = 0x00, syringe_volume_ul: int = None,
+                 position_count: int = 9, baudrate: int = 9600,
+                 firmware_version: tuple = (1, 0)):
+        if position_count not in SY01B.VALID_PORT_COUNT:
+            raise ValueError(f"Position count ({position_count}) must be one "
+                             f"of: {SY01B.VALID_PORT_COUNT}.")
+        super().__init__(address=address, syringe_volume_ul=syringe_volume_ul,
+                         baudrate=baudrate, firmware_version=firmware_version)
+        self.position_count = position_count
+        self.valve_position = 1
+        self._valve_end_s = 0
+
+    def is_moving(self, now_s: float):
+        return super().is_moving(now_s) or now_s < self._valve_end_s
+
+    def _on_MovePlungerAbsolute(self, param, now_s):
+        if param == self.position_at(now_s) and not self.is_moving(now_s):
+            return ReplyStatus.NormalState, 0, 0
+        return self._start_move(param, now_s)
+
+    def _on_RunInCCW(self, param, now_s):
+        """Turn the valve (not the plunger) `param` encoder steps
+        counterclockwise, ending on the nearest port."""
+        if param == 0:
+            return ReplyStatus.ParameterError, 0, 0
+        if self.is_moving(now_s):
+            return ReplyStatus.MotorBusy, 0, 0
+        ports = round(param / self.VALVE_STEPS_PER_PORT)
+        self.valve_position = \
+            (self.valve_position - 1 - ports) % self.position_count + 1
+        self._valve_end_s = now_s + param / self.VALVE_STEPS_PER_PORT \
+            * self.VALVE_SECONDS_PER_PORT
+        return ReplyStatus.NormalState, 0, self._valve_end_s - now_s
+
+    def _on_MoveValveToPort(self, param, now_s):
+        if self.is_moving(now_s):
+            return ReplyStatus.MotorBusy, 0, 0
+        if not 1 <= param <= self.position_count:
+            return ReplyStatus.ParameterError, 0, 0
+        # The valve takes the shorter way around.
+        distance = abs(param - self.valve_position)
+        distance = min(distance, self.position_count - distance)
+        self.valve_position = param
+        self._valve_end_s = now_s + distance * self.VALVE_SECONDS_PER_PORT
+        return ReplyStatus.NormalState, 0, self._valve_end_s - now_s
+
+    def _on_ResetValvePosition(self, param, now_s):
+        return self._on_MoveValveToPort(1, now_s)
+
+    def _on_GetValveStatus(self, param, now_s):
+        status = ReplyStatus.MotorBusy if now_s < self._valve_end_s \
+            else ReplyStatus.NormalState
+        return ReplyStatus.NormalState, status, 0
+
+    def _on_GetCurrentChannelAddress(self, param, now_s):
+        return ReplyStatus.NormalState, self.valve_position, 0
+
+
+class EmulatedRotaryValve(EmulatedDevice):
+    """SV series rotary valve. The rotor takes `SECONDS_PER_PORT` to pass
+    each port, in whichever direction it is told to turn."""
+    CODES = rotary_valve_codes
+    SECONDS_PER_PORT = 0.05  # Rotor travel time between adjacent ports.
+
+    def __init__(self, address: int = 0x00, position_count: int = 12,
+                 baudrate: int = 9600, firmware_version: tuple = (1, 0)):
+        super().__init__(address=address, baudrate=baudrate,
+                         firmware_version=firmware_version)
+        self.position_count = position_count
+        self.position = 1
+        self.ports_travelled = 0  # Total ports passed by every move.
+        self._move_end_s = 0
+        self._move_reply = None
+
+    def is_moving(self, now_s: float):
+        return now_s < self._move_end_s
+
+    def _start_move(self, port: int, clockwise: bool, now_s: float):
+        if self.is_moving(now_s):
+            return ReplyStatus.MotorBusy, 0, 0
+        if not 1 <= port <= self.position_count:
+            return ReplyStatus.ParameterError, 0, 0
+        ports = (port - self.position) % self.position_count
+        if not clockwise and ports:
+            ports = self.position_count - ports
+        self.position = port
+        self.ports_travelled += ports
+        self._move_end_s = now_s + ports * self.SECONDS_PER_PORT
+        self._move_reply = self._reply(self._move_end_s + self.PROCESSING_TIME_S,
+                                       ReplyStatus.NormalState, 0)
+        return None
+
+    def _on_MoveToPort(self, param, now_s):
+        # The device takes the shorter way around.
+        ports = (param - self.position) % self.position_count
+        return self._start_move(param, ports <= self.position_count / 2,
+                                now_s)
+
+    def _on_MoveClockwiseToPort(self, param, now_s):
+        return self._start_move(param, True, now_s)
+
+    def _on_MoveCounterclockwiseToPort(self, param, now_s):
+        return self._start_move(param, False, now_s)
+
+    def _on_Reset(self, param, now_s):
+        return self._on_MoveToPort(1, now_s)
+
+    def _on_ForceStop(self, param, now_s):
+        if self.is_moving(now_s):
+            self._move_end_s = now_s
+            self._cancel_reply(self._move_reply)
+        self._move_reply = None
+        return ReplyStatus.NormalState, 0, 0
+
+    def _on_GetMotorStatus(self, param, now_s):
+        status = ReplyStatus.MotorBusy if self.is_moving(now_s) \
+            else ReplyStatus.NormalState
+        return ReplyStatus.NormalState, status, 0
+
+    def _on_GetCurrentChannelAddress(self, param, now_s):
+        return ReplyStatus.NormalState, self.position, 0
+
+
+def reply_frame(address: int, status: int, parameter: int = 0):
+    """Encode a complete Runze Protocol reply frame."""
+    stx = runze_protocol.PacketFields.STX
+    etx = runze_protocol.PacketFields.ETX
+    checksum = (stx + address + status + (parameter & 0xFF)
+                + (parameter >> 8) + etx)
+    return runze_protocol.REPLY_FRAME.pack(stx, address, status, parameter,
+                                           etx, checksum)
+
+
+class EmulatedBus:
+    """A serial bus of emulated devices.
+
+    Commands written by the host are acted on as soon as they have crossed
+    the wire. Replies are released when due, one at a time, at the wire speed
+    of the port's baud rate. A device only hears the host if their baud rates
+    match.
+    """
+
+    def __init__(self, devices=()):
+        self.devices = []
+        self._rx_buffer = bytearray()  # Host-to-device bytes not yet framed.
+        self._cond = Condition()
+        self._sink = None  # Callable that hands reply bytes to the host.
+        self._wire_free_s = 0  # Time the device-to-host line is next idle.
+        self._host_baudrate = 9600
+        self._closed = False
+        self._worker = None
+        self._pty_server = None
+        for device in devices:
+            self.add_device(device)
+
+    def add_device(self, device: EmulatedDevice):
+        with self._cond:
+            if any(d.address == device.address for d in self.devices):
+                raise ValueError(f"A device at address 0x{device.address:02x} "
+                                 "already exists on this bus.")
+            self.devices.append(device)
+        return device
+
+    def serial(self, baudrate: int = 9600):
+        """Return a Serial-like port connected to this bus."""
+        return EmulatedSerial(self, baudrate)
+
+    def pty(self, baudrate: int = 9600):
+        """Serve this bus on a pseudo-terminal and return the path of its
+        device end (i.e: ``/dev/pts/3``). Open it like any serial port.
+        (Linux/macOS only.)
+
+        :param baudrate: baud rate the host is assumed to write at. (Ptys
+            ignore the baud rate that the host configures.)
+        """
+        import tty
+        master_fd, slave_fd = os.openpty()
+        tty.setraw(slave_fd)
+        tty.setraw(master_fd)
+        path = os.ttyname(slave_fd)
+        self.attach(lambda data: os.write(master_fd, data))
+        self._pty_server = Thread(target=self._serve_fd,
+                                  args=(master_fd, baudrate, slave_fd),
+                                  daemon=True, name="EmulatedBus-pty")
+        self._pty_server.start()
+        return path
+
+    def _serve_fd(self, fd: int, baudrate: int, slave_fd: int):
+        """Feed bytes from `fd` into the bus until it closes. Then close the
+        pty (here, so its descriptors can't be reused while in use)."""
+        try:
+            while not self._closed:
+                if not select.select([fd], [], [], 0.1)[0]:
+                    continue
+                data = os.read(fd, 4096)
+                if data:
+                    self.receive(data, baudrate)
+        except OSError:
+            pass
+        finally:
+            with self._cond:
+                self._sink = None
+            os.close(fd)
+            os.close(slave_fd)
+
+    def attach(self, sink):
+        """Deliver reply bytes to `sink(data)` (the host side of the link)."""
+        with self._cond:
+            self._sink = sink
+            if self._worker is None:
+                self._worker = Thread(target=self._run, daemon=True,
+                                      name="EmulatedBus")
+                self._worker.start()
+
+    def detach(self, sink):
+        """Stop delivering reply bytes to `sink`."""
+        with self._cond:
+            if self._sink == sink:
+                self._sink = None
+
+    def close(self):
+        """Stop the emulation."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._pty_server is not None:
+            self._pty_server.join()
+
+    def receive(self, data: bytes, baudrate: int):
+        """Accept bytes written by the host at `baudrate`."""
+        now_s = perf_counter()
+        with self._cond:
+            self._host_baudrate = baudrate
+            # Commands are acted on once their last byte has arrived.
+            arrival_s = now_s + len(data) * BITS_PER_BYTE / baudrate
+            self._rx_buffer += data
+            self._dispatch_frames(arrival_s, baudrate)
+            self._cond.notify_all()
+
+    def _dispatch_frames(self, now_s: float, baudrate: int):
+        buffer = self._rx_buffer
+        stx = runze_protocol.PacketFields.STX
+        etx = runze_protocol.PacketFields.ETX
+        while buffer:
+            if buffer[0] != stx:
+                del buffer[0]
+                continue
+            if len(buffer) < COMMON_FRAME_SIZE:
+                return
+            if buffer[5] == etx and sum(buffer[:6]) == \
+                    int.from_bytes(buffer[6:8], 'little'):
+                _, address, func, param, _, _ = \
+                    runze_protocol.COMMON_FRAME.unpack_from(buffer)
+                del buffer[:COMMON_FRAME_SIZE]
+                self._route(address, func, param, now_s, baudrate,
+                            factory=False)
+                continue
+            if len(buffer) < FACTORY_FRAME_SIZE:
+                return
+            if buffer[11] == etx and sum(buffer[:12]) == \
+                    int.from_bytes(buffer[12:14], 'little'):
+                _, address, func, password, param, _, _ = \
+                    runze_protocol.FACTORY_FRAME.unpack_from(buffer)
+                del buffer[:FACTORY_FRAME_SIZE]
+                if password == runze_protocol.FACTORY_CMD_PWD_CODE:
+                    self._route(address, func, param, now_s, baudrate,
+                                factory=True)
+                continue
+            del buffer[0]  # Corrupted frame. Resync on the next STX.
+
+    def _route(self, address, func, param, now_s, baudrate, factory):
+        listeners = [d for d in self.devices if d.baudrate == baudrate]
+        targets = [d for d in listeners if d.address == address]
+        reply = True
+        if not targets:
+            targets = [d for d in listeners if d.listens_on(address)]
+            reply = False  # Multicast frames are not answered.
+        if not targets and len(listeners) == 1 and not factory \
+                and func == common_codes.CommonCmd.GetAddress:
+            # A lone device answers an address query sent to any address.
+            targets, reply = listeners, True
+        for device in targets:
+            if factory:
+                device.receive_factory(func, param, now_s, reply)
+            else:
+                device.receive(func, param, now_s, reply)
+
+    def _next_due_s(self):
+        due_times = [d.next_due_s() for d in self.devices]
+        due_times = [t for t in due_times if t is not None]
+        return min(due_times) if due_times else None
+
+    def _run(self):
+        """Release replies to the host as they come due."""
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                now_s = perf_counter()
+                due_s = self._next_due_s()
+                if due_s is None or due_s > now_s:
+                    self._cond.wait(None if due_s is None else due_s - now_s)
+                    continue
+                replies = []
+                for device in self.devices:
+                    replies.extend(device.pop_due_replies(now_s))
+                # Replies share one line back to the host.
+                frame_time_s = COMMON_FRAME_SIZE * BITS_PER_BYTE \
+                    / self._host_baudrate
+                self._wire_free_s = max(self._wire_free_s, now_s) \
+                    + frame_time_s * len(replies)
+                release_s = self._wire_free_s
+                sink = self._sink
+            wait_s = release_s - perf_counter()
+            if wait_s > 0:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closed, wait_s)
+            if sink is not None and replies:
+                sink(b"".join(replies))
+
+
+class EmulatedSerial:
+    """Serial-like host port for an :class:`EmulatedBus`.
+
+    Implements the subset of the pyserial ``Serial`` interface this package
+    uses. On POSIX, :meth:`fileno` returns a descriptor that is readable
+    while replies are waiting, so the port works with select and asyncio.
+    """
+
+    _port_numbers = count()
+
+    def __init__(self, bus: EmulatedBus, baudrate: int = 9600,
+                 timeout: float = 0):
+        self.bus = bus
+        self.port = f"emulated://{next(self._port_numbers)}"
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.is_open = True
+        self._rx_buffer = bytearray()
+        self._cond = Condition()
+        self._doorbell_r, self._doorbell_w = os.pipe()
+        os.set_blocking(self._doorbell_r, False)
+        bus.attach(self._receive)
+
+    def fileno(self):
+        return self._doorbell_r
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return len(self._rx_buffer)
+
+    def write(self, data: bytes):
+        self.bus.receive(bytes(data), self.baudrate)
+        return len(data)
+
+    def read(self, size: int = 1):
+        with self._cond:
+            if self.timeout is None:
+                self._cond.wait_for(lambda: len(self._rx_buffer) >= size)
+            elif self.timeout > 0:
+                self._cond.wait_for(lambda: len(self._rx_buffer) >= size,
+                                    self.timeout)
+            data = bytes(self._rx_buffer[:size])
+            del self._rx_buffer[:size]
+            if not self._rx_buffer:
+                self._drain_doorbell()
+            return data
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._rx_buffer.clear()
+            self._drain_doorbell()
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        self.bus.detach(self._receive)
+        os.close(self._doorbell_r)
+        os.close(self._doorbell_w)
+
+    def _receive(self, data: bytes):
+        with self._cond:
+            if not self.is_open:
+                return
+            if not self._rx_buffer:
+                os.write(self._doorbell_w, b"\x00")
+            self._rx_buffer += data
+            self._cond.notify_all()
+
+    def _drain_doorbell(self):
+        try:
+            while os.read(self._doorbell_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
@@ -0,0 +1,311 @@
+"""Drive many devices across many ports from one I/O thread."""
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from runze_control.runze_device import RunzeDevice
+from runze_control.runze_protocol import ReplyStatus
+from serial import SerialException
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Iterable, List
+import heapq
+import os
+import selectors
+
+
+class Fleet:
+    """Devices on any number of ports, serviced by one selector loop.
+
+    Commands are written from the caller's thread without waiting. A single
+    I/O thread watches every port at once and completes each device's
+    command when its reply lands, so waiting on hundreds of devices takes
+    one thread and no polling queries.
+
+    .. code-block:: python
+
+        fleet = Fleet(pumps)
+        fleet.submit(pumps, "dispense", 100)  # Starts every move at once.
+        fleet.wait_all()
+        done = fleet.wait_any(pumps)  # Devices that finished first.
+
+    A device is *idle* once the reply to its last command has arrived and,
+    for a syringe pump whose motion model still predicts movement (i.e:
+    after a :class:`~runze_control.device_group.DeviceGroup` move), a motor
+    status query confirms that the plunger stopped.
+
+    .. warning::
+       While the fleet waits on a device, its I/O thread owns the device.
+       Don't issue commands to it from other threads until the wait
+       resolves.
+
+    """
+
+    MAX_SELECT_TIMEOUT_S = 0.1  # Upper bound on the time between timeout
+                                # checks.
+    UNPOLLABLE_INTERVAL_S = 0.005  # Time between reads of ports that have no
+                                   # file descriptor to select on.
+
+    def __init__(self, devices: Iterable[RunzeDevice] = ()):
+        self.devices = []
+        self._lock = Lock()
+        self._waiters = {}  # device -> list of Futures resolved when idle.
+        self._querying = set()  # Devices awaiting a status query we sent.
+        self._poll_times = {}  # device -> time [s] of its next status query
+                               # once its motor was found still busy.
+        self._dirty = set()  # Devices to check on the next pass.
+        self._timers = []  # heap of (time [s], sequence number, device)
+        self._timer_count = 0
+        self._selector = selectors.DefaultSelector()
+        self._bus_devices = {}  # bus -> devices on it.
+        self._unpollable_buses = set()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True, name="Fleet")
+        for device in devices:
+            self.add(device)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, device: RunzeDevice):
+        """Start managing a device."""
+        with self._lock:
+            if device in self.devices:
+                return
+            self.devices.append(device)
+            bus = device.bus
+            if bus in self._bus_devices:
+                self._bus_devices[bus].append(device)
+                return
+            self._bus_devices[bus] = [device]
+            try:
+                self._selector.register(bus.ser.fileno(), selectors.EVENT_READ,
+                                        bus)
+            except (AttributeError, OSError, ValueError):
+                self._unpollable_buses.add(bus)
+        self._wake()
+
+    def remove(self, device: RunzeDevice):
+        """Stop managing a device. Cancel any waits on it."""
+        with self._lock:
+            self.devices.remove(device)
+            for future in self._waiters.pop(device, []):
+                self._cancel(future)
+            self._querying.discard(device)
+            self._poll_times.pop(device, None)
+            bus_devices = self._bus_devices[device.bus]
+            bus_devices.remove(device)
+            if not bus_devices:
+                del self._bus_devices[device.bus]
+                if device.bus in self._unpollable_buses:
+                    self._unpollable_buses.discard(device.bus)
+                else:
+                    self._selector.unregister(device.bus.ser.fileno())
+
+    def close(self):
+        """Stop the I/O thread and cancel any pending waits. (Devices are
+        left open.)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake()
+        self._thread.join()
+        for futures in self._waiters.values():
+            for future in futures:
+                self._cancel(future)
+        self._waiters.clear()
+        self._selector.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+    def submit(self, devices: Iterable[RunzeDevice], method: str, *args,
+               **kwargs) -> List[Future]:
+        """Call `method` (by name, i.e: ``"dispense"``) with ``wait=False`` on
+        every device, so each command goes out without waiting on the
+        others. Return a Future per device that resolves (to the device)
+        once it is idle.
+
+        :raises RuntimeError: if the fleet is already waiting on one of the
+            devices.
+        """
+        devices = list(devices)
+        with self._lock:
+            busy = [d for d in devices if d in self._waiters]
+        if busy:
+            raise RuntimeError(f"Cannot submit to devices the fleet is "
+                               f"waiting on: {[hex(d.address) for d in busy]}.")
+        for device in devices:
+            getattr(device, method)(*args, wait=False, **kwargs)
+        return [self.idle(device) for device in devices]
+
+    def idle(self, device: RunzeDevice) -> Future:
+        """Return a Future that resolves (to the device) once `device` is
+        idle, or holds the error if its command failed."""
+        future = Future()  # Left pending so that close() can cancel it.
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot wait on devices in a closed fleet.")
+            if device not in self.devices:
+                raise ValueError(f"Device 0x{device.address:02x} is not in "
+                                 "this fleet.")
+            self._waiters.setdefault(device, []).append(future)
+            self._dirty.add(device)
+        self._wake()
+        return future
+
+    def wait_all(self, devices: Iterable[RunzeDevice] = None,
+                 timeout_s: float = None):
+        """Block until every device (default: all of them) is idle.
+
+        :raises SerialException: if `timeout_s` elapses first.
+        :raises CancelledError: if the fleet is closed (or a device removed
+            from it) first.
+        """
+        devices = self.devices if devices is None else devices
+        futures = [self.idle(device) for device in list(devices)]
+        done, not_done = wait(futures, timeout_s)
+        if not_done:
+            for future in not_done:
+                self._discard_waiter(future)
+            raise SerialException(f"Timed out waiting on {len(not_done)} "
+                                  "device(s).")
+        for future in futures:
+            future.result()  # Raise the first device error, if any.
+
+    def wait_any(self, devices: Iterable[RunzeDevice] = None,
+                 timeout_s: float = None) -> List[RunzeDevice]:
+        """Block until at least one device (default: of all of them) is idle.
+        Return the devices that are idle by then.
+
+        :raises SerialException: if `timeout_s` elapses first.
+        """
+        devices = self.devices if devices is None else devices
+        futures = [self.idle(device) for device in list(devices)]
+        done, not_done = wait(futures, timeout_s, return_when=FIRST_COMPLETED)
+        if not done:
+            raise SerialException("Timed out waiting on devices.")
+        for future in not_done:
+            self._discard_waiter(future)
+        return [future.result() for future in futures if future in done]
+
+    def _discard_waiter(self, future: Future):
+        with self._lock:
+            for device, futures in list(self._waiters.items()):
+                if future in futures:
+                    futures.remove(future)
+                    if not futures:
+                        del self._waiters[device]
+                    return
+
+    @staticmethod
+    def _cancel(future: Future):
+        """Cancel a pending future and wake anything waiting on it."""
+        if future.cancel():
+            future.set_running_or_notify_cancel()
+
+    def _wake(self):
+        try:
+            os.write(self._wakeup_w, b"\x00")
+        except OSError:  # Closed.
+            pass
+
+    def _schedule(self, device: RunzeDevice, time_s: float):
+        heapq.heappush(self._timers, (time_s, self._timer_count, device))
+        self._timer_count += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                timeout_s = self.MAX_SELECT_TIMEOUT_S
+                if self._timers:
+                    timeout_s = min(timeout_s,
+                                    self._timers[0][0] - perf_counter())
+                if self._unpollable_buses:
+                    timeout_s = min(timeout_s, self.UNPOLLABLE_INTERVAL_S)
+                ready_buses = set(self._unpollable_buses)
+            events = self._selector.select(max(0, timeout_s))
+            for key, _ in events:
+                if key.data is None:
+                    try:
+                        os.read(self._wakeup_r, 4096)
+                    except BlockingIOError:
+                        pass
+                else:
+                    ready_buses.add(key.data)
+            now_s = perf_counter()
+            with self._lock:
+                to_check = self._dirty
+                self._dirty = set()
+                for bus in ready_buses:
+                    bus.poll()
+                    to_check.update(self._bus_devices.get(bus, ()))
+                while self._timers and self._timers[0][0] <= now_s:
+                    to_check.add(heapq.heappop(self._timers)[2])
+                # Catch timeouts of commands that never get a reply.
+                to_check.update(d for d in self._waiters
+                                if d.cmd_send_time_s is not None
+                                and now_s - d.cmd_send_time_s >= d._timeout_s)
+                to_check.intersection_update(self._waiters)
+                for device in to_check:
+                    try:
+                        idle = self._check(device, now_s)
+                    except Exception as e:
+                        self._querying.discard(device)
+                        self._poll_times.pop(device, None)
+                        for future in self._waiters.pop(device):
+                            if future.set_running_or_notify_cancel():
+                                future.set_exception(e)
+                        continue
+                    if idle:
+                        for future in self._waiters.pop(device):
+                            if future.set_running_or_notify_cancel():
+                                future.set_result(device)
+
+    def _check(self, device: RunzeDevice, now_s: float):
+        """Advance a device's wait without blocking. Return True if it is
+        idle."""
+        if device.cmd_send_time_s is not None:
+            raw_reply = device.bus.pop_reply(device.address)
+            if raw_reply is None:
+                if now_s - device.cmd_send_time_s >= device._timeout_s:
+                    device.cmd_send_time_s = None
+                    device.metrics.record_timeout()
+                    raise SerialException("No reply received from device.")
+                return False
+            reply = device._parse_runze_reply(device._accept_reply(raw_reply))
+            if device in self._querying:
+                self._querying.discard(device)
+                if reply.parameter == ReplyStatus.MotorBusy:
+                    # Ran past its prediction. Poll until the motor stops.
+                    self._poll_times[device] = now_s + device.POLL_INTERVAL_S
+                    self._schedule(device, self._poll_times[device])
+                    return False
+                device.motion.cancel()
+                return True
+        if device in self._poll_times:
+            if now_s < self._poll_times[device]:
+                return False
+            del self._poll_times[device]
+            self._query_motor_status(device)
+            return False
+        motion = getattr(device, "motion", None)
+        if motion is None or motion.end_time_s is None:
+            return True
+        if motion.is_moving(now_s):
+            self._schedule(device, motion.end_time_s)
+            return False
+        # Predicted to have stopped. Confirm with a status query.
+        self._query_motor_status(device)
+        return False
+
+    def _query_motor_status(self, device: RunzeDevice):
+        device._send_common_cmd_runze(device.codes.CommonCmd.GetMotorStatus,
+                                      wait=False)
+        self._querying.add(device)
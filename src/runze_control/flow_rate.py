@@ -0,0 +1,132 @@
+"""Volumetric flow rates achievable by each syringe pump model."""
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, NamedTuple
+
+
+class FlowRateSetting(NamedTuple):
+    """Nearest achievable flow rate to a requested one."""
+    requested_ul_per_min: float
+    actual_ul_per_min: float
+    speed_rpm: int
+
+    @property
+    def error_ul_per_min(self):
+        """Quantization error (actual minus requested)."""
+        return self.actual_ul_per_min - self.requested_ul_per_min
+
+    @property
+    def relative_error(self):
+        return self.error_ul_per_min / self.requested_ul_per_min
+
+
+class FlowRateTable:
+    """Flow rate [uL/min] at every motor speed [rpm] a pump can run at.
+
+    A pump's speed is set in whole rpm, so only these flow rates are
+    achievable. Nominal rates follow from the plunger travel per motor
+    revolution. Measured rates at a few speeds (i.e: from weighing
+    dispensed water) correct the table, and speeds between measurements
+    are scaled by linear interpolation.
+
+    .. code-block:: python
+
+        table = FlowRateTable(max_speed_rpm=500, ul_per_revolution=416.67)
+        setting = table.nearest(1000)  # 833.3 [uL/min] at 2 [rpm].
+        setting.error_ul_per_min  # -166.7
+
+    """
+
+    def __init__(self, max_speed_rpm: int, ul_per_revolution: float,
+                 calibration: Dict[int, float] = None):
+        """Init.
+
+        :param max_speed_rpm: fastest motor speed.
+        :param ul_per_revolution: nominal volume moved per motor revolution.
+        :param calibration: measured flow rate [uL/min] at any speeds [rpm].
+        """
+        self.max_speed_rpm = max_speed_rpm
+        self.ul_per_revolution = ul_per_revolution
+        self.calibration = dict(calibration or {})
+        scales = self._interpolated_scales(max_speed_rpm, ul_per_revolution,
+                                           self.calibration)
+        # Index is speed [rpm]. Speed 0 (stopped) is kept to simplify lookups.
+        self.rates_ul_per_min = [rpm * ul_per_revolution * scale
+                                 for rpm, scale in enumerate(scales)]
+        if any(b <= a for a, b in zip(self.rates_ul_per_min,
+                                      self.rates_ul_per_min[1:])):
+            raise ValueError("Calibrated flow rates must increase with "
+                             "speed.")
+
+    @staticmethod
+    def _interpolated_scales(max_speed_rpm: int, ul_per_revolution: float,
+                             calibration: Dict[int, float]):
+        """Measured-over-nominal ratio at every speed (1 if uncalibrated).
+        Constant beyond the slowest and fastest measurements."""
+        points = sorted((rpm, rate / (rpm * ul_per_revolution))
+                        for rpm, rate in calibration.items())
+        if any(not 1 <= rpm <= max_speed_rpm for rpm, _ in points):
+            raise ValueError(f"Calibrated speeds must be in range "
+                             f"[1 - {max_speed_rpm}] [rpm].")
+        if not points:
+            return [1.0] * (max_speed_rpm + 1)
+        scales = []
+        for rpm in range(max_speed_rpm + 1):
+            index = bisect_left(points, (rpm,))
+            if index == 0:
+                scales.append(points[0][1])
+            elif index == len(points):
+                scales.append(points[-1][1])
+            else:
+                (rpm_a, scale_a), (rpm_b, scale_b) = points[index - 1], \
+                    points[index]
+                fraction = (rpm - rpm_a) / (rpm_b - rpm_a)
+                scales.append(scale_a + fraction * (scale_b - scale_a))
+        return scales
+
+    @property
+    def min_ul_per_min(self):
+        return self.rates_ul_per_min[1]
+
+    @property
+    def max_ul_per_min(self):
+        return self.rates_ul_per_min[-1]
+
+    def rate_ul_per_min(self, speed_rpm: int):
+        """Flow rate at a speed."""
+        return self.rates_ul_per_min[speed_rpm]
+
+    def nearest(self, flow_rate_ul_per_min: float):
+        """Return the achievable setting nearest to a flow rate.
+
+        :raises ValueError: if the rate is outside the achievable range.
+        """
+        rates = self.rates_ul_per_min
+        if not self.min_ul_per_min / 2 <= flow_rate_ul_per_min \
+                <= self.max_ul_per_min:
+            raise ValueError(f"Flow rate ({flow_rate_ul_per_min} [uL/min]) "
+                             f"is out of range [{self.min_ul_per_min:.2f} - "
+                             f"{self.max_ul_per_min:.1f}].")
+        # Calibration scales rates only slightly, so the nominal speed is at
+        # most a step or two from the nearest one.
+        rpm = round(flow_rate_ul_per_min / self.ul_per_revolution)
+        rpm = min(self.max_speed_rpm, max(1, rpm))
+        while rpm > 1 and rates[rpm] > flow_rate_ul_per_min \
+                and rates[rpm] - flow_rate_ul_per_min \
+                > flow_rate_ul_per_min - rates[rpm - 1]:
+            rpm -= 1
+        while rpm < self.max_speed_rpm and rates[rpm] < flow_rate_ul_per_min \
+                and flow_rate_ul_per_min - rates[rpm] \
+                > rates[rpm + 1] - flow_rate_ul_per_min:
+            rpm += 1
+        return FlowRateSetting(flow_rate_ul_per_min, rates[rpm], rpm)
+
+
+@lru_cache(maxsize=None)
+def nominal_table(model: type, syringe_volume_ul: float):
+    """Uncalibrated table for a syringe pump model (class) and syringe.
+    Built once per model and syringe volume."""
+    ul_per_revolution = model.STEPS_PER_REVOLUTION * syringe_volume_ul \
+        / model.MAX_POSITION_STEPS[syringe_volume_ul]
+    return FlowRateTable(model.SYRINGE_VOLUME_TO_MAX_RPM[syringe_volume_ul],
+                         ul_per_revolution)
@@ -0,0 +1,175 @@
+"""Always-on command counters and latency histograms."""
+from bisect import bisect_left
+from runze_control.runze_protocol import ReplyStatus
+from typing import Iterable
+
+FACTORY_KEY_FLAG = 0x100  # Set on the keys of factory commands so they can't
+                          # collide with common command codes.
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations.
+
+    Bucket bounds double from 100[us] to ~105[s], so recording a sample is a
+    bisect and an increment. Percentiles are estimated as the upper bound of
+    the bucket they fall in.
+    """
+
+    BOUNDS_S = tuple(100e-6 * 2**i for i in range(21))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS_S) + 1)  # Last bucket: overflow.
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def record(self, duration_s: float):
+        self.counts[bisect_left(self.BOUNDS_S, duration_s)] += 1
+        self.count += 1
+        self.total_s += duration_s
+        if duration_s > self.max_s:
+            self.max_s = duration_s
+
+    def percentile(self, percent: float):
+        """Estimated duration [s] below which `percent` of samples fall or
+        None if there are no samples."""
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bound_s, count in zip(self.BOUNDS_S, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound_s, self.max_s)
+        return self.max_s
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_s": self.total_s / self.count if self.count else None,
+            "p50_s": self.percentile(50),
+            "p90_s": self.percentile(90),
+            "p99_s": self.percentile(99),
+            "max_s": self.max_s if self.count else None,
+            "bucket_bounds_s": list(self.BOUNDS_S),
+            "bucket_counts": list(self.counts),
+        }
+
+
+class CommandStats:
+    """Counters for one command code on one device."""
+
+    def __init__(self):
+        self.sent = 0
+        self.replies = 0
+        self.timeouts = 0
+        self.errors = {}  # error ReplyStatus code -> count
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.first_byte_latency = LatencyHistogram()  # send -> first byte.
+        self.reply_latency = LatencyHistogram()  # send -> complete frame.
+
+    def snapshot(self):
+        return {
+            "sent": self.sent,
+            "replies": self.replies,
+            "timeouts": self.timeouts,
+            "errors": {_status_name(status): count
+                       for status, count in self.errors.items()},
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "first_byte_latency": self.first_byte_latency.snapshot(),
+            "reply_latency": self.reply_latency.snapshot(),
+        }
+
+
+class DeviceMetrics:
+    """Per-command statistics for one device.
+
+    Every :class:`~runze_control.runze_device.RunzeDevice` keeps one of
+    these as ``device.metrics`` and updates it on every command, so the
+    numbers are there when a rig falls behind without turning on logging.
+
+    .. code-block:: python
+
+        snapshot = pump.get_metrics()
+        slowest = max(snapshot["commands"].items(),
+                      key=lambda item: item[1]["reply_latency"]["p99_s"] or 0)
+
+    """
+
+    def __init__(self):
+        self.commands = {}  # command key -> CommandStats
+        self._pending = None  # CommandStats of the command awaiting a reply.
+
+    def reset(self):
+        self.commands = {}
+        self._pending = None
+
+    def record_send(self, func: int, num_bytes: int, factory: bool = False):
+        """Count a command frame written to the bus."""
+        key = func | FACTORY_KEY_FLAG if factory else func
+        stats = self.commands.get(key)
+        if stats is None:
+            stats = self.commands[key] = CommandStats()
+        stats.sent += 1
+        stats.bytes_sent += num_bytes
+        self._pending = stats
+
+    def record_reply(self, status: int, num_bytes: int, send_time_s: float,
+                     first_byte_time_s: float, complete_time_s: float):
+        """Count the reply to the last command sent."""
+        stats = self._pending
+        if stats is None:  # i.e: a residual reply read with force=True.
+            return
+        self._pending = None
+        stats.replies += 1
+        stats.bytes_received += num_bytes
+        if status:
+            stats.errors[status] = stats.errors.get(status, 0) + 1
+        if send_time_s is not None:
+            stats.first_byte_latency.record(first_byte_time_s - send_time_s)
+            stats.reply_latency.record(complete_time_s - send_time_s)
+
+    def record_timeout(self):
+        """Count a wait for a reply to the last command sent that expired."""
+        if self._pending is not None:
+            self._pending.timeouts += 1
+
+    def snapshot(self, command_names: dict = None):
+        """Return every statistic as plain dicts and lists.
+
+        :param command_names: command key (code, with FACTORY_KEY_FLAG set
+            for factory commands) to command name. Unnamed commands are
+            keyed by their hex code.
+        """
+        command_names = command_names or {}
+        commands = {}
+        totals = {"sent": 0, "replies": 0, "timeouts": 0, "errors": 0,
+                  "bytes_sent": 0, "bytes_received": 0}
+        for key, stats in list(self.commands.items()):
+            name = command_names.get(key)
+            if name is None:
+                name = f"Factory.0x{key & 0xFF:02x}" \
+                    if key & FACTORY_KEY_FLAG else f"0x{key:02x}"
+            commands[name] = stats.snapshot()
+            totals["sent"] += stats.sent
+            totals["replies"] += stats.replies
+            totals["timeouts"] += stats.timeouts
+            totals["errors"] += sum(stats.errors.values())
+            totals["bytes_sent"] += stats.bytes_sent
+            totals["bytes_received"] += stats.bytes_received
+        return {"commands": commands, "totals": totals}
+
+
+def _status_name(status: int):
+    try:
+        return ReplyStatus(status).name
+    except ValueError:
+        return f"0x{status:02x}"
+
+
+def fleet_snapshot(devices: Iterable):
+    """Metrics snapshot of several devices, keyed by port and address."""
+    return {f"{device.bus.com_port}.0x{device.address:02x}":
+            device.get_metrics() for device in devices}
@@ -0,0 +1,69 @@
+"""Predict how long plunger moves take."""
+from time import perf_counter
+
+
+class MotionModel:
+    """Kinematic model of a syringe pump's plunger moves.
+
+    A move of `steps` at `speed_rpm` nominally takes
+    ``steps / steps_per_revolution / speed_rpm * 60`` seconds. Real devices
+    accelerate, decelerate and answer a little late, so the model scales the
+    nominal duration by a correction factor that it learns from the
+    observed duration of each move it predicted.
+    """
+
+    LEARNING_RATE = 0.2  # Weight of each new observation in the correction.
+    MIN_LEARNING_DURATION_S = 0.1  # Shorter moves are dominated by
+                                   # communication latency. Don't learn from
+                                   # them.
+    CORRECTION_RANGE = (0.5, 2.0)  # Bounds on the learned correction.
+
+    def __init__(self, steps_per_revolution: int, correction: float = 1.0):
+        self.steps_per_revolution = steps_per_revolution
+        self.correction = correction
+        self.end_time_s = None  # Predicted end of the current move or None.
+        self._nominal_duration_s = None
+
+    def nominal_duration_s(self, steps: int, speed_rpm: float):
+        """Duration [s] of a move per the datasheet kinematics alone."""
+        return abs(steps) / self.steps_per_revolution / speed_rpm * 60.0
+
+    def duration_s(self, steps: int, speed_rpm: float):
+        """Predicted duration [s] of a move."""
+        return self.nominal_duration_s(steps, speed_rpm) * self.correction
+
+    def start(self, steps: int, speed_rpm: float, start_time_s: float = None):
+        """Predict the end of a move starting now (or at `start_time_s`).
+        Return the predicted end time (in :func:`time.perf_counter` time)."""
+        if start_time_s is None:
+            start_time_s = perf_counter()
+        self._nominal_duration_s = self.nominal_duration_s(steps, speed_rpm)
+        self.end_time_s = start_time_s \
+            + self._nominal_duration_s * self.correction
+        return self.end_time_s
+
+    def finish(self, observed_duration_s: float = None):
+        """Mark the current move as finished. Learn from its duration [s] if
+        it was observed."""
+        nominal_s = self._nominal_duration_s
+        self.cancel()
+        if observed_duration_s is None or nominal_s is None \
+                or nominal_s < self.MIN_LEARNING_DURATION_S:
+            return
+        low, high = self.CORRECTION_RANGE
+        ratio = min(high, max(low, observed_duration_s / nominal_s))
+        self.correction += self.LEARNING_RATE * (ratio - self.correction)
+
+    def cancel(self):
+        """Forget the current move without learning from it."""
+        self.end_time_s = None
+        self._nominal_duration_s = None
+
+    def is_moving(self, time_s: float = None):
+        """True if a move is predicted to still be underway at `time_s`
+        (default: now)."""
+        if self.end_time_s is None:
+            return False
+        if time_s is None:
+            time_s = perf_counter()
+        return time_s < self.end_time_s
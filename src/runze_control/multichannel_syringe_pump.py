@@ -1,15 +1,22 @@
 """Syringe Pump Driver."""
 import logging
+from math import ceil
+from runze_control.dt_protocol import Commands as DTCommands, Program
 from runze_control.protocol import Protocol
+from runze_control.runze_bus import RunzeBus
 from runze_control.syringe_pump import SyringePump
 from runze_control.protocol_codes import sy01_codes
-from typing import Union
+from typing import List, Tuple, Union
 
 
 class MultiChannelSyringePump(SyringePump):
     """syringe pump with integrated rotary valve."""
 
-    def __init__(self, com_port: str, baudrate: int = None,
+    VALVE_SECONDS_PER_PORT = 0.05  # Nominal rotor travel time between
+                                   # adjacent ports.
+    RUN_CMDS_MOVE_PLUNGER = False  # RunInCW/RunInCCW turn the valve.
+
+    def __init__(self, com_port: Union[str, RunzeBus], baudrate: int = None,
                  address: int = None,
                  protocol: Union[str, Protocol] = Protocol.RUNZE,
                  syringe_volume_ul: float = None, position_count: int = None,
@@ -27,7 +34,7 @@ class MultiChannelSyringePump(SyringePump):
         self.position_map = position_map
         self.codes = sy01_codes  # Overwrite parent class codes.
         # Override logger and logger name.
-        logger_name = self.__class__.__name__ + f".{com_port}"
+        logger_name = self.__class__.__name__ + f".{self.bus.com_port}"
         self.log = logging.getLogger(logger_name)
         # FIXME: validate port count.
         self.position_count = position_count
@@ -36,36 +43,75 @@ class MultiChannelSyringePump(SyringePump):
     #   on the multichannel syringe pump configuration
 
     def move_valve_to_position(self, position: int, wait: bool = True):
+        if self.protocol != Protocol.RUNZE:
+            self._send_cmd_dt(f"{DTCommands.ValvePort}{position}", wait=wait)
+            return
         self._send_common_cmd_runze(self.codes.CommonCmd.MoveValveToPort,
                                     position, wait=wait)
 
-    def move_absolute_in_steps(self, steps: int, wait: bool = True):
-        """Absolute move (in steps).
+    def get_valve_position(self):
+        """Return the port the valve is at."""
+        if self.protocol != Protocol.RUNZE:
+            return int(self._send_query_dt(DTCommands.QueryValvePosition).data)
+        reply = self._send_query_runze(
+            self.codes.CommonCmd.GetCurrentChannelAddress)
+        return reply.parameter
+
+    def aspirate_steps(self, steps: int, wait: bool = True):
+        """Relative plunger move in the withdraw direction.
 
         .. Note::
-           This feature is implemented in the software driver rather than
-           leveraging a feature on the device itself like the SY08.
+           Over Runze protocol, this is sent as an absolute plunger move
+           (RunInCCW moves the valve on this device).
 
         """
+        if self.protocol != Protocol.RUNZE:
+            return super().aspirate_steps(steps, wait=wait)
+        self.log.debug("Aspirating %.2f [uL] i.e %d [steps].",
+                       self._steps_to_ul(steps), steps)
+        self._move_plunger_absolute(self.driver_steps + steps, wait)
+
+    def dispense_steps(self, steps: int, wait: bool = True):
+        """Relative plunger move in the dispense direction.
+
+        .. Note::
+           Over Runze protocol, this is sent as an absolute plunger move.
+
+        """
+        if self.protocol != Protocol.RUNZE:
+            return super().dispense_steps(steps, wait=wait)
+        self.log.debug("Dispensing %.2f [uL] i.e %d [steps].",
+                       self._steps_to_ul(steps), steps)
+        self._move_plunger_absolute(self.driver_steps - steps, wait)
+
+    def move_absolute_in_steps(self, steps: int, wait: bool = True):
+        """Absolute move (in steps)."""
         if (steps > self.max_position_steps) or (steps < 0):
             raise ValueError(f"Requested plunger movement ({steps}) is out of "
-                             f"range [0 - self.max_position_steps].")
-        # No "move-absolute" command exists for this device, so we need to
-        # compute a relative move from accumulated steps tracked in the driver.
-        desired_steps = steps
-        delta_steps = desired_steps - self.driver_steps
-        # Sending a 0-step command results in a ParameterError on the device.
-        if delta_steps == 0:
+                             f"range [0 - {self.max_position_steps}].")
+        if steps == self.driver_steps:
             self.log.debug("Not sending a 0-step movement command to device.")
             return
-        range_percent = steps/self.max_position_steps * 100.0
-        self.log.debug(f"Absolute move to {steps}/"
-                       f"{self.max_position_steps} [steps] "
-                       f"i.e: {range_percent:.2f}% full-scale range.")
-        if delta_steps > 0:
-            self.withdraw_steps(delta_steps, wait=wait)
-        else:
-            self.dispense_steps(abs(delta_steps), wait=wait)
+        self.log.debug("Absolute move to %d/%d [steps] i.e: %.2f%% full-scale "
+                       "range.", steps, self.max_position_steps,
+                       steps / self.max_position_steps * 100.0)
+        if self.protocol != Protocol.RUNZE:  # DT has a move-absolute command.
+            with self._predicting_move(steps - self.driver_steps):
+                self._send_cmd_dt(f"{DTCommands.AbsolutePosition}{steps}",
+                                  wait=wait)
+            self.driver_steps = steps
+            return
+        self._move_plunger_absolute(steps, wait)
+
+    def _move_plunger_absolute(self, steps: int, wait: bool = True):
+        """Send a MovePlungerAbsolute command over Runze protocol."""
+        if (steps > self.max_position_steps) or (steps < 0):
+            raise ValueError(f"Requested plunger movement ({steps}) is out of "
+                             f"range [0 - {self.max_position_steps}].")
+        with self._predicting_move(steps - self.driver_steps):
+            self._send_common_cmd_runze(
+                self.codes.CommonCmd.MovePlungerAbsolute, steps, wait)
+        self.driver_steps = steps
 
     def move_absolute_in_percent(self, percent: float, wait: bool = True):
         """Absolute move (in percent)."""
@@ -75,6 +121,133 @@ class MultiChannelSyringePump(SyringePump):
         steps = round(percent / 100.0 * self.max_position_steps)
         self.move_absolute_in_steps(steps, wait=wait)
 
+    def plan_transfer(self, src_port: Union[str, int],
+                      dst_port: Union[str, int], volume_ul: float,
+                      flow_rate_ul_per_min: float = None) \
+            -> List[Tuple[str, tuple]]:
+        """Return the calls (as ``(method name, args)`` tuples, in order)
+        that move `volume_ul` from `src_port` to `dst_port`.
+
+        Volumes larger than the syringe are split into the fewest strokes
+        that fit the room left in it, evenly, so every stroke runs at the
+        same speed for the same time. Each stroke is a pair of absolute
+        plunger moves: out from the current position and back to it.
+
+        :param src_port: port (or position_map name) to aspirate from.
+        :param dst_port: port (or position_map name) to dispense to.
+        :param volume_ul: volume to move.
+        :param flow_rate_ul_per_min: dispense flow rate. Aspiration runs at
+            the same rate up to `MAX_ASPIRATE_SPEED_PERCENT`. If None, the
+            current speed is kept.
+        """
+        if self.syringe_volume_ul is None:
+            raise ValueError("Syringe volume must be specified to transfer "
+                             "volumes.")
+        if volume_ul <= 0:
+            raise ValueError(f"Transfer volume ({volume_ul} [uL]) must be "
+                             "positive.")
+        src_port = self._to_port(src_port)
+        dst_port = self._to_port(dst_port)
+        steps_per_ul = self.max_position_steps / self.syringe_volume_ul
+        total_steps = round(volume_ul * steps_per_ul)
+        capacity_steps = self.max_position_steps - self.driver_steps
+        if capacity_steps <= 0:
+            raise ValueError("Syringe is full. Dispense before transferring.")
+        stroke_count = ceil(total_steps / capacity_steps)
+        stroke_steps, extra_steps = divmod(total_steps, stroke_count)
+        aspirate_percent = dispense_percent = None
+        if flow_rate_ul_per_min is not None:
+            dispense_percent = self._flow_rate_to_speed_percent(
+                flow_rate_ul_per_min)
+            aspirate_percent = min(dispense_percent,
+                                   self.__class__.MAX_ASPIRATE_SPEED_PERCENT)
+        self.log.debug("Planning a %.2f [uL] transfer from port %d to port %d "
+                       "in %d stroke(s).", volume_ul, src_port, dst_port,
+                       stroke_count)
+        plan = []
+        speed_percent = self.syringe_speed_percent
+        start_steps = self.driver_steps
+        for stroke in range(stroke_count):
+            steps = stroke_steps + (1 if stroke < extra_steps else 0)
+            for percent, port, target_steps in \
+                    ((aspirate_percent, src_port, start_steps + steps),
+                     (dispense_percent, dst_port, start_steps)):
+                if percent is not None and percent != speed_percent:
+                    plan.append(("set_speed_percent", (percent,)))
+                    speed_percent = percent
+                plan.append(("move_valve_to_position", (port,)))
+                plan.append(("move_absolute_in_steps", (target_steps,)))
+        return plan
+
+    def transfer(self, src_port: Union[str, int], dst_port: Union[str, int],
+                 volume_ul: float, flow_rate_ul_per_min: float = None,
+                 wait: bool = True):
+        """Move `volume_ul` from `src_port` to `dst_port` in as many strokes
+        as it takes (see :meth:`plan_transfer`).
+
+        Every valve and plunger move is queued up front, so each one is
+        issued the moment the previous one replies. Over DT protocol, the
+        whole transfer is sent as one command string instead (at the
+        device's current speed).
+
+        :param wait: if True, block until the transfer finishes. Otherwise,
+            return a :class:`~concurrent.futures.Future` that resolves once
+            it does (or is cancelled if a move fails), or None over DT
+            protocol (see :meth:`is_busy`).
+        """
+        if self.protocol != Protocol.RUNZE and flow_rate_ul_per_min is not None:
+            raise NotImplementedError("Flow rate can only be set over Runze "
+                                      "protocol.")
+        plan = self.plan_transfer(src_port, dst_port, volume_ul,
+                                  flow_rate_ul_per_min)
+        if self.protocol != Protocol.RUNZE:
+            return self.run_dt_program(self._plan_to_program(plan), wait=wait)
+        futures = [self.submit(getattr(self, method), *args)
+                   for method, args in plan]
+        if wait:
+            for future in futures:  # Raise the error that stopped the queue.
+                future.result()
+            return None
+        return futures[-1]
+
+    def _plan_to_program(self, plan: List[Tuple[str, tuple]]):
+        """Compile a transfer plan into a DT command string. Repeated strokes
+        become an on-device loop."""
+        strokes = [plan[i:i + 4] for i in range(0, len(plan), 4)]
+        program = Program()
+        # Strokes differ by at most one step. Loop over the identical ones.
+        for stroke_plan, count in self._group_repeats(strokes):
+            with program.repeat(count):
+                for method, (arg,) in stroke_plan:
+                    if method == "move_valve_to_position":
+                        program.valve_port(arg)
+                    else:
+                        program.move_absolute(arg)
+        return program
+
+    @staticmethod
+    def _group_repeats(items: list):
+        """Return (item, count) for each run of equal consecutive items."""
+        groups = []
+        for item in items:
+            if groups and groups[-1][0] == item:
+                groups[-1][1] += 1
+            else:
+                groups.append([item, 1])
+        return [tuple(group) for group in groups]
+
+    def _to_port(self, port: Union[str, int]):
+        """Resolve a port name (via position_map) or number to a number."""
+        if isinstance(port, str):
+            if not self.position_map or port not in self.position_map:
+                raise ValueError(f"Port name ({port}) is not in the position "
+                                 "map.")
+            port = self.position_map[port]
+        if self.position_count is not None \
+                and not 1 <= port <= self.position_count:
+            raise ValueError(f"Port ({port}) is out of range "
+                             f"[1 - {self.position_count}].")
+        return port
 
 
 class SY01B(MultiChannelSyringePump):
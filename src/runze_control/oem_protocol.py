@@ -1,6 +1,8 @@
 """Runze Fluid device codes common across devices."""
 
 from enum import IntEnum
+from functools import reduce
+from runze_control.dt_protocol import DTReply
 
 
 class PacketFields(IntEnum):
@@ -8,3 +10,102 @@ class PacketFields(IntEnum):
     STX = 0x02
     ETX = 0x03
     DEFAULT_SEQUENCE_NUMBER = 0x31
+
+
+SEQUENCE_BASE = 0x30  # Sequence byte without a sequence number or flags.
+SEQUENCE_REPEAT_FLAG = 0x08  # Set when retransmitting a command.
+SEQUENCE_MASK = 0x07
+MAX_SEQUENCE_NUMBER = 7  # Sequence numbers rotate through [1 - 7].
+
+
+def checksum(data: bytes):
+    """XOR of every byte."""
+    return reduce(lambda a, b: a ^ b, data, 0)
+
+
+def next_sequence_number(sequence_number: int):
+    """Return the sequence number that follows `sequence_number`."""
+    return sequence_number % MAX_SEQUENCE_NUMBER + 1
+
+
+def encode_command(address: int, sequence_number: int, cmd_str: str,
+                   execute: bool = True, repeat: bool = False):
+    """Encode a command string addressed to a device.
+
+    :param address: ASCII address of the device (i.e: ``0x31``).
+    :param sequence_number: sequence number [1 - 7] of the command.
+    :param cmd_str: one or more DT commands (i.e: ``"P100D100"``).
+    :param execute: append the execute command so the device runs the
+        string right away.
+    :param repeat: flag the packet as a retransmission. The device replies
+        to it again without executing the command twice.
+    """
+    if not 1 <= sequence_number <= MAX_SEQUENCE_NUMBER:
+        raise ValueError(f"Sequence number ({sequence_number}) is out of "
+                         f"range [1 - {MAX_SEQUENCE_NUMBER}].")
+    sequence = SEQUENCE_BASE | sequence_number
+    if repeat:
+        sequence |= SEQUENCE_REPEAT_FLAG
+    execute_cmd = "R" if execute else ""
+    packet = bytes([PacketFields.STX, address, sequence]) \
+        + f"{cmd_str}{execute_cmd}".encode("ascii") \
+        + bytes([PacketFields.ETX])
+    return packet + bytes([checksum(packet)])
+
+
+def parse_reply(frame: bytes):
+    """Parse a complete reply frame (through the checksum byte). OEM replies
+    carry the same status byte and data as DT replies.
+
+    :raises ValueError: if the frame is malformed or its checksum is wrong.
+    """
+    if len(frame) < 5 or frame[0] != PacketFields.STX \
+            or frame[-2] != PacketFields.ETX:
+        raise ValueError(f"Reply frame is malformed: {frame.hex(' ')}.")
+    if checksum(frame[:-1]) != frame[-1]:
+        raise ValueError(f"Reply checksum is wrong: {frame.hex(' ')}.")
+    return DTReply(frame[2], frame[3:-2].decode("ascii", errors="replace"))
+
+
+class ReplyFramer:
+    """Splits a stream of partial reads into OEM reply frames (STX through
+    the checksum byte after ETX), discarding anything before a frame start
+    (see :class:`runze_control.runze_protocol.ReplyFramer`)."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.resync_count = 0
+        self.discarded_bytes = 0
+        self.stray = bytearray()  # Bytes dropped by the last call to feed().
+
+    @property
+    def buffered_bytes(self):
+        return len(self._buffer)
+
+    def reset(self):
+        self._buffer.clear()
+
+    def feed(self, data: bytes):
+        """Add newly received bytes and return a list of the complete frames
+        (as bytes) that they finish, in order of arrival."""
+        buffer = self._buffer
+        buffer += data
+        self.stray.clear()
+        frames = []
+        while True:
+            start = buffer.find(PacketFields.STX)
+            if start != 0:
+                discard = len(buffer) if start < 0 else start
+                if discard:
+                    self.resync_count += 1
+                    self.discarded_bytes += discard
+                    self.stray += buffer[:discard]
+                    del buffer[:discard]
+                if start < 0:
+                    break
+            end = buffer.find(PacketFields.ETX)
+            if end < 0 or end + 1 >= len(buffer):  # Wait for the checksum.
+                break
+            frames.append(bytes(buffer[:end + 2]))
+            del buffer[:end + 2]
+        return frames
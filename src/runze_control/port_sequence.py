@@ -0,0 +1,130 @@
+"""Orderings of valve port visits that minimize rotor travel."""
+from runze_control.multichannel_syringe_pump import MultiChannelSyringePump
+from runze_control.rotary_valve import RotaryValve, Rotation, rotation_table
+from runze_control.sv_device_codes import SV07_DEAD_VOLUME_UL
+from typing import Callable, Iterable, List, NamedTuple, Tuple, Union
+
+MOVE_OVERHEAD_S = 0.02  # Command round trip per valve move (about one query
+                        # at 9600[bps]).
+
+Valve = Union[RotaryValve, MultiChannelSyringePump]
+
+
+class PortVisitPlan(NamedTuple):
+    """Order to visit a set of ports in, and what it costs."""
+    start_port: int
+    ports: Tuple[int, ...]  # Ports in the order to visit them.
+    rotations: Tuple[Rotation, ...]  # Rotor travel to reach each port.
+    flush_count: int  # Visits that draw a new line's fluid into the valve.
+    flush_volume_ul: Union[float, None]  # Dead volume flushed by all of
+                                         # them (None if unknown).
+    duration_s: float  # Estimated time for every move and dwell.
+
+    @property
+    def travel_ports(self):
+        """Total ports the rotor passes."""
+        return sum(r.ports for r in self.rotations)
+
+
+def plan_port_visits(valve: Valve, ports: Iterable[Union[str, int]],
+                     start: Union[str, int] = None, dwell_s: float = 0,
+                     dead_volume_ul: float = None,
+                     optimize: bool = True) -> PortVisitPlan:
+    """Order visits to a set of ports (whose order doesn't matter, i.e: to
+    prime or wash every line) so the rotor travels as little as possible.
+
+    .. code-block:: python
+
+        plan = plan_port_visits(pump, range(1, 13))
+        print(f"{plan.ports}: {plan.travel_ports} ports, "
+              f"~{plan.duration_s:.1f}[s]")
+
+    Repeated ports are visited once. On a ring of ports, the shortest route
+    sweeps one way to some port, then (at most once) turns back past the
+    start to reach the rest, so every such turning point is tried.
+
+    :param valve: a :class:`RotaryValve` or a
+        :class:`MultiChannelSyringePump` (i.e: SY01B) with a
+        `position_count`.
+    :param ports: port numbers or position_map names.
+    :param start: port the rotor starts at. Queried from the valve if None.
+    :param dwell_s: time spent at each port (i.e: to prime its line).
+    :param dead_volume_ul: port-to-port dead volume, flushed once per visit.
+        Defaults to the SV07's for a :class:`RotaryValve` with its port
+        count.
+    :param optimize: if False, visit ports in the order given (to compare
+        against).
+    """
+    position_count = valve.position_count
+    if position_count is None:
+        raise ValueError("Position count must be specified to plan port "
+                         "visits.")
+    start_port = _current_port(valve) if start is None \
+        else valve._to_port(start)
+    targets = list(dict.fromkeys(valve._to_port(p) for p in ports))
+    rotations = rotation_table(position_count)
+    if optimize:
+        order = _shortest_order(start_port, targets, position_count)
+    else:
+        order = targets
+    legs = tuple(rotations[a][b]
+                 for a, b in zip([start_port] + order[:-1], order))
+    # The valve already holds the start port's fluid.
+    flush_count = sum(1 for leg in legs if leg.ports)
+    if dead_volume_ul is None and isinstance(valve, RotaryValve):
+        dead_volume_ul = SV07_DEAD_VOLUME_UL.get(position_count)
+    flush_volume_ul = None if dead_volume_ul is None \
+        else flush_count * dead_volume_ul
+    seconds_per_port = valve.SECONDS_PER_PORT \
+        if isinstance(valve, RotaryValve) else valve.VALVE_SECONDS_PER_PORT
+    duration_s = sum(leg.ports * seconds_per_port + MOVE_OVERHEAD_S
+                     for leg in legs if leg.ports) + dwell_s * len(order)
+    return PortVisitPlan(start_port, tuple(order), legs, flush_count,
+                         flush_volume_ul, duration_s)
+
+
+def visit_ports(valve: Valve, ports: Iterable[Union[str, int]],
+                at_port: Callable[[int], None] = None,
+                **kwargs) -> PortVisitPlan:
+    """Plan visits to a set of ports, then move to each one in turn.
+
+    :param at_port: called with each port once the valve reaches it (i.e:
+        to aspirate and dispense to prime its line).
+    :param kwargs: passed to :func:`plan_port_visits`.
+    """
+    plan = plan_port_visits(valve, ports, **kwargs)
+    for port in plan.ports:
+        if isinstance(valve, RotaryValve):
+            valve.move_to_position(port)
+        else:
+            valve.move_valve_to_position(port)
+        if at_port is not None:
+            at_port(port)
+    return plan
+
+
+def _current_port(valve: Valve):
+    if isinstance(valve, RotaryValve):
+        return valve._position if valve._position is not None \
+            else valve.get_position()
+    return valve.get_valve_position()
+
+
+def _shortest_order(start_port: int, ports: List[int], position_count: int):
+    """Visit order with the least total travel, each move taking the
+    shorter way around."""
+    rotations = rotation_table(position_count)
+    # Order targets clockwise from the start.
+    ahead = sorted(ports, key=lambda p: (p - start_port) % position_count)
+    best_order, best_cost = None, None
+    # Visit the first `split` targets clockwise and the rest
+    # counterclockwise, going either way first.
+    for split in range(len(ahead) + 1):
+        clockwise, counterclockwise = ahead[:split], ahead[split:][::-1]
+        for order in (clockwise + counterclockwise,
+                      counterclockwise + clockwise):
+            cost = sum(rotations[a][b].ports
+                       for a, b in zip([start_port] + order[:-1], order))
+            if best_cost is None or cost < best_cost:
+                best_order, best_cost = order, cost
+    return best_order
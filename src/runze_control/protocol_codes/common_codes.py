@@ -11,6 +11,11 @@ class CommonCmd(IntEnum):
     GetCanDestinationAddress = 0x30
     GetFirmwareVersion = 0x3F
 
+    GetMulticastChannel1Address = 0x70
+    GetMulticastChannel2Address = 0x71
+    GetMulticastChannel3Address = 0x72
+    GetMulticastChannel4Address = 0x73
+
 
 class FactoryCmd(IntEnum):
     """Codes for specifying the states of various calibration settings."""
@@ -1,12 +1,27 @@
-"""Protocol codes exclusive to SY01B multichannel Syringe Pumps."""
+"""Protocol codes exclusive to (SV series) Rotary Valves."""
 from enum import IntEnum
 from itertools import chain
 from runze_control.protocol_codes.common_codes import CommonCmd as RunzeCommonCmd
 
 
 class RotaryValveCommonCmd(IntEnum):
-    pass
-    # FIXME: add these!
+    """Codes to issue when querying/specifying the states of various settings
+       via a Common Command frame."""
+    # Queries
+    # Cmds 0x20 - 0x23 come from RunzeCommonCmd
+    GetPowerOnResetState = 0x2E
+    GetCurrentChannelAddress = 0x3E  # Port the rotor is at [1-N].
+    GetMotorStatus = 0x4A
+    # Commands
+    MoveToPort = 0x44  # Move the rotor to the port specified by B4 along the
+                       # path the device picks.
+    Reset = 0x45  # Move the rotor to its reset (origin) position and stop.
+    ForceStop = 0x49  # Immediately stop moving the rotor.
+    MoveClockwiseToPort = 0xA4  # Move the rotor to the port specified by B4
+                                # in the clockwise direction.
+    MoveCounterclockwiseToPort = 0xA5  # Move the rotor to the port specified
+                                       # by B4 in the counterclockwise
+                                       # direction.
 
 # FIXME: we should be doing dict-like updates here so that later cmds with
 #   the same name overwrite the previous cmd since we are building these
@@ -21,10 +21,6 @@ class SyringePumpCommonCmd(IntEnum):
     GetSyringePosition = 0x66 # TODO: validate that this works on SY01B
     SynchronizeSyringePosition = 0x67  # This is a query?
 
-    GetMulticastChannel1Address = 0x70
-    GetMulticastChannel2Address = 0x71
-    GetMulticastChannel3Address = 0x72
-    GetMulticastChannel4Address = 0x73
     # Commands
     RunInCW = 0x42  # Dispense. (i.e: move relative)
     # RunInCCW --> depends on model.
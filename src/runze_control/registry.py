@@ -0,0 +1,134 @@
+"""On-disk cache of how to reach each known device."""
+from pathlib import Path
+from serial.tools import list_ports
+from threading import Lock
+from typing import Union
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def get_usb_serial_number(com_port: str):
+    """Return the USB serial number of the adapter behind `com_port` or None
+    if it isn't a USB device (or doesn't report one)."""
+    for port_info in list_ports.comports():
+        if port_info.device == com_port:
+            return port_info.serial_number
+    return None
+
+
+class DeviceRegistry:
+    """JSON file of connection settings (baud rate, address, protocol, model,
+    syringe volume, etc.) for every device seen so far.
+
+    Entries are keyed by the USB serial number of the adapter a device is
+    plugged into (when it has one) so they survive ports being renumbered.
+    Otherwise, they are keyed by port name. Several devices can share a port
+    at distinct addresses.
+
+    Device classes can connect from a registry with a single verification
+    query instead of probing every baud rate:
+
+    .. code-block:: python
+
+        registry = DeviceRegistry()
+        pump = SY08.from_registry(registry, "/dev/ttyUSB0",
+                                  syringe_volume_ul=25000)
+
+    """
+
+    VERSION = 1
+    DEFAULT_PATH = Path.home() / ".runze_control" / "devices.json"
+    # Device attributes cached per entry (when the device has them).
+    SETTINGS = ("baudrate", "address", "protocol", "syringe_volume_ul",
+                "position_count")
+
+    def __init__(self, path: Union[str, Path] = None):
+        self.path = Path(path) if path is not None else self.DEFAULT_PATH
+        self._lock = Lock()
+        self._entries = self._load()
+
+    def lookup(self, com_port: str, address: int = None):
+        """Return the cached entry (a dict) for the device on `com_port` (at
+        `address` if specified) or None if there isn't exactly one match."""
+        matches = [e for e in self._matching_entries(com_port)
+                   if address is None or e["address"] == address]
+        return matches[0] if len(matches) == 1 else None
+
+    def record(self, device):
+        """Cache the settings of a connected :class:`RunzeDevice`."""
+        com_port = device.bus.com_port
+        entry = \
+        {
+            "port": com_port,
+            "usb_serial_number": get_usb_serial_number(com_port),
+            "model": device.__class__.__name__,
+            "baudrate": device.bus.baudrate,
+            "address": device.address,
+            "protocol": str(device.protocol.value),
+            "syringe_volume_ul": getattr(device, "syringe_volume_ul", None),
+            "position_count": getattr(device, "position_count", None),
+        }
+        with self._lock:
+            self._entries = [e for e in self._entries
+                             if not self._same_device(e, entry)]
+            self._entries.append(entry)
+            self._save()
+        return entry
+
+    def forget(self, com_port: str, address: int = None):
+        """Remove the cached entries for `com_port` (at `address` if
+        specified)."""
+        with self._lock:
+            stale = [e for e in self._matching_entries(com_port)
+                     if address is None or e["address"] == address]
+            self._entries = [e for e in self._entries if e not in stale]
+            self._save()
+
+    def entries(self):
+        return [dict(e) for e in self._entries]
+
+    def _matching_entries(self, com_port: str):
+        usb_serial_number = get_usb_serial_number(com_port)
+        if usb_serial_number is not None:
+            matches = [e for e in self._entries
+                       if e["usb_serial_number"] == usb_serial_number]
+            if matches:
+                return matches
+        return [e for e in self._entries
+                if e["port"] == com_port and e["usb_serial_number"] is None]
+
+    @staticmethod
+    def _same_device(a: dict, b: dict):
+        if a["address"] != b["address"]:
+            return False
+        if a["usb_serial_number"] is not None or b["usb_serial_number"] is not None:
+            return a["usb_serial_number"] == b["usb_serial_number"]
+        return a["port"] == b["port"]
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                contents = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable device registry {self.path}: "
+                           f"{e}")
+            return []
+        if contents.get("version") != self.VERSION:
+            logger.warning(f"Ignoring device registry {self.path} with "
+                           f"unsupported version: {contents.get('version')}.")
+            return []
+        return contents["devices"]
+
+    def _save(self):
+        """Write the registry atomically so a crash can't leave it corrupt."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.VERSION, "devices": self._entries}, f,
+                      indent=2)
+        os.replace(tmp_path, self.path)
@@ -1,29 +1,205 @@
 """Rotary Valve driver"""
 from __future__ import annotations
+from functools import lru_cache
+from runze_control.dt_protocol import Commands as DTCommands
 from runze_control.protocol import Protocol
+from runze_control.runze_bus import RunzeBus
 from runze_control.runze_device import RunzeDevice
+from runze_control.runze_protocol import ReplyStatus
 from runze_control.protocol_codes import rotary_valve_codes
-from typing import Union
+from typing import NamedTuple, Optional, Tuple, Union
+
+
+class Rotation(NamedTuple):
+    """Rotor travel from one port to another."""
+    ports: int  # Ports passed on the way (0 if already there).
+    clockwise: bool
+
+
+@lru_cache(maxsize=None)
+def rotation_table(position_count: int) -> Tuple[Tuple[Rotation, ...], ...]:
+    """Shortest rotation between every pair of ports on a valve, indexed by
+    [from port][to port] (1-indexed; row and column 0 are unused).
+
+    Ports are numbered in the clockwise direction. Ties (halfway around) go
+    clockwise. Built once per port count.
+    """
+    if position_count < 2:
+        raise ValueError(f"Position count ({position_count}) must be at "
+                         "least 2.")
+    table = [()]
+    for src in range(1, position_count + 1):
+        row = [None]
+        for dst in range(1, position_count + 1):
+            clockwise_ports = (dst - src) % position_count
+            counterclockwise_ports = position_count - clockwise_ports
+            if clockwise_ports <= counterclockwise_ports:
+                row.append(Rotation(clockwise_ports, True))
+            else:
+                row.append(Rotation(counterclockwise_ports, False))
+        table.append(tuple(row))
+    return tuple(table)
 
 
 class RotaryValve(RunzeDevice):
 
-    def __init__(self, com_port: str, baudrate: int = None, address: int = 0x31,
+    SECONDS_PER_PORT = 0.05  # Nominal rotor travel time between adjacent
+                             # ports.
+
+    def __init__(self, com_port: Union[str, RunzeBus], baudrate: int = None,
+                 address: int = 0x31,
                  protocol: Union[str, Protocol] = Protocol.RUNZE,
                  position_count: int = None, position_map: dict = None):
+        """Init.
+
+        :param position_count: number of ports. Required to plan the
+            shortest rotation between ports. Without it, the device picks
+            the path.
+        :param position_map: optional port names (i.e: ``{"waste": 1}``)
+            that can be used wherever a port number can.
+        """
         # Pass along unused kwargs to satisfy diamond inheritance.
         super().__init__(com_port=com_port, baudrate=baudrate,
                          address=address, protocol=protocol)
         self.codes = rotary_valve_codes
         self.position_count = position_count
         self.position_map = position_map
+        self.rotations = None if position_count is None \
+            else rotation_table(position_count)
+        self._position = None  # Port the rotor is at (or is moving to), if
+                               # known.
+
+    def get_position(self):
+        """Return the port the rotor is at."""
+        self.log.debug("Querying valve position.")
+        if self.protocol != Protocol.RUNZE:
+            reply = self._send_query_dt(DTCommands.QueryValvePosition)
+            self._position = int(reply.data)
+        else:
+            reply = self._send_query_runze(
+                self.codes.CommonCmd.GetCurrentChannelAddress)
+            self._position = reply.parameter
+        return self._position
+
+    def plan_rotation(self, position: Union[str, int]) -> Optional[Rotation]:
+        """Return the shortest rotation from the current port to `position`
+        (querying the current port if it isn't known). Return None if the
+        rotor isn't at a port (i.e: after a reset or a forced stop)."""
+        if self.rotations is None:
+            raise ValueError("Position count must be specified to plan "
+                             "rotations.")
+        port = self._to_port(position)
+        current = self._position if self._position is not None \
+            else self.get_position()
+        if not 1 <= current <= self.position_count:
+            self._position = None
+            return None
+        return self.rotations[current][port]
+
+    def move_to_position(self, position: Union[str, int], wait: bool = True):
+        """Move to a port by whichever direction passes the fewest ports.
+
+        :param position: port number or position_map name.
+        :param wait: if False, return once the command is sent. Complete the
+            move later with :meth:`wait_for_reply` (or
+            :meth:`wait_until_idle`).
+        """
+        port = self._to_port(position)
+        if self.rotations is None:  # Let the device pick the path.
+            self.log.debug("Moving to port %s.", port)
+            self._move(port, None, wait)
+            return
+        rotation = self.plan_rotation(port)
+        if rotation is None:  # Not at a port. Let the device pick the path.
+            self.log.debug("Moving to port %s from an unknown port.", port)
+            self._move(port, None, wait)
+            return
+        if rotation.ports == 0:
+            self.log.debug("Already at port %s.", port)
+            return
+        self.log.debug("Moving to port %s (%s ports %s).", port,
+                       rotation.ports,
+                       "clockwise" if rotation.clockwise
+                       else "counterclockwise")
+        self._move(port, rotation.clockwise, wait)
+
+    def move_clockwise_to_position(self, position: Union[str, int],
+                                   wait: bool = True):
+        self._move(self._to_port(position), True, wait)
+
+    def move_counterclockwise_to_position(self, position: Union[str, int],
+                                          wait: bool = True):
+        self._move(self._to_port(position), False, wait)
+
+    def get_motor_status(self):
+        self.log.debug("Querying motor status.")
+        reply = self._send_query_runze(self.codes.CommonCmd.GetMotorStatus)
+        return reply.parameter
+
+    def is_busy(self):
+        if self.protocol != Protocol.RUNZE:
+            return super().is_busy()
+        if super().is_busy():
+            return True
+        return self.get_motor_status() == ReplyStatus.MotorBusy
+
+    def wait_for_reply(self, force: bool = False):
+        try:
+            return super().wait_for_reply(force=force)
+        except RuntimeError:
+            self._position = None  # The move may not have finished.
+            raise
+
+    def reset_valve_position(self, wait: bool = True):
+        """Move the rotor to its reset position."""
+        self._position = None
+        if self.protocol != Protocol.RUNZE:
+            raise NotImplementedError("Valve reset is only supported over "
+                                      "Runze protocol.")
+        self._send_common_cmd_runze(self.codes.CommonCmd.Reset, wait=wait)
 
+    def force_stop(self):
+        """Halt the rotor. (It may stop between ports.)"""
+        self.log.debug("Halting.")
+        self._position = None
+        if self.protocol != Protocol.RUNZE:
+            self.terminate_dt_program()
+            return
+        self._send_common_cmd_runze(self.codes.CommonCmd.ForceStop,
+                                    wait=True, force=True)
 
-    def move_to_position(self, position: Union[str, int]):
-        pass
+    def halt(self):
+        return self.force_stop()
 
-    def move_clockwise_to_position(self, position: Union[str, int]):
-        pass
+    def _move(self, port: int, clockwise: Union[bool, None], wait: bool):
+        """Move to `port` clockwise, counterclockwise, or (if `clockwise` is
+        None) along the path the device picks."""
+        self._position = None  # Unknown until the move is issued.
+        if self.protocol != Protocol.RUNZE:
+            if clockwise is False:
+                cmd = DTCommands.ValvePortCounterclockwise
+            else:
+                cmd = DTCommands.ValvePort
+            self._send_cmd_dt(f"{cmd}{port}", wait=wait)
+        else:
+            if clockwise is None:
+                func = self.codes.CommonCmd.MoveToPort
+            elif clockwise:
+                func = self.codes.CommonCmd.MoveClockwiseToPort
+            else:
+                func = self.codes.CommonCmd.MoveCounterclockwiseToPort
+            self._send_common_cmd_runze(func, port, wait=wait)
+        self._position = port
 
-    def move_counterclockwise_to_position(self, position: Union[str, int]):
-        pass
+    def _to_port(self, port: Union[str, int]):
+        """Resolve a port name (via position_map) or number to a number."""
+        if isinstance(port, str):
+            if not self.position_map or port not in self.position_map:
+                raise ValueError(f"Port name ({port}) is not in the position "
+                                 "map.")
+            port = self.position_map[port]
+        if self.position_count is not None \
+                and not 1 <= port <= self.position_count:
+            raise ValueError(f"Port ({port}) is out of range "
+                             f"[1 - {self.position_count}].")
+        return port
@@ -0,0 +1,303 @@
+"""Serial bus shared by one or more Runze devices."""
+from collections import deque
+from runze_control.protocol import Protocol
+from runze_control import dt_protocol, oem_protocol, runze_protocol
+from runze_control.trace import FrameTrace, RX, STRAY, TX
+from serial import Serial, SerialException
+from threading import Condition, Lock
+from time import perf_counter
+from typing import Union
+import logging
+import select
+
+
+class RunzeBus:
+    """A serial port (RS232 or RS485) shared by one or more Runze devices.
+
+    The bus owns the port, serializes access to it, and routes each reply
+    to the device that issued the command via the reply's address field.
+    Devices on the same RS485 segment can then be driven from one process
+    (and from several threads) without fighting over the port.
+
+    .. code-block:: python
+
+        bus = RunzeBus("/dev/ttyUSB0", 9600)
+        pump_a = SY08(bus, address=0x00, syringe_volume_ul=25000)
+        pump_b = SY08(bus, address=0x01, syringe_volume_ul=25000)
+
+    """
+
+    READ_CHUNK_SIZE = 4096  # Max bytes to pull from the port per read.
+
+    def __init__(self, com_port: Union[str, Serial], baudrate: int = 9600,
+                 protocol: Union[str, Protocol] = Protocol.RUNZE):
+        """Init. Open the port.
+
+        :param com_port: com port to open, or an already-open Serial-like
+            object to take ownership of.
+        :param baudrate: port baud rate. Ignored if `com_port` is already
+            open.
+        :param protocol: protocol every device on the bus communicates in.
+            Determines how replies are framed.
+
+            .. note::
+               DT and OEM Protocol replies all come from the host address,
+               so they cannot be routed by address. Devices sharing a DT or
+               OEM bus must take turns issuing commands.
+
+        """
+        self.protocol = Protocol(protocol)
+        if self.protocol == Protocol.RUNZE:
+            framer = runze_protocol.ReplyFramer()
+        elif self.protocol == Protocol.DT:
+            framer = dt_protocol.ReplyFramer()
+        else:
+            framer = oem_protocol.ReplyFramer()
+        if isinstance(com_port, str):
+            self.com_port = com_port
+            self.ser = Serial(com_port, baudrate, timeout=0)
+        else:
+            self.ser = com_port
+            self.com_port = getattr(com_port, "port", None) or repr(com_port)
+        self.log = logging.getLogger(f"{self.__class__.__name__}.{self.com_port}")
+        self._lock = Lock()
+        self._reply_ready = Condition(self._lock)
+        self._reading = False  # True while a thread is blocked on the port.
+        self._pollable = True  # True if we can block on the port with select.
+        self._framer = framer
+        self._replies = deque()  # (frame, first byte time [s], complete
+                                 # time [s]) in order of arrival.
+        self._partial_since_s = None  # Arrival time of a partial frame.
+        # Arrival times of the last reply delivered from each address:
+        # address -> (first byte time [s], complete time [s]).
+        self.reply_times = {}
+        self.trace = None  # FrameTrace of the port's traffic if enabled.
+        self.capture = None  # CaptureWriter recording frames if enabled.
+
+    @property
+    def resync_count(self):
+        """Number of times stray bytes were discarded to realign replies."""
+        return self._framer.resync_count
+
+    @property
+    def baudrate(self):
+        return self.ser.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate: int):
+        with self._lock:
+            self.ser.baudrate = baudrate
+
+    def reset_buffers(self):
+        """Discard any unread bytes and undelivered replies."""
+        with self._lock:
+            self.ser.reset_input_buffer()
+            self.ser.reset_output_buffer()
+            self._framer.reset()
+            self._replies.clear()
+            self._partial_since_s = None
+
+    def enable_trace(self, capacity: int = 4096):
+        """Start recording every byte written and read into a
+        :class:`~runze_control.trace.FrameTrace` and return it."""
+        self.trace = FrameTrace(capacity)
+        return self.trace
+
+    def disable_trace(self):
+        self.trace = None
+
+    def start_capture(self, path: str, flush_interval_s: float = 1.0):
+        """Record every frame sent and received to a capture file (see
+        :mod:`runze_control.capture`) and return its
+        :class:`~runze_control.capture.CaptureWriter`."""
+        from runze_control.capture import CaptureWriter
+        with self._lock:
+            if self.capture is not None:
+                self.capture.close()
+            self.capture = CaptureWriter(path, flush_interval_s)
+            return self.capture
+
+    def stop_capture(self):
+        with self._lock:
+            if self.capture is not None:
+                self.capture.close()
+            self.capture = None
+
+    def close(self):
+        self.stop_capture()
+        self.ser.close()
+
+    def write(self, packet: bytes):
+        """Write a packet to the port."""
+        with self._lock:
+            self.ser.write(packet)
+            if self.trace is not None:
+                self.trace.record(TX, packet)
+            if self.capture is not None:
+                self.capture.write_frame(TX, packet)
+
+    def get_reply(self, address: int = None, timeout_s: float = 0,
+                  protocol: Protocol = None):
+        """Return the oldest reply from the device at `address` (or from any
+        device if `address` is None), waiting up to `timeout_s` for it to
+        arrive. Return an empty reply if none arrives in time.
+
+        Replies addressed to other devices are held for them. Only one
+        thread reads from the port at a time; the others sleep until it
+        delivers a reply.
+        """
+        if protocol is not None and protocol != self.protocol:
+            raise ValueError(f"Cannot read {protocol} protocol replies from a "
+                             f"{self.protocol} protocol bus.")
+        deadline_s = perf_counter() + timeout_s
+        final_read_done = False
+        with self._reply_ready:
+            while True:
+                reply = self._pop_reply(address)
+                if reply is not None:
+                    return reply
+                remaining_s = deadline_s - perf_counter()
+                if self._reading:  # Another thread is reading. Let it.
+                    if remaining_s <= 0:
+                        return bytes()
+                    self._reply_ready.wait(remaining_s)
+                    continue
+                if final_read_done:
+                    return bytes()
+                final_read_done = remaining_s <= 0
+                # Become the reader. Release the lock while blocking so that
+                # other threads can still write to the port.
+                self._reading = True
+                self._lock.release()
+                try:
+                    data = self._read(self.READ_CHUNK_SIZE, remaining_s)
+                except SerialException:
+                    data = bytes()
+                finally:
+                    self._lock.acquire()
+                    self._reading = False
+                self._queue_replies(data)
+                self._reply_ready.notify_all()
+
+    def poll(self):
+        """Read whatever bytes have arrived without blocking and queue any
+        complete replies. Return the number of replies waiting for delivery.
+
+        Intended for event loops that are told when the port is readable.
+        """
+        with self._reply_ready:
+            if not self._reading:
+                try:
+                    self._queue_replies(self.ser.read(self.READ_CHUNK_SIZE))
+                except SerialException:
+                    pass
+                self._reply_ready.notify_all()
+            return len(self._replies)
+
+    def pop_reply(self, address: int = None):
+        """Remove and return the oldest queued reply from `address` (or any
+        address if None) without reading the port. Return None if there
+        isn't one."""
+        with self._lock:
+            return self._pop_reply(address)
+
+    def discard_replies(self, address: int = None, timeout_s: float = 0):
+        """Drop every queued reply from `address` (or from any address if
+        None), and any more that arrive within `timeout_s`. Return the number
+        of replies dropped.
+
+        Used to clear out replies that can no longer be matched to the
+        command that caused them (i.e: a late reply to a retransmitted OEM
+        Protocol command).
+        """
+        deadline_s = perf_counter() + timeout_s
+        count = 0
+        while self.get_reply(address, max(0, deadline_s - perf_counter())):
+            count += 1
+        if count:
+            self.log.debug("Discarded %d stale repl%s.", count,
+                           "y" if count == 1 else "ies")
+        return count
+
+    def _pop_reply(self, address: int = None):
+        """Remove and return the oldest reply from `address` (or any address
+        if None). Return None if there isn't one."""
+        for index, (reply, first_byte_time_s, complete_time_s) \
+                in enumerate(self._replies):
+            if address is None or reply[1] == address:
+                del self._replies[index]
+                self.reply_times[reply[1]] = (first_byte_time_s,
+                                              complete_time_s)
+                return reply
+        return None
+
+    def _queue_replies(self, data: bytes):
+        """Frame newly received bytes and queue any complete replies."""
+        if not data:
+            return
+        if self.trace is not None:
+            self.trace.record(RX, data)
+        now_s = perf_counter()
+        framer = self._framer
+        first_byte_time_s = self._partial_since_s \
+            if framer.buffered_bytes and self._partial_since_s is not None \
+            else now_s
+        resync_count = framer.resync_count
+        frames = framer.feed(data)
+        if self.capture is not None and framer.stray:
+            self.capture.write_frame(STRAY, framer.stray)
+        for frame in frames:
+            self._replies.append((frame, first_byte_time_s, now_s))
+            if self.capture is not None:
+                self.capture.write_frame(RX, frame)
+            first_byte_time_s = now_s  # Later frames started in this read.
+        # Hand corrupted replies to whoever waits on their address so that
+        # parsing them fails right away instead of timing out.
+        for frame in getattr(framer, "corrupted", ()):
+            self.log.warning("Corrupted reply (hex): %s", frame.hex(' '))
+            self._replies.append((frame, first_byte_time_s, now_s))
+            if self.capture is not None:
+                self.capture.write_frame(RX, frame)
+        self._partial_since_s = now_s if framer.buffered_bytes else None
+        if self._framer.resync_count != resync_count:
+            self.log.debug("Discarded stray bytes to resynchronize. "
+                           "(Total resyncs: %d.)", self._framer.resync_count)
+
+    def _wait_for_input(self, timeout_s: float):
+        """Block until the port has bytes to read or `timeout_s` elapses.
+        Return True if bytes are waiting.
+
+        Waiting happens in the kernel (via select on the port's file
+        descriptor) so that long syringe moves don't consume a CPU core.
+        """
+        if timeout_s <= 0:
+            return False
+        if self._pollable:
+            try:
+                readable, _, _ = select.select([self.ser], [], [], timeout_s)
+                return bool(readable)
+            except (OSError, ValueError):
+                # Port has no selectable file descriptor (i.e: Windows).
+                self._pollable = False
+        return False
+
+    def _read(self, num_bytes: int, timeout_s: float = 0):
+        """Read up to `num_bytes`, waiting up to `timeout_s` for the first
+        byte to arrive. Return immediately with what is available otherwise.
+        """
+        if timeout_s <= 0 or self.ser.in_waiting:
+            return self.ser.read(num_bytes)
+        if self._pollable:
+            ready = self._wait_for_input(timeout_s)
+            if self._pollable:  # Port was selectable.
+                return self.ser.read(num_bytes) if ready else bytes()
+        # No file descriptor to wait on. Apply a serial timeout to the first
+        # byte instead, then collect whatever else has arrived.
+        self.ser.timeout = timeout_s
+        try:
+            reply = self.ser.read(1)
+        finally:
+            self.ser.timeout = 0
+        if not reply:
+            return reply
+        return reply + self.ser.read(num_bytes - 1)
@@ -1,16 +1,20 @@
 """Syringe Pump Driver."""
-from functools import reduce, wraps
+from functools import wraps
 from runze_control.protocol_codes import common_codes
 from runze_control.protocol import *
 from runze_control.runze_protocol import FACTORY_CMD_PWD_CODE
 from runze_control import runze_protocol
 from runze_control import dt_protocol
 from runze_control import oem_protocol
+from runze_control.runze_bus import RunzeBus
+from runze_control.command_queue import CommandQueue
+from runze_control.metrics import DeviceMetrics, FACTORY_KEY_FLAG
+from runze_control.registry import DeviceRegistry
 from serial import Serial, SerialException
 from typing import Union
-from time import perf_counter
+from time import perf_counter, sleep
+import inspect
 import logging
-import struct
 
 logger = logging.getLogger(__name__)
 
@@ -43,22 +47,32 @@ class RunzeDevice:
     VALID_BAUDRATES = \
     {
         Protocol.DT: [9600, 38400],
+        Protocol.OEM: [9600, 38400],
         Protocol.RUNZE: [9600, 19200, 38400, 57600, 115200]
     }
 
     RUNZE_DEFAULT_ADDRESS = 0x00 # max: 127 (128 devices).
     ASCII_DEFAULT_ADDRESS = 0x31 # ASCII: '0' max: 0x3F (16 devices).
-
-    def __init__(self, com_port: str, baudrate: int = None,
+    ASCII_ADDRESS_RANGE = (0x31, 0x3F)  # ASCII: '1' through '?'.
+    MULTICAST_CHANNELS = (1, 2, 3, 4)
+    POLL_INTERVAL_S = 0.05  # Time between status checks while waiting for a
+                            # DT Protocol command to finish.
+    OEM_REPLY_TIMEOUT_S = 0.1  # Time to wait for an OEM Protocol reply
+                               # before retransmitting the command.
+    OEM_MAX_RETRANSMISSIONS = 3
+
+    def __init__(self, com_port: Union[str, RunzeBus], baudrate: int = None,
                  address: Union[int, str] = None,
                  protocol: Union[str, Protocol] = Protocol.RUNZE):
         """Init. Connect to a device with the specified address via an
            RS232 or RS485 interface.
 
-        :param com_port: com port to connect to.
+        :param com_port: com port to connect to, or a :class:`RunzeBus` shared
+            with other devices on the same RS485 segment.
         :param baudrate: device baud rate. Factory default is 9600, but can be
             changed to standard baud rates up through 115200bps via serial
-            command.
+            command. Ignored (and inferred) if connecting through a shared
+            bus.
 
             .. note::
                Runze Protocol and ASCII Protocol have different valid baud
@@ -69,7 +83,7 @@ class RunzeDevice:
             .. note::
                In Runze Protocol under an RS232 connection, this value can
                be omitted (left as None), and the device will discover it
-               automatically.
+               automatically. It must be specified on a shared bus.
 
             .. warning::
                 Runze and ASCII protocols have distinct valid addresses and
@@ -82,22 +96,58 @@ class RunzeDevice:
                corresponds to device 1 at Runze protocol address 0 or ASCII
                protocol address '1'.
 
+            .. note::
+               In DT protocol, the address can be given as its character
+               (i.e: ``'1'``) or character code (i.e: ``0x31``). It defaults
+               to ``'1'`` since DT protocol cannot discover it.
+
         :param protocol: protocol over which to send commands to the device
-            ("RUNZE" or "DT" [aka: ASCII]). Protocol must match the one
+            ("RUNZE", "DT" [aka: ASCII], or "OEM" [DT commands in checksummed
+            packets]). Protocol must match the one
             specified on the device, but it can be changed after connecting to
             it.
 
         """
-        self.address = address
         self.protocol = Protocol(protocol)
-        self.ser = None
-        logger_name = self.__class__.__name__ + (f".{com_port}")
+        if self.protocol != Protocol.RUNZE:
+            address = self._to_ascii_address(address)
+        self._oem_sequence_number = oem_protocol.MAX_SEQUENCE_NUMBER
+        self.oem_retransmissions = 0  # OEM commands resent for lost replies.
+        self.address = address
+        # Use the shared bus if we were given one. Otherwise, open our own.
+        self._owns_bus = not isinstance(com_port, RunzeBus)
+        self.bus = None if self._owns_bus else com_port
+        if not self._owns_bus:
+            port_name = com_port.com_port
+        elif isinstance(com_port, str):
+            port_name = com_port
+        else:  # An open Serial-like port.
+            port_name = getattr(com_port, "port", None) or repr(com_port)
+        logger_name = self.__class__.__name__ + (f".{port_name}")
         self._timeout_s = self.__class__.DEFAULT_TIMEOUT_S
         self.log = logging.getLogger(logger_name)
         self.codes = common_codes  # Can be overwritten in child class.
         self.cmd_send_time_s = None # Time last command was sent to the device
                                     # before reply was received or None if no
                                     # issued command is waiting for a reply.
+        self._reply_from_any_address = False
+        self.cmd_queue = None  # Created on first submit().
+        self.metrics = DeviceMetrics()
+        self._tx_buffer = bytearray(runze_protocol.COMMON_FRAME.size)  # Reused
+                                                    # for every common frame.
+        if not self._owns_bus:
+            if address is None:
+                raise ValueError("Device address must be specified when "
+                                 "connecting through a shared bus.")
+            if self.bus.protocol != self.protocol:
+                raise ValueError(f"Device protocol ({self.protocol}) does not "
+                                 f"match the bus protocol "
+                                 f"({self.bus.protocol}).")
+            if baudrate is not None and baudrate != self.bus.baudrate:
+                raise ValueError(f"Requested baud rate ({baudrate}) does not "
+                                 f"match the bus baud rate "
+                                 f"({self.bus.baudrate}).")
+            baudrate = self.bus.baudrate
         # if baudrate is unspecified, try all of them before giving up.
         baudrates = [baudrate] if baudrate is not None \
                     else RunzeDevice.VALID_BAUDRATES[self.protocol]
@@ -107,12 +157,14 @@ class RunzeDevice:
                 try:
                     log_msg_suffix = "." if address is None else \
                         f" on address: 0x{address:02x}."
-                    self.log.debug(f"Connecting to device on port: {com_port}"
+                    self.log.debug(f"Connecting to device on port: {port_name}"
                                    f" at {br}[bps]" + log_msg_suffix)
-                    # We will manually apply the timeout in the _send method.
-                    self.ser = Serial(com_port, br, timeout=0)
-                    self.ser.reset_input_buffer()
-                    self.ser.reset_output_buffer()
+                    if self._owns_bus:
+                        # We will manually apply the timeout in the _send method.
+                        if self.bus is None:
+                            self.bus = RunzeBus(com_port, br, self.protocol)
+                        self.bus.baudrate = br
+                        self.bus.reset_buffers()
                     # Test link by issuing a protocol-dependent dummy command.
                     if address is None:
                         self.log.debug("Discovering device address.")
@@ -124,10 +176,8 @@ class RunzeDevice:
                             raise ValueError(f"Device address is incorrectly "
                                 f"specified! specified address: {address}. "
                                 f"device's actual address: {device_address}.")
-                    elif self.protocol == Protocol.DT:
-                        raise NotImplementedError
-                    elif self.protocol == Protocol.OEM:
-                        raise NotImplementedError
+                    elif self.protocol != Protocol.RUNZE:
+                        self._send_query_dt(dt_protocol.Commands.QueryStatus)
                     break
                 except SerialException as e:
                     self.cmd_send_time_s = None # Forget about last msg sent.
@@ -138,21 +188,113 @@ class RunzeDevice:
         except SerialException as e:
             self.log.error("Error: could not open connection to device. "
                 "Is it plugged in and powered on? Is another program using it?")
+            if self._owns_bus and self.bus is not None:
+                self.bus.close()
             raise
         # Restore long timeout (required for long syringe moves.)
         self._timeout_s = self.__class__.LONG_TIMEOUT_S
 
+    @classmethod
+    def from_registry(cls, registry: DeviceRegistry,
+                      com_port: Union[str, RunzeBus], address: int = None,
+                      **kwargs):
+        """Connect to a device using the settings cached for it in a
+        :class:`~runze_control.registry.DeviceRegistry`.
+
+        If the registry has an entry for this port (and address), connect
+        at the cached baud rate and address, which costs a single
+        verification query. If there is no entry or verification fails, fall
+        back to probing every baud rate, and update the registry with the
+        result.
+
+        :param registry: registry to read from and record to.
+        :param com_port: com port (or shared bus) to connect to.
+        :param address: address of the device. Required if several devices
+            on this port are registered.
+        :param kwargs: any other constructor arguments. These take
+            precedence over cached settings.
+        """
+        if isinstance(com_port, RunzeBus):
+            port_name = com_port.com_port
+        elif isinstance(com_port, str):
+            port_name = com_port
+        else:  # An open Serial-like port.
+            port_name = getattr(com_port, "port", None) or repr(com_port)
+        entry = registry.lookup(port_name, address)
+        if entry is not None and entry["model"] == cls.__name__:
+            init_params = inspect.signature(cls.__init__).parameters
+            cached_kwargs = {k: entry[k] for k in DeviceRegistry.SETTINGS
+                             if k in init_params and k not in kwargs
+                             and entry[k] is not None}
+            try:
+                return cls(com_port, **cached_kwargs, **kwargs)
+            except (SerialException, ValueError) as e:
+                logger.warning(f"Cached settings for {cls.__name__} on "
+                               f"{port_name} are stale ({e}). Probing.")
+        device = cls(com_port, address=address, **kwargs)
+        registry.record(device)
+        return device
+
+    @property
+    def ser(self):
+        """The underlying serial port (shared with any other devices on the
+        bus)."""
+        return self.bus.ser
+
+    def close(self):
+        """Finish any queued commands and close the serial port if this device
+        owns it."""
+        if self.cmd_queue is not None:
+            self.cmd_queue.close()
+        if self._owns_bus:
+            self.bus.close()
+
+    def submit(self, method, *args, **kwargs):
+        """Queue a call to one of this device's methods and return a
+        :class:`~concurrent.futures.Future` for its return value.
+
+        Queued calls run back-to-back in the order submitted. Each one is
+        issued as soon as the previous one's reply arrives.
+
+        .. code-block:: python
+
+            pump.submit(pump.withdraw, 500)
+            done = pump.submit(pump.dispense, 500)
+            done.result()  # Block until both moves have finished.
+
+        .. warning::
+           Don't call this device's methods directly while commands are
+           queued. The direct call will collide with the queued ones.
+
+        """
+        if self.cmd_queue is None:
+            self.cmd_queue = CommandQueue(f"{self.bus.com_port}.{self.address}")
+        return self.cmd_queue.submit(method, *args, **kwargs)
+
+    def submit_common_cmd(self, func: Union[common_codes.CommonCmd, int],
+                          param_value: int = 0):
+        """Queue a Runze Protocol common command. Return a Future that
+        resolves to the parsed reply."""
+        return self.submit(self._send_common_cmd_runze, func, param_value)
+
+    def get_metrics(self):
+        """Return a snapshot of this device's command counters and latency
+        histograms (see :class:`~runze_control.metrics.DeviceMetrics`)."""
+        names = {int(cmd): cmd.name for cmd in self.codes.CommonCmd}
+        names.update({int(cmd) | FACTORY_KEY_FLAG: f"Factory.{cmd.name}"
+                      for cmd in common_codes.FactoryCmd})
+        return self.metrics.snapshot(names)
+
     def get_firmware_version(self):
         if self.protocol == Protocol.RUNZE:
             reply = self._send_query_runze(self.codes.CommonCmd.GetFirmwareVersion)
-            b3b4 = reply['parameter'].to_bytes(2, 'little')
+            b3b4 = reply.parameter.to_bytes(2, 'little')
             b3 = b3b4[0]
             b4 = b3b4[1]
             return float(f"{b3}.{b4}")
-        elif self.protocol == Protocol.DT:
-            raise NotImplementedError
         else:
-            raise NotImplementedError
+            return self._send_query_dt(
+                dt_protocol.Commands.QueryFirmwareVersion).data
 
     def get_protocol(self):
         """Get the protocol that the device is set to communicate in."""
@@ -174,39 +316,102 @@ class RunzeDevice:
         """
         self.log.debug("Requesting address.")
         if self.protocol == Protocol.RUNZE:
-            reply = self._send_query_runze(self.codes.CommonCmd.GetAddress)
-            return reply['parameter']
-        elif self.protocol == Protocol.DT:
-            raise NotImplementedError
+            # On a private port, accept the reply even if it comes back from
+            # an address other than the one we think the device has.
+            self._reply_from_any_address = self._owns_bus
+            try:
+                reply = self._send_query_runze(self.codes.CommonCmd.GetAddress)
+            finally:
+                self._reply_from_any_address = False
+            return reply.parameter
         else:
-            raise NotImplementedError
+            raise NotImplementedError(f"{self.protocol} protocol has no "
+                                      "address query.")
 
     def get_serial_number(self):
-        if self.protocol != Protocol.DT:
+        if self.protocol == Protocol.RUNZE:
             raise NotImplementedError
-        self._send_cmd_dt("?202") # FIXME: use enums.
+        return self._send_query_dt("?202").data # FIXME: use enums.
 
     def set_multicast_address(self, multicast_channel: int, address: int):
         """Set the multicast address for this bus (only necessary for RS485).
         Specifying multiple valves with the same multicast address enables
         sending the same commands to groups of valves simultaneously.
+
+        :param multicast_channel: multicast channel to configure [1-4]. A
+            device listens on all of its channels at once.
+        :param address: address that commands to this group will be sent to.
+
+        .. note::
+           See :class:`~runze_control.device_group.DeviceGroup` for sending
+           commands to a group.
+
         """
-        pass
+        self._check_multicast_channel(multicast_channel)
+        if not 0 <= address <= 0xFF:
+            raise ValueError(f"Multicast address ({address}) is out of range "
+                             "[0x00 - 0xFF].")
+        self.log.debug(f"Setting multicast channel {multicast_channel} "
+                       f"address to 0x{address:02x}.")
+        func = common_codes.FactoryCmd[f"MulticastCh{multicast_channel}Address"]
+        self._send_factory_cmd_runze(func, address)
+
+    def get_multicast_address(self, multicast_channel: int):
+        """Get the address assigned to one of the device's multicast
+        channels [1-4]."""
+        self._check_multicast_channel(multicast_channel)
+        func = common_codes.CommonCmd[
+            f"GetMulticastChannel{multicast_channel}Address"]
+        return self._send_query_runze(func).parameter
+
+    def _check_multicast_channel(self, multicast_channel: int):
+        if multicast_channel not in self.MULTICAST_CHANNELS:
+            raise ValueError(f"Multicast channel ({multicast_channel}) must be "
+                             f"one of: {list(self.MULTICAST_CHANNELS)}.")
 
     def get_rs232_baudrate(self):
         reply = self._send_query_runze(self.codes.CommonCmd.GetRS232Baudrate)
-        return runze_protocol.RS232BaudrateReply[reply['parameter']]
+        return runze_protocol.RS232BaudrateReply[reply.parameter]
 
     def get_rs485_baudrate(self):
         reply = self._send_query_runze(self.codes.CommonCmd.GetRS485Baudrate)
-        return runze_protocol.RS485BaudrateReply[reply['parameter']]
+        return runze_protocol.RS485BaudrateReply[reply.parameter]
+
+    def set_rs232_baudrate(self, baudrate: int):
+        """Set the RS232 baud rate. The device replies at its current rate
+        and then switches.
+
+        .. note::
+           See :func:`~runze_control.baudrate.upgrade_baudrate` to change
+           rates with verification and rollback.
+
+        """
+        self._send_factory_cmd_runze(common_codes.FactoryCmd.SetRS232Baudrate,
+                                     self._baudrate_code(baudrate))
+
+    def set_rs485_baudrate(self, baudrate: int):
+        """Set the RS485 baud rate. The device replies at its current rate
+        and then switches."""
+        self._send_factory_cmd_runze(common_codes.FactoryCmd.SetRS485Baudrate,
+                                     self._baudrate_code(baudrate))
+
+    @staticmethod
+    def _baudrate_code(baudrate: int):
+        for code, rate in runze_protocol.RS232BaudrateReply.items():
+            if rate == baudrate:
+                return code
+        raise ValueError(f"Baud rate ({baudrate}) must be one of: "
+                         f"{list(runze_protocol.RS232BaudrateReply.values())}.")
 
     def get_can_baudrate(self):
         raise NotImplementedError
 
     def is_busy(self):
         """True if a command was previously issued without waiting, and the
-        reply has not yet been received."""
+        reply has not yet been received. (In DT protocol, True if the device
+        is still executing its last command string.)"""
+        if self.protocol != Protocol.RUNZE:
+            return not self._query_ready_dt()
         # Child classes may need to query another field if this class is not
         # strictly waiting for a command to complete.
         if self.cmd_send_time_s is None:
@@ -219,66 +424,216 @@ class RunzeDevice:
         return False
 
     def wait_for_reply(self, force: bool = False):
+        if self.protocol != Protocol.RUNZE:
+            return self._parse_dt_reply(self._get_reply(protocol=self.protocol,
+                                                        force=force))
         return self._parse_runze_reply(self._get_reply(protocol=self.protocol,
                                                        force=force))
 
-    def _send_cmd_dt(self, cmd_str: str, execute: bool = True):
-        """Send a command over DT protocol and return the reply."""
-        cmd_str_bytes = cmd_str.encode('ascii')
-        cmd_str_bin_encoding = "B"*len(cmd_str_bytes)
-        encoding = f"<B{cmd_str_bin_encoding}B"
-        cmd_bytes = struct.pack(encoding,
-                                dt_protocol.PacketFields.FRAME_START,
-                                self.address.encode('ascii'),
-                                *cmd_str_bytes,
-                                dt_protocol.PacketFields.FRAME_END)
-        execute_cmd = "R" if execute else ""
-        packet = "{dt_protocol.PacketFields.FRAME_START}{cmd_str}{execute_cmd}"
-        return self._send(packet.encode("ASCII"), protocol=Protocol.DT)
-
-    def _send_cmd_oem(self, cmd_str: str, execute: bool = True):
-        """Send a command over oem protocol and return the reply."""
-        if execute:
-            cmd_str += "R"
-        cmd_str_bytes = cmd_str.encode('ascii')
-        cmd_str_bin_encoding = "B"*len(cmd_str_bytes)
-        encoding = f"<B{cmd_str_bin_encoding}B"
-        cmd_bytes = struct.pack(encoding,
-                                oem_protocol.PacketFields.STX,
-                                self.address,
-                                oem_protocol.PacketFields.DEFAULT_SEQUENCE_NUMBER
-                                *cmd_str_bytes,
-                                oem_protocol.PacketFields.ETX)
-        checksum = reduce(lambda a, b: a ^ b, cmd_bytes)  # XOR
-        packet = cmd_bytes + checksum.to_bytes(1, 'little')
-        return self._send(packet)
+    def wait_until_idle(self, timeout_s: float = None):
+        """Block until the device finishes its last command.
+
+        :param timeout_s: max time to wait. Defaults to the device's long
+            timeout.
+        """
+        if timeout_s is None:
+            timeout_s = self.__class__.LONG_TIMEOUT_S
+        deadline_s = perf_counter() + timeout_s
+        if self.cmd_send_time_s is not None:
+            self.wait_for_reply()
+        while self.is_busy():
+            if perf_counter() >= deadline_s:
+                raise SerialException("Timed out waiting for the device to "
+                                      "finish.")
+            sleep(self.__class__.POLL_INTERVAL_S)
+
+    def run_dt_program(self, program: Union[dt_protocol.Program, str],
+                       wait: bool = True):
+        """Run a command string (i.e: a :class:`~runze_control.dt_protocol.Program`
+        with loops) on the device in one round trip.
+
+        .. code-block:: python
+
+            program = dt_protocol.Program()
+            with program.repeat(10):
+                program.pickup(1000).delay(500).dispense(1000)
+            pump.run_dt_program(program)  # Sends "/1gP1000M500D1000G10R".
+
+        :param program: commands to run.
+        :param wait: if True, block until the device finishes running them.
+        """
+        if self.protocol == Protocol.RUNZE:
+            raise NotImplementedError("Programs can only be run over DT or "
+                                      "OEM protocol.")
+        return self._send_cmd_dt(str(program), wait=wait)
+
+    def terminate_dt_program(self):
+        """Stop the command string that the device is running."""
+        return self._send_cmd_dt(dt_protocol.Commands.Terminate,
+                                 execute=False, wait=False)
+
+    @classmethod
+    def _to_ascii_address(cls, address: Union[int, str, None]):
+        """Return a DT protocol address as its character code."""
+        if address is None:
+            return cls.ASCII_DEFAULT_ADDRESS
+        if isinstance(address, str):
+            if len(address) != 1:
+                raise ValueError(f"DT protocol address ({address!r}) must be "
+                                 "a single character.")
+            address = ord(address)
+        low, high = cls.ASCII_ADDRESS_RANGE
+        if not low <= address <= high:
+            raise ValueError(f"DT protocol address (0x{address:02x}) is out "
+                             f"of range [0x{low:02x} - 0x{high:02x}].")
+        return address
+
+    def _send_cmd_dt(self, cmd_str: str, execute: bool = True,
+                     wait: bool = True, force: bool = False):
+        """Send a command string over DT protocol (or wrapped in an OEM
+        Protocol packet if the device speaks OEM) and return the reply.
+
+        The device acknowledges a command string as soon as it accepts it,
+        so the acknowledgement is always read.
+
+        :param cmd_str: one or more commands (i.e: ``"P100D100"``).
+        :param execute: append the execute command so the device runs the
+            string right away.
+        :param wait: if True, block until the device finishes executing.
+        :raises RuntimeError: if the device rejects the command string.
+        """
+        if self.protocol == Protocol.OEM:
+            reply = self._send_cmd_oem(cmd_str, execute, force)
+        else:
+            packet = dt_protocol.encode_command(chr(self.address), cmd_str,
+                                                execute)
+            reply = self._parse_dt_reply(self._send(packet,
+                                                    protocol=Protocol.DT,
+                                                    force=force))
+        self._check_dt_reply(reply)
+        if wait and execute:
+            self.wait_until_idle()
+        return reply
+
+    def _send_query_dt(self, cmd_str: str):
+        """Send a query over DT protocol and return the reply without
+        checking its error code (queries report an error state rather than
+        failing)."""
+        if self.protocol == Protocol.OEM:
+            return self._send_cmd_oem(cmd_str, execute=False)
+        packet = dt_protocol.encode_command(chr(self.address), cmd_str,
+                                            execute=False)
+        return self._parse_dt_reply(self._send(packet, protocol=Protocol.DT))
+
+    def _query_ready_dt(self):
+        """Return True if the device is idle.
+
+        :raises RuntimeError: if the device is idle in an error state.
+        """
+        reply = self._send_query_dt(dt_protocol.Commands.QueryStatus)
+        if reply.ready:
+            self._check_dt_reply(reply)
+        return reply.ready
+
+    def _parse_dt_reply(self, reply: bytes):
+        """Parse reply sent over DT (or OEM) protocol into respective
+        fields."""
+        if not len(reply):
+            return None
+        try:
+            if self.protocol == Protocol.OEM:
+                return oem_protocol.parse_reply(reply)
+            return dt_protocol.parse_reply(reply)
+        except ValueError as e:
+            raise SerialException(f"Corrupted reply from device. {e}") from e
+
+    def _check_dt_reply(self, reply: dt_protocol.DTReply):
+        if reply.error != dt_protocol.Status.NoError:
+            try:
+                error = dt_protocol.Status(reply.error).name
+            except ValueError:
+                error = f"{reply.error}"
+            raise RuntimeError(f"Device replied with error code: {error}.")
+
+    def _send_cmd_oem(self, cmd_str: str, execute: bool = True,
+                      force: bool = False):
+        """Send a command string in an OEM protocol packet and return the
+        parsed reply.
+
+        Each command gets the next sequence number. If its reply is lost or
+        corrupted, the same packet is resent with the repeat flag set. The
+        device replies to a repeat without running the command again, so the
+        retry is safe even if only the reply was lost.
+
+        OEM replies don't carry the sequence number, so a reply that was
+        only late (rather than lost) can't be told apart from the reply to
+        its repeat. Both arrive, and whichever is left over would be read as
+        the reply to the next command. To prevent that, queued replies are
+        discarded before every repeat, and once a repeated command's reply
+        is accepted, any more replies arriving within
+        `OEM_REPLY_TIMEOUT_S` are discarded too.
+        """
+        self._oem_sequence_number = oem_protocol.next_sequence_number(
+            self._oem_sequence_number)
+        for attempt in range(self.__class__.OEM_MAX_RETRANSMISSIONS + 1):
+            if attempt > 0:  # Drop stale replies to earlier attempts.
+                self.bus.discard_replies()
+            packet = oem_protocol.encode_command(self.address,
+                                                 self._oem_sequence_number,
+                                                 cmd_str, execute,
+                                                 repeat=attempt > 0)
+            self._send(packet, protocol=Protocol.OEM, wait=False,
+                       force=force or attempt > 0)
+            reply = self._get_reply(Protocol.OEM,
+                timeout_s=self.__class__.OEM_REPLY_TIMEOUT_S)
+            try:
+                parsed_reply = self._parse_dt_reply(reply)
+            except SerialException as e:
+                self.log.warning(f"{e} Retransmitting.")
+            else:
+                if parsed_reply is not None:
+                    if attempt > 0:  # Drop a late duplicate of this reply.
+                        self.bus.discard_replies(
+                            timeout_s=self.__class__.OEM_REPLY_TIMEOUT_S)
+                    return parsed_reply
+                self.log.warning("No reply received from device. "
+                                 "Retransmitting.")
+            self.oem_retransmissions += 1
+        self.oem_retransmissions -= 1  # The last attempt wasn't resent.
+        raise SerialException("No reply received from device.")
 
     def _send_common_cmd_runze(self, func: Union[common_codes.CommonCmd, int],
                                param_value: int = 0, wait: bool = True,
                                force: bool = False):
         """Send a common command over Runze Protocol and return the reply."""
-        b3, b4 = param_value.to_bytes(2, 'little')
-        return self._send_common_cmd_frame_runze(func, b3, b4, wait, force)
+        packet = runze_protocol.encode_common_frame_into(self._tx_buffer,
+                                                         self.address, func,
+                                                         param_value)
+        return self._parse_runze_reply(self._send(packet,
+                                                  protocol=Protocol.RUNZE,
+                                                  wait=wait,
+                                                  force=force))
 
     def _send_query_runze(self, func: Union[common_codes.CommonCmd, int],
                           param_value: int = 0x0000, wait: bool = True,
                           force: bool = False):
         """Send a query over Runze Protocol and return the reply."""
-        b3, b4 = param_value.to_bytes(2, 'little')
-        return self._send_common_cmd_frame_runze(func, b3, b4, wait, force)
+        if param_value:
+            return self._send_common_cmd_runze(func, param_value, wait, force)
+        # Parameterless queries are sent often. Reuse their frames.
+        packet = runze_protocol.encode_query_frame(self.address, func)
+        return self._parse_runze_reply(self._send(packet,
+                                                  protocol=Protocol.RUNZE,
+                                                  wait=wait,
+                                                  force=force))
 
     def _send_factory_cmd_runze(self, func: Union[common_codes.FactoryCmd, int],
                                 param_value, wait: bool = True, force: bool = False):
         """Send a factory command frame to issue a command over Runze Protocol.
            Return a reply frame as a dict."""
         # Pack Factory Command password in the appropriate location.
-        cmd_bytes = struct.pack(runze_protocol.PacketFormat.SendFactory.value,
-                                runze_protocol.PacketFields.STX,
-                                self.address, func,
-                                FACTORY_CMD_PWD_CODE, param_value,
-                                runze_protocol.PacketFields.ETX)
-        checksum = sum(bytearray(cmd_bytes))
-        packet = cmd_bytes + checksum.to_bytes(2, 'little')
+        packet = runze_protocol.encode_factory_frame(self.address, func,
+                                                     param_value)
         return self._parse_runze_reply(self._send(packet,
                                                   protocol=Protocol.RUNZE,
                                                   wait=wait,
@@ -289,27 +644,22 @@ class RunzeDevice:
                                      force: bool = False):
         """Send a common command frame to issue a command over Runze Protocol.
            Return a reply frame as a dict."""
-        cmd_bytes = struct.pack(runze_protocol.PacketFormat.SendCommon.value,
-                                runze_protocol.PacketFields.STX,
-                                self.address, func, b3, b4,
-                                runze_protocol.PacketFields.ETX)
-        checksum = sum(bytearray(cmd_bytes))
-        packet = cmd_bytes + checksum.to_bytes(2, 'little')
-        return self._parse_runze_reply(self._send(packet,
-                                                  protocol=Protocol.RUNZE,
-                                                  wait=wait,
-                                                  force=force))
+        return self._send_common_cmd_runze(func, b3 | (b4 << 8), wait, force)
 
     def _parse_runze_reply(self, reply: bytes):
         """Parse reply sent over Runze protocol into respective fields."""
         if not len(reply):
             return None
-        reply_struct = struct.unpack(runze_protocol.PacketFormat.Reply, reply)
-        parsed_reply = dict(zip(runze_protocol.CommonReplyFields, reply_struct))
-        error = runze_protocol.ReplyStatus(parsed_reply['status'])
-        #self.log.debug(f"parsed: {parsed_reply}, status: {error.name}")
-        if error != runze_protocol.ReplyStatus.NormalState:
-            raise RuntimeError(f"Device replied with error code: {error.name}.")
+        try:
+            parsed_reply = runze_protocol.parse_reply(reply)
+        except ValueError as e:
+            raise SerialException(f"Corrupted reply from device. {e}") from e
+        if parsed_reply.status != runze_protocol.ReplyStatus.NormalState:
+            try:
+                error = runze_protocol.ReplyStatus(parsed_reply.status).name
+            except ValueError:
+                error = f"0x{parsed_reply.status:02x}"
+            raise RuntimeError(f"Device replied with error code: {error}.")
         return parsed_reply
 
     def _send(self, packet: bytes, protocol: Protocol = Protocol.DT,
@@ -318,9 +668,13 @@ class RunzeDevice:
         if self.cmd_send_time_s is not None and not force:
             raise RuntimeError("Cannot issue a command while the previous "
                                "command has not yet replied.")
-        self.log.debug(f"Sending (hex): {packet.hex(' ')}")
-        self.ser.write(packet)
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Sending (hex): %s", packet.hex(' '))
+        self.bus.write(packet)
         self.cmd_send_time_s = perf_counter()
+        if protocol == Protocol.RUNZE:
+            self.metrics.record_send(packet[2], len(packet),
+                factory=len(packet) == runze_protocol.FACTORY_FRAME.size)
         if not wait:
             self.log.debug("Not waiting for reply from device.")
             return bytes()  # Empty reply
@@ -331,38 +685,47 @@ class RunzeDevice:
         return reply
 
     def _get_reply(self, protocol: Protocol = Protocol.DT, wait: bool = True,
-                   force: bool = False):
+                   force: bool = False, timeout_s: float = None):
         """Retrieve the reply from a previously-issued command.
-        If wait, wait up to the timeout period to retrieve the reply.
-        Otherwise return immediately with an empty reply if reply has not been
-        received.
+        If wait, wait up to the timeout period (or `timeout_s`, if specified)
+        to retrieve the reply. Otherwise return immediately with an empty
+        reply if reply has not been received.
         """
         if self.cmd_send_time_s is None and not force:
             raise SerialException("Cannot retrieve a reply. "
                                   "No command has been issued.")
-        reply = bytes()
-        while True:
-            # pyseral Timeout is zero, so these calls return immediately if no reply.
-            try:
-                if protocol == Protocol.RUNZE:
-                    reply += self.ser.read(runze_protocol.REPLY_NUM_BYTES)
-                    if len(reply) >= runze_protocol.REPLY_NUM_BYTES:
-                        break
-                elif protocol == Protocol.DT:
-                    frame_end_ascii = dt_protocol.PacketFields.REPLY_FRAME_END.encode('ascii')
-                    reply += self.ser.read_until(frame_end)
-                    if reply[len(frame_end):] == frame_end_ascii:
-                        break
-                elif protocol == Protocol.OEM:
-                    # TODO: check checksum.
-                    raise NotImplementedError("OEM protocol not yet implemented.")
-            except SerialException:
-                pass
-            if not wait:
-                break
-            if perf_counter() - self.cmd_send_time_s >= self._timeout_s:
-                break
-        self.log.debug(f"Reply (hex): {reply.hex(' ')}")
+        # Measure the deadline from when the command was sent. A forced read
+        # may not have an outstanding command, so start the clock now.
+        start_time_s = self.cmd_send_time_s if self.cmd_send_time_s is not None \
+            else perf_counter()
+        if timeout_s is None:
+            timeout_s = self._timeout_s
+        timeout_s = timeout_s - (perf_counter() - start_time_s) if wait \
+            else 0
+        # DT and OEM replies all come from the host address. They can't be
+        # routed.
+        address = None if self._reply_from_any_address \
+            or protocol != Protocol.RUNZE else self.address
+        return self._accept_reply(self.bus.get_reply(address, timeout_s,
+                                                     protocol), wait)
+
+    def _accept_reply(self, reply: bytes, waited: bool = True):
+        """Account for a (possibly empty) reply retrieved from the bus and
+        return it. Completes the outstanding command if the reply isn't
+        empty."""
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Reply (hex): %s", reply.hex(' '))
+        self._record_reply(reply, waited)
         if len(reply):
             self.cmd_send_time_s = None  # Cmd-reply loop finished. Unassign.
         return reply
+
+    def _record_reply(self, reply: bytes, waited: bool):
+        """Update metrics with the outcome of retrieving a reply."""
+        if len(reply):
+            first_byte_time_s, complete_time_s = self.bus.reply_times[reply[1]]
+            self.metrics.record_reply(reply[2], len(reply),
+                                      self.cmd_send_time_s, first_byte_time_s,
+                                      complete_time_s)
+        elif waited:
+            self.metrics.record_timeout()
@@ -1,5 +1,8 @@
 """Runze Fluid device codes common across devices."""
 from enum import Enum, IntEnum
+from functools import lru_cache
+from typing import NamedTuple
+import struct
 
 try:
     from enum import StrEnum  # a 3.11+ feature.
@@ -13,7 +16,7 @@ REPLY_NUM_BYTES = 8
 
 class PacketFormat(StrEnum):
     SendCommon = "<BBBBBB" # little-endian, 6 uint8 (checksum omitted)
-    SendFactory = "<BBBBBBBBBBBB" # little-endian, 12 uint8 (checksum omitted)
+    SendFactory = "<BBBIIB" # little-endian, 3 uint8, 2 uint32, 1 uint8 (checksum omitted)
     Reply = "<BBBHBH" # little-endian, 2 uint8, 1 uint16 2 uint8, 1 uint16 (checksum)
 
 
@@ -23,8 +26,96 @@ class PacketFields(IntEnum):
     ETX = 0xDD
 
 
+# Precompiled frame layouts (checksum included).
+# STX, address, function, parameter (B3-B4), ETX, checksum.
+COMMON_FRAME = struct.Struct("<BBBHBH")
+# STX, address, function, password (B3-B6), parameter (B7-B10), ETX, checksum.
+FACTORY_FRAME = struct.Struct("<BBBIIBH")
+
+_STX = PacketFields.STX.value
+_ETX = PacketFields.ETX.value
+# Constant contributions of the STX, ETX (and password) bytes to checksums.
+_COMMON_CHECKSUM_BASE = _STX + _ETX
+_FACTORY_CHECKSUM_BASE = (_COMMON_CHECKSUM_BASE
+                          + sum(FACTORY_CMD_PWD_CODE.to_bytes(4, 'little')))
+
+
+def encode_common_frame_into(buffer: bytearray, address: int, func: int,
+                             param_value: int = 0):
+    """Pack a complete common command frame into the first 8 bytes of
+    `buffer` and return the buffer."""
+    address = int(address)
+    func = int(func)
+    checksum = (_COMMON_CHECKSUM_BASE + address + func
+                + (param_value & 0xFF) + (param_value >> 8))
+    COMMON_FRAME.pack_into(buffer, 0, _STX, address, func,
+                           param_value, _ETX, checksum)
+    return buffer
+
+
+@lru_cache(maxsize=None)
+def encode_query_frame(address: int, func: int):
+    """Return the complete frame for a parameterless query (i.e:
+    GetMotorStatus, GetSyringePosition, GetAddress). Frames are memoized
+    per address."""
+    return bytes(encode_common_frame_into(bytearray(COMMON_FRAME.size),
+                                          address, func))
+
+
+def encode_factory_frame(address: int, func: int, param_value: int = 0):
+    """Return a complete factory command frame (password included)."""
+    address = int(address)
+    func = int(func)
+    checksum = (_FACTORY_CHECKSUM_BASE + address + func
+                + sum(param_value.to_bytes(4, 'little')))
+    return FACTORY_FRAME.pack(_STX, address, func,
+                              FACTORY_CMD_PWD_CODE, param_value,
+                              _ETX, checksum)
+
+
 # Runze Protocol Fields
 CommonReplyFields = ('stx', 'addr', 'status', 'parameter', 'etx', 'checksum')
+REPLY_FRAME = struct.Struct(PacketFormat.Reply.value)
+
+
+class RunzeReply(NamedTuple):
+    """Reply frame to a Runze Protocol command.
+
+    Fields can be read as attributes (``reply.parameter``) or, as with the
+    dicts previously returned, by name (``reply['parameter']``).
+    """
+    stx: int
+    addr: int
+    status: int
+    parameter: int
+    etx: int
+    checksum: int
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+
+_new_reply = tuple.__new__
+
+
+def parse_reply(buffer, offset: int = 0):
+    """Parse the reply frame starting at `offset` in `buffer` (any bytes-like
+    object, including a memoryview) without copying it.
+
+    :raises ValueError: if the frame is malformed or its checksum is wrong.
+    """
+    reply = _new_reply(RunzeReply, REPLY_FRAME.unpack_from(buffer, offset))
+    if reply.stx != _STX or reply.etx != _ETX:
+        raise ValueError("Reply frame is malformed: "
+                         f"{bytes(buffer[offset:offset + REPLY_NUM_BYTES]).hex(' ')}.")
+    checksum = (_COMMON_CHECKSUM_BASE + reply.addr + reply.status
+                + (reply.parameter & 0xFF) + (reply.parameter >> 8))
+    if checksum != reply.checksum:
+        raise ValueError(f"Reply checksum is invalid. Expected: "
+                         f"0x{checksum:04x}. Received: 0x{reply.checksum:04x}.")
+    return reply
 
 
 class ReplyStatus(IntEnum):
@@ -53,3 +144,103 @@ RS232BaudrateReply = \
 }
 
 RS485BaudrateReply = RS232BaudrateReply
+
+
+class ReplyFramer:
+    """Reassembles reply frames from a stream of partial reads.
+
+    The framer scans for STX, checks ETX and the checksum, and discards any
+    bytes that don't belong to a valid frame (i.e: stray bytes or the tail of
+    a reply cut off mid-frame) so that one bad byte can't misalign every
+    reply after it. Each time alignment is lost and regained counts as one
+    resync, however many bytes were skipped.
+
+    A frame with STX and ETX in place but a bad checksum is a corrupted
+    reply rather than stray bytes. It is returned separately in
+    :attr:`corrupted` so that the device waiting on it can fail right away
+    instead of timing out.
+    """
+
+    _STX_BYTE = bytes([_STX])
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.resync_count = 0  # Number of times alignment was regained.
+        self.discarded_bytes = 0  # Total bytes dropped while resyncing.
+        self.stray = bytearray()  # Bytes dropped by the last call to feed().
+        self.corrupted = []  # Frames with a bad checksum found by the last
+                             # call to feed().
+        self._aligned = True  # False while skipping bytes to resync.
+
+    @property
+    def buffered_bytes(self):
+        """Number of bytes held while waiting for the rest of a frame."""
+        return len(self._buffer)
+
+    def reset(self):
+        """Drop any partially received frame."""
+        self._buffer.clear()
+        self._aligned = True
+
+    @staticmethod
+    def _frame_overlaps(buffer, start: int):
+        """Return True if a valid frame starts inside the frame-sized span at
+        `start`, False if none does, or None if too few bytes have arrived to
+        tell."""
+        for offset in range(start + 1, start + REPLY_NUM_BYTES):
+            if buffer[offset] != _STX:
+                continue
+            if offset + REPLY_NUM_BYTES > len(buffer):
+                return None
+            try:
+                parse_reply(buffer, offset)
+            except ValueError:
+                continue
+            return True
+        return False
+
+    def feed(self, data: bytes):
+        """Add newly received bytes and return a list of the complete, valid
+        frames (as bytes) that they finish, in order of arrival. Corrupted
+        frames they finish are left in :attr:`corrupted`."""
+        buffer = self._buffer
+        buffer += data
+        self.stray.clear()
+        self.corrupted = []
+        frames = []
+        start = 0
+        end = len(buffer)
+        while end - start >= REPLY_NUM_BYTES:
+            if buffer[start] == _STX:
+                try:
+                    parse_reply(buffer, start)
+                except ValueError:
+                    if buffer[start + 5] == _ETX:  # B5 is ETX.
+                        # Frame-shaped. Corrupted, unless it is stray bytes
+                        # in front of a valid frame.
+                        overlaps = self._frame_overlaps(buffer, start)
+                        if overlaps is None:
+                            break
+                        if not overlaps:
+                            self.corrupted.append(
+                                bytes(buffer[start:start + REPLY_NUM_BYTES]))
+                            start += REPLY_NUM_BYTES
+                            self._aligned = True
+                            continue
+                else:
+                    frames.append(bytes(buffer[start:start + REPLY_NUM_BYTES]))
+                    start += REPLY_NUM_BYTES
+                    self._aligned = True
+                    continue
+            # Misaligned. Skip ahead to the next candidate frame start.
+            next_start = buffer.find(self._STX_BYTE, start + 1)
+            if next_start < 0:
+                next_start = end
+            if self._aligned:
+                self._aligned = False
+                self.resync_count += 1
+            self.discarded_bytes += next_start - start
+            self.stray += buffer[start:next_start]
+            start = next_start
+        del buffer[:start]
+        return frames
@@ -9,6 +9,15 @@ SV07_X_S_T8_DEAD_VOLUME_UL = SV07_X_S_T6_DEAD_VOLUME_UL
 SV07_X_S_T10_DEAD_VOLUME_UL = SV07_X_S_T6_DEAD_VOLUME_UL
 SV07_X_S_T12_DEAD_VOLUME_UL = 22.43
 SV07_X_S_T16_DEAD_VOLUME_UL = 33.68
+# SV07 dead volume by port count.
+SV07_DEAD_VOLUME_UL = \
+{
+    6: SV07_X_S_T6_DEAD_VOLUME_UL,
+    8: SV07_X_S_T8_DEAD_VOLUME_UL,
+    10: SV07_X_S_T10_DEAD_VOLUME_UL,
+    12: SV07_X_S_T12_DEAD_VOLUME_UL,
+    16: SV07_X_S_T16_DEAD_VOLUME_UL
+}
 
 
 class CommonCmdCode(IntEnum):
@@ -1,16 +1,36 @@
 """Protocol codes common to all syringe pumps."""
+from runze_control.dt_protocol import Commands as DTCommands
+from runze_control.flow_rate import FlowRateTable, nominal_table
+from runze_control.motion_model import MotionModel
 from runze_control.protocol import Protocol
+from runze_control.runze_bus import RunzeBus
 from runze_control.runze_protocol import ReplyStatus
 from runze_control.runze_device import RunzeDevice
 from runze_control.protocol_codes import syringe_pump_codes
 from runze_control.protocol_codes import mini_sy04_codes
 from runze_control.protocol_codes import sy08_codes
+from contextlib import contextmanager
+from serial import SerialException
+from time import perf_counter, sleep
 from typing import Union
 
 
 class SyringePump(RunzeDevice):
 
-    def __init__(self, com_port: str, baudrate: int = None,
+    # Nominal plunger steps per motor revolution, relating motor speed [rpm]
+    # to plunger travel time. Used for timing estimates only.
+    STEPS_PER_REVOLUTION = 200
+    # True if the device withholds its reply to a move until the move ends.
+    # The reply then marks the end of the move for the motion model.
+    REPLIES_ON_MOVE_COMPLETION = True
+    # True if RunInCW/RunInCCW move the plunger (rather than the valve).
+    RUN_CMDS_MOVE_PLUNGER = True
+    POLL_INTERVAL_S = 0.05  # Time between motor status checks once a move
+                            # runs past its predicted end.
+    MAX_ASPIRATE_SPEED_PERCENT = 60  # Withdrawing faster risks drawing
+                                     # bubbles out of solution (cavitation).
+
+    def __init__(self, com_port: Union[str, RunzeBus], baudrate: int = None,
                  address: int = None,
                  protocol: Union[str, Protocol] = Protocol.RUNZE,
                  syringe_volume_ul: int = None):
@@ -30,6 +50,11 @@ class SyringePump(RunzeDevice):
         self.syringe_volume_ul = syringe_volume_ul
         self.syringe_speed_percent = None
         self.driver_steps = 0
+        self.motion = MotionModel(self.__class__.STEPS_PER_REVOLUTION)
+        self._move_reply_pending = False  # True while the reply to a move
+                                          # that started a prediction is due.
+        self.flow_rate_table = None if syringe_volume_ul is None \
+            else nominal_table(self.__class__, syringe_volume_ul)
         # Connect to port.
         super().__init__(com_port=com_port, baudrate=baudrate,
                          address=address, protocol=protocol)
@@ -40,12 +65,19 @@ class SyringePump(RunzeDevice):
 
     def reset_syringe_position(self, wait: bool = True):
         """Reset and home the syringe."""
+        if self.protocol != Protocol.RUNZE:
+            self.log.debug("Initializing syringe.")
+            with self._predicting_move(self.driver_steps):
+                self._send_cmd_dt(DTCommands.InitClockwise, wait=wait)
+            self.driver_steps = 0
+            return
         self.log.debug("Requesting default speed. If device is freshly "
             "powered on, the speed change will not take place until after the "
             "first reset.")
         self.set_speed_percent(self.__class__.DEFAULT_SPEED_PERCENT)
         self.log.debug(f"Resetting syringe (moving to optocoupler position).")
-        self._send_query_runze(self.codes.CommonCmd.ResetSyringePosition)
+        with self._predicting_move(self.driver_steps):
+            self._send_query_runze(self.codes.CommonCmd.ResetSyringePosition)
         # Per datasheet, after reset, the syringe needs to be told that the
         # reset position is the 0 position.
         self.log.debug(f"Synchronizing syringe position as '0'.")
@@ -55,14 +87,21 @@ class SyringePump(RunzeDevice):
 
     def get_position_steps(self):
         """return the syringe position in linear steps."""
-        reply = self._send_query_runze(self.codes.CommonCmd.GetSyringePosition)
-        self.driver_steps = reply["parameter"]  # Update local step count.
-        range_percent = self.driver_steps / self.max_position_steps * 100.0
-        self.log.debug(f"Syringe position: {self.driver_steps}/"
-                       f"{self.max_position_steps} [steps] "
-                       f"i.e: {range_percent:.2f}% full-scale range.")
+        if self.protocol != Protocol.RUNZE:
+            reply = self._send_query_dt(DTCommands.QueryPlungerPosition)
+            self.driver_steps = int(reply.data)
+        else:
+            reply = self._send_query_runze(
+                self.codes.CommonCmd.GetSyringePosition)
+            self.driver_steps = reply.parameter  # Update local step count.
+        self.log.debug("Syringe position: %d/%d [steps] i.e: %.2f%% full-scale "
+                       "range.", self.driver_steps, self.max_position_steps,
+                       self.driver_steps / self.max_position_steps * 100.0)
         return self.driver_steps
 
+    def _steps_to_ul(self, steps: int):
+        return steps * self.syringe_volume_ul / self.max_position_steps
+
     def get_position_ul(self):
         return (self.get_position_steps() * self.syringe_volume_ul
                 / self.max_position_steps)
@@ -87,25 +126,43 @@ class SyringePump(RunzeDevice):
         self.dispense_steps(steps, wait=wait)
 
     def aspirate_steps(self, steps: int, wait: bool = True):
-        ul = steps * self.syringe_volume_ul / self.max_position_steps
-        self.log.debug(f"Aspirating {ul:.2f} [uL] i.e {steps} [steps].")
-        self._send_common_cmd_runze(self.codes.CommonCmd.RunInCCW, steps, wait)
+        self.log.debug("Aspirating %.2f [uL] i.e %d [steps].",
+                       self._steps_to_ul(steps), steps)
+        with self._predicting_move(steps):
+            if self.protocol != Protocol.RUNZE:
+                self._send_cmd_dt(f"{DTCommands.RelativePickup}{steps}",
+                                  wait=wait)
+            else:
+                self._send_common_cmd_runze(self.codes.CommonCmd.RunInCCW,
+                                            steps, wait)
         self.driver_steps += steps
 
     def withdraw_steps(self, steps: int, wait: bool = True):
         return self.aspirate_steps(steps, wait=wait)
 
     def dispense_steps(self, steps: int, wait: bool = True):
-        ul = steps * self.syringe_volume_ul / self.max_position_steps
-        self.log.debug(f"Dispensing {ul:.2f} [uL] i.e {steps} [steps].")
-        self._send_common_cmd_runze(self.codes.CommonCmd.RunInCW, steps, wait)
+        self.log.debug("Dispensing %.2f [uL] i.e %d [steps].",
+                       self._steps_to_ul(steps), steps)
+        with self._predicting_move(steps):
+            if self.protocol != Protocol.RUNZE:
+                self._send_cmd_dt(f"{DTCommands.RelativeDispense}{steps}",
+                                  wait=wait)
+            else:
+                self._send_common_cmd_runze(self.codes.CommonCmd.RunInCW,
+                                            steps, wait)
         self.driver_steps -= steps
 
     def force_stop(self):
         """Halt the syringe pump in its current location."""
+        if self.protocol != Protocol.RUNZE:
+            self.motion.cancel()
+            self.terminate_dt_program()
+            self.get_position_steps()
+            return
         # SY08 leaves a residual reply that needs to be cleared if we are
         # halting an active movement command.
         was_busy = super().is_busy()  # Save whether we are waiting on a reply.
+        self.motion.cancel()
         self._send_common_cmd_runze(self.codes.CommonCmd.ForceStop,
                                     wait=True, force=True)
         # Clear the irrelevant reply from the aborted command.
@@ -120,31 +177,176 @@ class SyringePump(RunzeDevice):
     def get_motor_status(self):
         self.log.debug("Querying motor status.")
         reply = self._send_common_cmd_runze(self.codes.CommonCmd.GetMotorStatus)
-        return reply['parameter']
+        return reply.parameter
 
     def is_busy(self):
         # Check if we are waiting on replies.
-        if super().is_busy():
-            self.log.debug(f"Is syringe busy? -> yes (resolved in base class).")
+        if self.protocol == Protocol.RUNZE and super().is_busy():
+            self.log.debug("Is syringe busy? -> yes (resolved in base class).")
+            return True
+        # Don't query the device while its move is predicted to be underway.
+        if self.motion.is_moving():
+            self.log.debug("Is syringe busy? -> yes (resolved with motion "
+                           "model).")
             return True
         # Check motor status directly. Check for MOTOR_BUSY
-        motor_status = self.get_motor_status()
-        if motor_status == ReplyStatus.MotorBusy:
-            self.log.debug(f"is syringe busy? -> yes (resolved with motor status query).")
+        if self.protocol != Protocol.RUNZE:
+            busy = super().is_busy()
+        else:
+            busy = self.get_motor_status() == ReplyStatus.MotorBusy
+        if busy:
+            self.log.debug("is syringe busy? -> yes (resolved with motor status query).")
             return True
-        self.log.debug(f"is syringe busy? -> no (resolved with motor status query).")
+        self.motion.cancel()
+        self.log.debug("is syringe busy? -> no (resolved with motor status query).")
         return False
 
+    def wait_until_idle(self, timeout_s: float = None):
+        """Block until the plunger stops.
+
+        Sleeps until the move's predicted end, then confirms with a motor
+        status query (repeated every `POLL_INTERVAL_S` only if the move runs
+        long), so waiting costs about one query rather than one per pass of
+        a polling loop.
+
+        :param timeout_s: max time to wait. Defaults to the device's long
+            timeout.
+        """
+        if timeout_s is None:
+            timeout_s = self.__class__.LONG_TIMEOUT_S
+        deadline_s = perf_counter() + timeout_s
+        if self.cmd_send_time_s is not None:
+            self.wait_for_reply()
+        while True:
+            end_time_s = self.motion.end_time_s
+            if end_time_s is not None:
+                sleep(max(0, min(end_time_s, deadline_s) - perf_counter()))
+            if not self.is_busy():
+                return
+            if perf_counter() >= deadline_s:
+                raise SerialException("Timed out waiting for the plunger to "
+                                      "stop.")
+            sleep(self.__class__.POLL_INTERVAL_S)
+
+    def _speed_rpm(self):
+        """Current plunger speed [rpm]. (Power-on default if never set.)"""
+        percent = self.syringe_speed_percent
+        if percent is None:
+            percent = self.__class__.DEFAULT_SPEED_PERCENT
+        return max(1, round(percent * self.max_speed_rpm / 100.0))
+
+    def _predict_move(self, steps: int):
+        """Start predicting the end of a move of `steps` sent now."""
+        if self.protocol != Protocol.RUNZE:  # DT speed is unknown. Poll.
+            return
+        self.motion.start(steps, self._speed_rpm())
+
+    @contextmanager
+    def _predicting_move(self, steps: int):
+        """Predict the end of a move of `steps` sent within the block.
+
+        The prediction starts before the command is sent so that the reply
+        to this command (and no other) can finish it. If sending fails, the
+        prediction is dropped so :meth:`is_busy` doesn't report a move that
+        never started.
+        """
+        if self.cmd_send_time_s is not None:
+            # The send will be refused. Keep predicting the move underway.
+            yield
+            return
+        self._predict_move(steps)
+        self._move_reply_pending = self.motion.end_time_s is not None
+        try:
+            yield
+        except Exception:
+            self._move_reply_pending = False
+            self.motion.cancel()
+            raise
+
+    def _record_reply(self, reply: bytes, waited: bool):
+        """Also let a move's reply end its prediction and refine the motion
+        model.
+
+        Only the reply to the move that started the prediction counts.
+        Replies to queries sent during a group move (i.e: motor status or
+        position) arrive within a round trip and say nothing about how long
+        the move took.
+        """
+        super()._record_reply(reply, waited)
+        if not len(reply) or not self._move_reply_pending:
+            return
+        self._move_reply_pending = False
+        # DT protocol acknowledges moves as they start.
+        if self.motion.end_time_s is None \
+                or not self.__class__.REPLIES_ON_MOVE_COMPLETION \
+                or self.protocol != Protocol.RUNZE:
+            return
+        if reply[2] != ReplyStatus.NormalState \
+                or self.cmd_send_time_s is None:  # Rejected or residual.
+            self.motion.cancel()
+            return
+        _, complete_time_s = self.bus.reply_times[reply[1]]
+        self.motion.finish(complete_time_s - self.cmd_send_time_s)
+
+    def _flow_rate_to_speed_percent(self, flow_rate_ul_per_min: float):
+        """Plunger speed [%] nearest to `flow_rate_ul_per_min`."""
+        setting = self._flow_rate_setting(flow_rate_ul_per_min)
+        return setting.speed_rpm * 100.0 / self.max_speed_rpm
+
+    def _flow_rate_setting(self, flow_rate_ul_per_min: float):
+        if self.flow_rate_table is None:
+            raise ValueError("Syringe volume must be specified to use flow "
+                             "rates.")
+        return self.flow_rate_table.nearest(flow_rate_ul_per_min)
+
+    def set_flow_rate_ul_per_min(self, flow_rate_ul_per_min: float,
+                                 wait: bool = True):
+        """Set the plunger speed to the achievable flow rate nearest to
+        `flow_rate_ul_per_min` and return the
+        :class:`~runze_control.flow_rate.FlowRateSetting` applied, including
+        its quantization error."""
+        setting = self._flow_rate_setting(flow_rate_ul_per_min)
+        self.log.debug("Setting flow rate to %.3f [uL/min] (requested: %.3f "
+                       "[uL/min]).", setting.actual_ul_per_min,
+                       flow_rate_ul_per_min)
+        self.set_speed_percent(setting.speed_rpm * 100.0 / self.max_speed_rpm,
+                               wait)
+        return setting
+
+    def get_flow_rate(self):
+        """Return the flow rate [uL/min] at the current speed.
+            Note: this value is local and not read directly from the device."""
+        if self.flow_rate_table is None:
+            raise ValueError("Syringe volume must be specified to use flow "
+                             "rates.")
+        return self.flow_rate_table.rate_ul_per_min(self._speed_rpm())
+
+    def calibrate_flow_rate(self, measured_ul_per_min: dict):
+        """Correct flow rates with measurements.
+
+        :param measured_ul_per_min: measured flow rate [uL/min] at one or
+            more speeds [rpm]. Speeds in between are interpolated.
+        """
+        if self.flow_rate_table is None:
+            raise ValueError("Syringe volume must be specified to use flow "
+                             "rates.")
+        self.flow_rate_table = FlowRateTable(
+            self.max_speed_rpm, self.flow_rate_table.ul_per_revolution,
+            measured_ul_per_min)
+
     def set_speed_percent(self, percent: float, wait: bool = True):
         """Set speed in percent."""
-        self.log.debug(f"Setting speed to {percent}%.")
+        if self.protocol != Protocol.RUNZE:
+            raise NotImplementedError("Speed can only be set over Runze "
+                                      "protocol.")
+        self.log.debug("Setting speed to %s%%.", percent)
         if (percent > 100) or (percent < 0):
             raise ValueError(f"Requested plunger speed ({percent}%) is out of "
                              f"range [0 - 100].")
         rpm_per_percent = self.max_speed_rpm / 100.0
         speed_rpm = round(percent * rpm_per_percent)
-        self.log.debug(f"Setting motor speed to {percent}% "
-                       f"(i.e: {speed_rpm}[rpm]).")
+        self.log.debug("Setting motor speed to %s%% (i.e: %d[rpm]).", percent,
+                       speed_rpm)
         self._send_common_cmd_runze(self.codes.CommonCmd.SetDynamicSpeed,
                                     speed_rpm, wait)
         self.syringe_speed_percent = percent # If no errors, save for getter fn.
@@ -189,7 +391,7 @@ class MiniSY04(SyringePump):
         20000: 9600
     }
 
-    def __init__(self, com_port: str, baudrate: int = None,
+    def __init__(self, com_port: Union[str, RunzeBus], baudrate: int = None,
                  address: int = 0x31, syringe_volume_ul: int = None):
         # Only RUNZE Protocol is supported for MiniSY04.
         super().__init__(com_port=com_port, baudrate=baudrate,
@@ -203,8 +405,8 @@ class MiniSY04(SyringePump):
                                 self.codes.CommonCmd.GetFirmwareVersion)
             subversion_reply = self._send_query_runze(
                                 self.codes.CommonCmd.GetFirmwareSubVersion)
-            version = version_reply['parameter']
-            subversion = subversion_reply['parameter']
+            version = version_reply.parameter
+            subversion = subversion_reply.parameter
             return float(f"{version}.{subversion}")
         else:
             raise NotImplementedError
@@ -212,8 +414,9 @@ class MiniSY04(SyringePump):
     def force_stop(self):
         """Halt the syringe pump in its current location."""
         # MiniSY04 Force-Stop doesn't need to check if a previous cmd was sent.
-        self.log.debug(f"Halting.")
+        self.log.debug("Halting.")
         # Always send--even if prior cmd has not been received.
+        self.motion.cancel()
         self._send_common_cmd_runze(self.codes.CommonCmd.ForceStop,
                                     wait=True, force=True)
         # Update local step count.
@@ -240,10 +443,9 @@ class MiniSY04(SyringePump):
         if delta_steps == 0:
             self.log.debug("Not sending a 0-step movement command to device.")
             return
-        range_percent = steps/self.max_position_steps * 100.0
-        self.log.debug(f"Absolute move to {steps}/"
-                       f"{self.max_position_steps} [steps] "
-                       f"i.e: {range_percent:.2f}% full-scale range.")
+        self.log.debug("Absolute move to %d/%d [steps] i.e: %.2f%% full-scale "
+                       "range.", steps, self.max_position_steps,
+                       steps / self.max_position_steps * 100.0)
         if delta_steps > 0:
             self.withdraw_steps(delta_steps, wait=wait)
         else:
@@ -251,7 +453,7 @@ class MiniSY04(SyringePump):
         # Driver can acccumulate error since the actual steps moved
         # isn't always the desired number of steps.
         if wait: # Sync with actual hardware position.
-            self.log.debug(f"Updating position after absolute move.")
+            self.log.debug("Updating position after absolute move.")
             position_steps = self.get_position_steps()  # updates local count.
 
     def move_absolute_in_percent(self, percent: float, wait: bool = True):
@@ -282,7 +484,7 @@ class SY08(SyringePump):
         25000: 12000
     }
 
-    def __init__(self, com_port: str, baudrate: int = None,
+    def __init__(self, com_port: Union[str, RunzeBus], baudrate: int = None,
                  address: int = 0x31, syringe_volume_ul: int = None):
         # Only RUNZE Protocol is supported for MiniSY04.
         super().__init__(com_port=com_port, baudrate=baudrate,
@@ -297,12 +499,12 @@ class SY08(SyringePump):
         if (steps > self.max_position_steps) or (steps < 0):
             raise ValueError(f"Requested plunger movement ({steps}) is out of "
                              f"range [0 - self.max_position_steps].")
-        range_percent = steps/self.max_position_steps * 100.0
-        self.log.debug(f"Absolute move to {steps}/"
-                       f"{self.max_position_steps} [steps] "
-                       f"i.e: {range_percent:.2f}% full-scale range.")
-        self._send_common_cmd_runze(sy08_codes.CommonCmd.MoveSyringeAbsolute,
-                                    steps, wait)
+        self.log.debug("Absolute move to %d/%d [steps] i.e: %.2f%% full-scale "
+                       "range.", steps, self.max_position_steps,
+                       steps / self.max_position_steps * 100.0)
+        with self._predicting_move(steps - self.driver_steps):
+            self._send_common_cmd_runze(
+                sy08_codes.CommonCmd.MoveSyringeAbsolute, steps, wait)
         self.driver_steps = steps
 
     def move_absolute_in_percent(self, percent: float, wait: bool = True):
@@ -311,9 +513,9 @@ class SY08(SyringePump):
             raise ValueError(f"Requested plunger movement ({percent}) "
                              "is out of range [0 - 100].")
         steps = round(percent / 100.0 * self.max_position_steps)
-        self.log.debug(f"Absolute move to {steps}/"
-                       f"{self.max_position_steps} [steps] "
-                       f"i.e: {percent:.2f}% full-scale range.")
-        self._send_common_cmd_runze(sy08_codes.CommonCmd.MoveSyringeAbsolute,
-                                    steps, wait)
+        self.log.debug("Absolute move to %d/%d [steps] i.e: %.2f%% full-scale "
+                       "range.", steps, self.max_position_steps, percent)
+        with self._predicting_move(steps - self.driver_steps):
+            self._send_common_cmd_runze(
+                sy08_codes.CommonCmd.MoveSyringeAbsolute, steps, wait)
         self.driver_steps = steps
@@ -0,0 +1,82 @@
+"""Binary trace of the bytes crossing a bus."""
+from struct import Struct
+from time import perf_counter
+from typing import TextIO
+import sys
+
+TX = 0  # Host to device.
+RX = 1  # Device to host.
+STRAY = 2  # Device to host bytes discarded because they didn't frame into
+           # a reply.
+
+
+class FrameTrace:
+    """Ring buffer of the most recent bytes written to and read from a port.
+
+    Recording copies the bytes and a timestamp into a preallocated buffer,
+    so tracing can stay on without changing timing the way DEBUG logging
+    does. Nothing is formatted until the trace is dumped.
+
+    .. code-block:: python
+
+        trace = bus.enable_trace()
+        ...  # Reproduce the problem.
+        trace.dump()
+
+    """
+
+    CHUNK_SIZE = 16  # Max bytes per record. Longer reads span records.
+    RECORD = Struct(f"<dBB{CHUNK_SIZE}s")  # time [s], direction, length, bytes
+
+    def __init__(self, capacity: int = 4096):
+        """Init.
+
+        :param capacity: number of records to keep. Once full, the oldest
+            records are overwritten.
+        """
+        self.capacity = capacity
+        self._buffer = bytearray(capacity * self.RECORD.size)
+        self._next = 0  # Total records written so far.
+        self.start_time_s = perf_counter()
+
+    def record(self, direction: int, data: bytes):
+        """Record bytes sent (TX) or received (RX)."""
+        time_s = perf_counter()
+        pack_into = self.RECORD.pack_into
+        record_size = self.RECORD.size
+        chunk_size = self.CHUNK_SIZE
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            pack_into(self._buffer, (self._next % self.capacity) * record_size,
+                      time_s, direction, len(chunk), chunk)
+            self._next += 1
+
+    def clear(self):
+        self._next = 0
+
+    def __len__(self):
+        return min(self._next, self.capacity)
+
+    def records(self):
+        """Return the recorded (time [s], direction, bytes) tuples, oldest
+        first."""
+        first = max(0, self._next - self.capacity)
+        unpack_from = self.RECORD.unpack_from
+        records = []
+        for index in range(first, self._next):
+            time_s, direction, length, chunk = unpack_from(
+                self._buffer, (index % self.capacity) * self.RECORD.size)
+            records.append((time_s, direction, chunk[:length]))
+        return records
+
+    def format(self):
+        """Return the trace as lines of text, oldest first."""
+        return [f"{time_s - self.start_time_s:12.6f} "
+                f"{'TX' if direction == TX else 'RX'} {data.hex(' ')}"
+                for time_s, direction, data in self.records()]
+
+    def dump(self, file: TextIO = None):
+        """Write the trace as text to `file` (stderr by default)."""
+        file = sys.stderr if file is None else file
+        for line in self.format():
+            print(line, file=file)
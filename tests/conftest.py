@@ -0,0 +1,22 @@
+"""Fixtures shared by the tests: emulated devices on an emulated bus."""
+from runze_control.emulator import EmulatedBus
+from runze_control.runze_bus import RunzeBus
+import pytest
+
+BAUDRATE = 115200  # Keep emulated wire time short.
+
+
+@pytest.fixture
+def emulated_bus():
+    bus = EmulatedBus()
+    yield bus
+    bus.close()
+
+
+@pytest.fixture
+def runze_bus(emulated_bus):
+    """A RunzeBus connected to `emulated_bus`. Add emulated devices (at
+    `BAUDRATE`) before connecting drivers to it."""
+    bus = RunzeBus(emulated_bus.serial(BAUDRATE))
+    yield bus
+    bus.close()
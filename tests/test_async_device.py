@@ -0,0 +1,79 @@
+"""asyncio drivers sharing one emulated bus."""
+from conftest import BAUDRATE
+from runze_control.async_device import (AsyncBusReader, AsyncRotaryValve,
+                                        AsyncSyringePump)
+from runze_control.emulator import EmulatedRotaryValve, EmulatedSY08
+from runze_control.rotary_valve import RotaryValve
+from runze_control.syringe_pump import SY08
+from time import perf_counter
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def pumps(emulated_bus, runze_bus):
+    pumps = []
+    for address in (0x00, 0x01):
+        emulated_bus.add_device(EmulatedSY08(address=address,
+                                             syringe_volume_ul=5000,
+                                             baudrate=BAUDRATE))
+        pumps.append(AsyncSyringePump(SY08(runze_bus, address=address,
+                                           syringe_volume_ul=5000)))
+    return pumps
+
+
+def test_pumps_on_one_bus_move_concurrently(emulated_bus, pumps):
+    async def move_both():
+        for pump in pumps:
+            await pump.set_speed_percent(100)
+        start_s = perf_counter()
+        await asyncio.gather(*(pump.move_absolute_in_steps(1200)
+                               for pump in pumps))
+        return perf_counter() - start_s
+
+    move_s = asyncio.run(move_both())
+    assert move_s < 1.5 * emulated_bus.devices[0].move_duration_s(1200)
+    assert [device.position_at(perf_counter())
+            for device in emulated_bus.devices] == [1200, 1200]
+
+
+def test_wait_until_idle_after_move_without_waiting(emulated_bus, pumps):
+    pump = pumps[0]
+
+    async def move():
+        await pump.set_speed_percent(100)
+        await pump.move_absolute_in_steps(600, wait=False)
+        assert pump.device.motion.is_moving()
+        await pump.wait_until_idle()
+        return await pump.get_position_steps()
+
+    assert asyncio.run(move()) == 600
+    assert not emulated_bus.devices[0].is_moving(perf_counter())
+
+
+def test_closing_the_reader_cancels_waiters(pumps):
+    bus = pumps[0].device.bus
+
+    async def wait_for_silence():
+        reader = AsyncBusReader.for_bus(bus)
+        waiter = asyncio.ensure_future(reader.get_reply(0x05, timeout_s=5))
+        await asyncio.sleep(0.05)  # Let it start waiting.
+        reader.close()
+        await waiter
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(wait_for_silence())
+
+
+def test_valve_moves_the_short_way(emulated_bus, runze_bus):
+    device = emulated_bus.add_device(EmulatedRotaryValve(
+        address=0x02, position_count=12, baudrate=BAUDRATE))
+    valve = AsyncRotaryValve(RotaryValve(runze_bus, address=0x02,
+                                         position_count=12))
+
+    async def move():
+        await valve.move_to_position(11)
+        return await valve.get_position()
+
+    assert asyncio.run(move()) == 11
+    assert device.ports_travelled == 2
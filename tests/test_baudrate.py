@@ -0,0 +1,84 @@
+"""Baud rate upgrades with verification and rollback."""
+from runze_control.baudrate import upgrade_baudrate
+from runze_control.emulator import EmulatedSY08
+from runze_control.registry import DeviceRegistry
+from runze_control.runze_bus import RunzeBus
+from runze_control.syringe_pump import SY08
+from serial import SerialException
+import pytest
+
+BAUDRATES = [19200, 57600, 115200]
+
+
+class FlakySY08(EmulatedSY08):
+    """Switches to any rate, but its replies are garbled above
+    `MAX_BAUDRATE`. If `deaf`, it can't hear the host there either."""
+    MAX_BAUDRATE = 57600
+
+    def __init__(self, *args, deaf: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deaf = deaf
+
+    def receive(self, *args, **kwargs):
+        if not (self.deaf and self.baudrate > self.MAX_BAUDRATE):
+            super().receive(*args, **kwargs)
+
+    def receive_factory(self, *args, **kwargs):
+        if not (self.deaf and self.baudrate > self.MAX_BAUDRATE):
+            super().receive_factory(*args, **kwargs)
+
+    def pop_due_replies(self, now_s: float):
+        garbled = self.baudrate > self.MAX_BAUDRATE
+        replies = super().pop_due_replies(now_s)
+        return [] if garbled else replies
+
+
+@pytest.fixture
+def bus(emulated_bus):
+    bus = RunzeBus(emulated_bus.serial(9600))
+    yield bus
+    bus.close()
+
+
+def connect(emulated_bus, bus, devices):
+    pumps = []
+    for device in devices:
+        emulated_bus.add_device(device)
+        pumps.append(SY08(bus, address=device.address,
+                          syringe_volume_ul=5000))
+    return pumps
+
+
+def test_upgrade_to_fastest_rate(tmp_path, emulated_bus, bus):
+    pumps = connect(emulated_bus, bus,
+                    [EmulatedSY08(address=address, syringe_volume_ul=5000)
+                     for address in (0x00, 0x01)])
+    registry = DeviceRegistry(tmp_path / "devices.json")
+    result = upgrade_baudrate(pumps, BAUDRATES, interface="RS485",
+                              registry=registry, benchmark_count=5)
+    assert (result.old_baudrate, result.new_baudrate) == (9600, 115200)
+    assert result.round_trip_after_s < result.round_trip_before_s
+    assert [d.baudrate for d in emulated_bus.devices] == [115200, 115200]
+    assert pumps[1].get_position_steps() == 0  # Still reachable.
+    assert [e["baudrate"] for e in registry.entries()] == [115200, 115200]
+
+
+def test_failed_upgrade_rolls_back_then_tries_slower_rate(emulated_bus, bus):
+    pumps = connect(emulated_bus, bus,
+                    [EmulatedSY08(address=0x00, syringe_volume_ul=5000),
+                     FlakySY08(address=0x01, syringe_volume_ul=5000)])
+    result = upgrade_baudrate(pumps, BAUDRATES, interface="RS485",
+                              benchmark_count=0)
+    assert result.new_baudrate == 57600
+    assert bus.baudrate == 57600
+    assert [d.baudrate for d in emulated_bus.devices] == [57600, 57600]
+    assert [p.get_address() for p in pumps] == [0x00, 0x01]
+
+
+def test_failed_rollback_is_reported(emulated_bus, bus):
+    pump, = connect(emulated_bus, bus,
+                    [FlakySY08(address=0x00, syringe_volume_ul=5000,
+                               deaf=True)])
+    with pytest.raises(SerialException, match="Could not restore 9600"):
+        upgrade_baudrate(pump, [115200], benchmark_count=0)
+    assert bus.baudrate == 9600
@@ -0,0 +1,80 @@
+"""Recording a bus to a capture file, reading it back, and replaying it."""
+from conftest import BAUDRATE
+from runze_control.capture import CaptureReader, CaptureReplay
+from runze_control.emulator import EmulatedSY08
+from runze_control.runze_bus import RunzeBus
+from runze_control.runze_protocol import COMMON_FRAME
+from runze_control.syringe_pump import SY08
+from runze_control.trace import RX, STRAY, TX
+from time import sleep
+import pytest
+
+
+@pytest.fixture
+def sy08(emulated_bus, runze_bus):
+    emulated_bus.add_device(EmulatedSY08(address=0x02, syringe_volume_ul=5000,
+                                         baudrate=BAUDRATE))
+    return SY08(runze_bus, address=0x02, syringe_volume_ul=5000)
+
+
+def test_capture_round_trip(tmp_path, sy08):
+    path = tmp_path / "run.rzcap"
+    sy08.bus.start_capture(path)
+    sy08.get_position_steps()
+    sy08.move_absolute_in_steps(100)
+    sy08.bus.stop_capture()
+    with CaptureReader(path) as capture:
+        frames = list(capture)
+        assert [f.direction for f in frames] == [TX, RX, TX, RX]
+        assert all(f.address == 0x02 for f in frames)
+        assert all(len(f.data) == COMMON_FRAME.size for f in capture.frames(
+            direction=TX))
+        assert len(list(capture.frames(direction=RX, start_s=frames[2].time_s))) \
+            == 1
+
+
+def test_capture_is_flushed_without_a_later_frame(tmp_path, sy08):
+    path = tmp_path / "stall.rzcap"
+    writer = sy08.bus.start_capture(path, flush_interval_s=0.05)
+    sy08.get_position_steps()
+    sleep(0.2)  # No more traffic, as if the pump stalled.
+    with CaptureReader(path) as capture:  # Read while still capturing.
+        assert len(list(capture)) == writer.frame_count == 2
+    sy08.bus.stop_capture()
+
+
+def test_capture_records_stray_bytes(tmp_path, emulated_bus):
+    port = emulated_bus.serial()
+    bus = RunzeBus(port)
+    path = tmp_path / "noise.rzcap"
+    bus.start_capture(path)
+    port._receive(bytes(range(1, 10)))  # Noise at least a frame long.
+    assert bus.poll() == 0
+    bus.close()
+    with CaptureReader(path) as capture:
+        frame, = list(capture)
+    assert frame.direction == STRAY
+    assert bytes(frame.data) == bytes(range(1, 10))
+
+
+def test_replay_answers_like_the_captured_device(tmp_path, emulated_bus,
+                                                  runze_bus):
+    path = tmp_path / "run.rzcap"
+    emulated_bus.add_device(EmulatedSY08(address=0x02, syringe_volume_ul=5000,
+                                         baudrate=BAUDRATE))
+    runze_bus.start_capture(path)
+    pump = SY08(runze_bus, address=0x02, syringe_volume_ul=5000)
+    pump.move_absolute_in_steps(100)
+    captured_steps = pump.get_position_steps()
+    runze_bus.stop_capture()
+    replay = CaptureReplay(path, speed=10, strict=True)
+    bus = RunzeBus(replay.serial(BAUDRATE))
+    try:
+        pump = SY08(bus, address=0x02, syringe_volume_ul=5000)
+        pump.move_absolute_in_steps(100)
+        assert pump.get_position_steps() == captured_steps
+        assert replay.done
+        assert replay.mismatch_count == 0
+    finally:
+        bus.close()
+        replay.close()
@@ -0,0 +1,71 @@
+"""Pipelined device calls on a command queue."""
+from concurrent.futures import CancelledError
+from conftest import BAUDRATE
+from runze_control.command_queue import CommandQueue
+from runze_control.emulator import EmulatedSY08
+from runze_control.syringe_pump import SY08
+from threading import Event
+from time import perf_counter
+import pytest
+
+
+@pytest.fixture
+def sy08(emulated_bus, runze_bus):
+    emulated_bus.add_device(EmulatedSY08(address=0x00, syringe_volume_ul=5000,
+                                         baudrate=BAUDRATE))
+    pump = SY08(runze_bus, address=0x00, syringe_volume_ul=5000)
+    yield pump
+    pump.close()
+
+
+def test_queued_moves_run_in_order(emulated_bus, sy08):
+    sy08.submit(sy08.set_speed_percent, 100)
+    moves = [sy08.submit(sy08.move_absolute_in_steps, steps)
+             for steps in (300, 100, 200)]
+    position = sy08.submit(sy08.get_position_steps)
+    assert position.result(timeout=5) == 200
+    assert all(move.done() and move.exception() is None for move in moves)
+    assert emulated_bus.devices[0].position_at(perf_counter()) == 200
+
+
+def test_failure_cancels_pending_calls(emulated_bus, sy08):
+    release = Event()
+    sy08.submit(release.wait, 5)  # Hold the queue until it's filled.
+    bad_move = sy08.submit(sy08.move_absolute_in_steps, 99999)
+    later_moves = [sy08.submit(sy08.move_absolute_in_steps, steps)
+                   for steps in (300, 600)]
+    release.set()
+    with pytest.raises(ValueError):
+        bad_move.result(timeout=5)
+    for move in later_moves:
+        with pytest.raises(CancelledError):
+            move.result(timeout=5)
+    assert emulated_bus.devices[0].position_at(perf_counter()) == 0
+    # The queue keeps running calls submitted after the failure.
+    assert sy08.submit(sy08.get_position_steps).result(timeout=5) == 0
+
+
+def test_failure_cancels_calls_queued_while_it_ran():
+    queue = CommandQueue("test")
+    release = Event()
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError("Device replied with error code: MotorStalled.")
+
+    failed = queue.submit(fail)
+    pending = [queue.submit(lambda: None) for _ in range(3)]
+    release.set()
+    with pytest.raises(RuntimeError):
+        failed.result(timeout=5)
+    assert all(future.cancelled() for future in pending)
+    queue.close()
+
+
+def test_close_finishes_queued_calls():
+    queue = CommandQueue("test")
+    results = [queue.submit(pow, 2, n) for n in range(4)]
+    queue.close()
+    assert [future.result(timeout=0) for future in results] == [1, 2, 4, 8]
+    with pytest.raises(RuntimeError):
+        queue.submit(pow, 2, 4)
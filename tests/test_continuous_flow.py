@@ -0,0 +1,72 @@
+"""Continuous flow from two alternating emulated SY08 pumps."""
+from conftest import BAUDRATE
+from runze_control.continuous_flow import ContinuousFlow
+from runze_control.emulator import EmulatedSY08
+from runze_control.syringe_pump import SY08
+import pytest
+
+STROKE_UL = 10  # 24 [steps] on a 5 [mL] syringe. Short strokes keep the
+                # test short at a low flow rate.
+
+
+@pytest.fixture
+def pumps(emulated_bus, runze_bus):
+    pumps = []
+    for address in (0x00, 0x01):
+        emulated_bus.add_device(EmulatedSY08(address=address,
+                                             syringe_volume_ul=5000,
+                                             baudrate=BAUDRATE))
+        pumps.append(SY08(runze_bus, address=address, syringe_volume_ul=5000))
+    return pumps
+
+
+def test_refill_must_fit_within_a_stroke(pumps):
+    with pytest.raises(ValueError):  # A 10 [uL] stroke at 40 [mL/min].
+        ContinuousFlow(*pumps, flow_rate_ul_per_min=40000,
+                       stroke_ul=STROKE_UL)
+
+
+def test_stroke_must_fit_in_both_syringes(pumps):
+    with pytest.raises(ValueError):
+        ContinuousFlow(*pumps, flow_rate_ul_per_min=500, stroke_ul=6000)
+
+
+def test_drift_is_made_up_by_timing_before_speed(pumps):
+    flow = ContinuousFlow(*pumps, flow_rate_ul_per_min=400,
+                          stroke_ul=STROKE_UL)
+    flow._behind_time_s = 0
+    speed_rpm = pumps[1].max_speed_rpm / 100
+
+    # A stroke at 5 [rpm] (~417 [uL/min]) ends 0.4 [uL] ahead.
+    flow._behind_ul = 0.4 + 0.5  # 0.5 [uL] is 75 [ms] of flow.
+    speed_percent, lead_s = flow._drift_correction(0, 0, 1, 24)
+    assert lead_s == pytest.approx(0.075)
+    assert speed_percent * speed_rpm == 5  # Nearest to 400 [uL/min].
+
+    flow._behind_ul = 0.4 - 5  # More than timing can make up. Slow down.
+    speed_percent, lead_s = flow._drift_correction(0, 0, 1, 24)
+    assert lead_s == pytest.approx(-0.1 * 24 / 200 / 5 * 60)
+    assert speed_percent * speed_rpm == 4
+
+
+def test_drift_from_slow_pumps_converges(emulated_bus, pumps):
+    # At 400 [uL/min], both pumps run at 5 [rpm] (~417 [uL/min]), but they
+    # really move 7% slower. That is less than one rpm step, so drift can't
+    # be made up by speed alone.
+    for device in emulated_bus.devices:
+        device.steps_per_revolution = 186
+    flow = ContinuousFlow(*pumps, flow_rate_ul_per_min=400,
+                          stroke_ul=STROKE_UL)
+    behind_ul = []
+    finish_stroke = flow._finish_stroke
+
+    def record_behind(*args):
+        finish_stroke(*args)
+        behind_ul.append(flow._behind_ul)
+
+    flow._finish_stroke = record_behind
+    flow.run(10)
+    uncorrected_ul = 0.07 * STROKE_UL * len(behind_ul)
+    assert len(behind_ul) >= 5
+    assert abs(behind_ul[-1]) < 0.05 * STROKE_UL < uncorrected_ul / 5
+    assert max(abs(b) for b in behind_ul[-3:]) < 0.1 * STROKE_UL
@@ -0,0 +1,79 @@
+"""Multicast commands to a DeviceGroup of emulated pumps."""
+from conftest import BAUDRATE
+from runze_control.device_group import DeviceGroup
+from runze_control.emulator import EmulatedSY01B, EmulatedSY08
+from runze_control.multichannel_syringe_pump import SY01B
+from runze_control.syringe_pump import SY08
+from runze_control.trace import TX
+import pytest
+
+MULTICAST_ADDRESS = 0x80
+
+
+@pytest.fixture
+def group(emulated_bus, runze_bus):
+    for address in (0x00, 0x01, 0x02):
+        emulated_bus.add_device(EmulatedSY08(address=address,
+                                             syringe_volume_ul=5000,
+                                             baudrate=BAUDRATE))
+    pumps = [SY08(runze_bus, address=address, syringe_volume_ul=5000)
+             for address in (0x00, 0x01, 0x02)]
+    group = DeviceGroup(pumps, multicast_address=MULTICAST_ADDRESS)
+    group.configure(multicast_channel=1)
+    return group
+
+
+def test_configure_assigns_multicast_address(emulated_bus, group):
+    assert all(d.multicast_addresses[0] == MULTICAST_ADDRESS
+               for d in emulated_bus.devices)
+    assert all(p.get_multicast_address(1) == MULTICAST_ADDRESS
+               for p in group.devices)
+
+
+def test_one_frame_moves_every_member(emulated_bus, group):
+    trace = group.bus.enable_trace()
+    group.move_absolute_in_steps(300)
+    sent = [data for _, direction, data in trace.records() if direction == TX]
+    assert len(sent) == 1  # One frame for the whole group.
+    group.wait()
+    assert [p.get_position_steps() for p in group.devices] == [300] * 3
+    assert not group.is_busy()
+
+
+def test_members_do_not_reply_to_group_frames(group):
+    group.aspirate_steps(100)
+    group.wait()
+    assert group.bus.poll() == 0
+    assert all(p.cmd_send_time_s is None for p in group.devices)
+
+
+def test_multicast_address_cannot_be_a_member_address(group):
+    with pytest.raises(ValueError):
+        DeviceGroup(group.devices, multicast_address=0x01)
+
+
+def test_status_queries_do_not_teach_the_motion_model(group):
+    for steps in (600, 0, 600):
+        group.move_absolute_in_steps(steps)
+        assert group.devices[0].get_position_steps() != steps  # Mid-move.
+        group.wait()
+    assert [p.motion.correction for p in group.devices] == [1.0] * 3
+
+
+def test_relative_moves_refuse_members_whose_run_cmds_turn_the_valve(
+        emulated_bus, runze_bus):
+    for address in (0x00, 0x01):
+        emulated_bus.add_device(EmulatedSY01B(address=address,
+                                              syringe_volume_ul=25,
+                                              position_count=9,
+                                              baudrate=BAUDRATE))
+    pumps = [SY01B(runze_bus, address=address, syringe_volume_ul=25,
+                   position_count=9) for address in (0x00, 0x01)]
+    group = DeviceGroup(pumps, multicast_address=MULTICAST_ADDRESS)
+    trace = runze_bus.enable_trace()
+    with pytest.raises(ValueError):
+        group.aspirate_steps(100)
+    with pytest.raises(ValueError):
+        group.dispense_steps(100)
+    assert not trace.records()  # Nothing sent.
+    assert [p.driver_steps for p in pumps] == [0, 0]
@@ -0,0 +1,60 @@
+"""Baud rate and address discovery across emulated ports."""
+from runze_control import discovery
+from runze_control.discovery import DiscoveredDevice, discover
+from runze_control.emulator import EmulatedBus, EmulatedSY08
+from runze_control.runze_bus import RunzeBus
+from serial import SerialException
+from time import perf_counter
+import pytest
+
+BAUDRATES = [9600, 38400, 115200]
+PROBE_TIMEOUT_S = 0.05
+
+
+@pytest.fixture
+def ports(monkeypatch):
+    """Emulated buses by port name. Opening any other port fails."""
+    buses = {"rs232": EmulatedBus([EmulatedSY08(address=0x03,
+                                                syringe_volume_ul=5000,
+                                                baudrate=38400,
+                                                firmware_version=(2, 1))]),
+             "rs485": EmulatedBus([EmulatedSY08(address=address,
+                                                syringe_volume_ul=5000,
+                                                baudrate=115200)
+                                   for address in (0x00, 0x02)]),
+             "empty": EmulatedBus()}
+
+    def open_bus(port, baudrate=9600):
+        if port not in buses:
+            raise SerialException(f"could not open port {port}.")
+        return RunzeBus(buses[port].serial(baudrate))
+
+    monkeypatch.setattr(discovery, "RunzeBus", open_bus)
+    yield buses
+    for bus in buses.values():
+        bus.close()
+
+
+def test_device_reports_its_own_address(ports):
+    assert discovery.discover_port("rs232", BAUDRATES,
+                                   probe_timeout_s=PROBE_TIMEOUT_S) \
+        == [DiscoveredDevice("rs232", 38400, 0x03, None, 2.1)]
+
+
+def test_listed_addresses_are_probed_individually(ports):
+    found = discovery.discover_port("rs485", BAUDRATES, addresses=range(4),
+                                    probe_timeout_s=PROBE_TIMEOUT_S)
+    assert [(d.baudrate, d.address) for d in found] \
+        == [(115200, 0x00), (115200, 0x02)]
+
+
+def test_ports_are_scanned_concurrently(ports):
+    start_s = perf_counter()
+    found = discover(["rs485", "missing", "empty", "rs232"], BAUDRATES,
+                     addresses=range(4), probe_timeout_s=PROBE_TIMEOUT_S)
+    elapsed_s = perf_counter() - start_s
+    assert [(d.port, d.address) for d in found] \
+        == [("rs232", 0x03), ("rs485", 0x00), ("rs485", 0x02)]
+    # Every probe of the empty port times out. The others overlap it.
+    empty_port_s = len(BAUDRATES) * 4 * PROBE_TIMEOUT_S
+    assert elapsed_s < 1.5 * empty_port_s
@@ -0,0 +1,80 @@
+"""Regression tests for paths that only show up against a device with real
+timing: multicast moves, closing with waiters pending, corrupted replies."""
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from conftest import BAUDRATE
+from runze_control.device_group import DeviceGroup
+from runze_control.emulator import EmulatedSY08
+from runze_control.fleet import Fleet
+from runze_control.runze_protocol import ReplyStatus
+from runze_control.syringe_pump import SY08
+from serial import SerialException
+from time import perf_counter, sleep
+import pytest
+
+
+@pytest.fixture
+def pumps(emulated_bus, runze_bus):
+    for address in (0x00, 0x01):
+        emulated_bus.add_device(EmulatedSY08(address=address,
+                                             syringe_volume_ul=5000,
+                                             baudrate=BAUDRATE))
+    pumps = [SY08(runze_bus, address=address, syringe_volume_ul=5000)
+             for address in (0x00, 0x01)]
+    for pump in pumps:
+        pump.set_speed_percent(100)
+    return pumps
+
+
+def test_multicast_move_is_confirmed_by_status_queries(emulated_bus, pumps):
+    group = DeviceGroup(pumps, multicast_address=0x80)
+    group.configure(multicast_channel=1)
+    group.move_absolute_in_steps(600)  # Nobody replies to this frame.
+    fleet = Fleet(pumps)
+    try:
+        fleet.wait_all(pumps, timeout_s=5)
+        done_s = perf_counter()
+    finally:
+        fleet.close()
+    assert not any(d.is_moving(done_s) for d in emulated_bus.devices)
+    assert [p.get_motor_status() for p in pumps] \
+        == [ReplyStatus.NormalState] * 2
+    assert [p.get_position_steps() for p in pumps] == [600, 600]
+    assert group.bus.pop_reply() is None  # No stray replies left behind.
+
+
+def test_close_with_waiters_pending(pumps):
+    fleet = Fleet(pumps)
+    fleet.submit(pumps, "move_absolute_in_steps", 1200)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        waiting = [executor.submit(fleet.wait_all, [pump]) for pump in pumps]
+        sleep(0.1)
+        start_s = perf_counter()
+        fleet.close()
+        for future in waiting:
+            with pytest.raises(CancelledError):
+                future.result(timeout=1)
+        assert perf_counter() - start_s < 0.5
+    for pump in pumps:  # Still usable without the fleet.
+        pump.wait_until_idle()
+        assert pump.get_position_steps() == 1200
+
+
+def test_corrupted_reply_fails_fast(emulated_bus, pumps):
+    pump = pumps[0]
+    emulated_bus.devices[0].corrupt_next_reply = True
+    start_s = perf_counter()
+    with pytest.raises(SerialException, match="Corrupted reply"):
+        pump.get_position_steps()
+    assert perf_counter() - start_s < 0.1  # Not the reply timeout.
+    assert pump.get_position_steps() == 0  # The next reply is fine.
+
+
+def test_corrupted_move_reply_fails_when_the_move_ends(emulated_bus, pumps):
+    pump, device = pumps[0], emulated_bus.devices[0]
+    device.corrupt_next_reply = True
+    start_s = perf_counter()
+    with pytest.raises(SerialException, match="Corrupted reply"):
+        pump.move_absolute_in_steps(600)
+    assert perf_counter() - start_s < device.move_duration_s(600) + 0.1
+    assert not pump.is_busy()
+    assert pump.get_position_steps() == 600
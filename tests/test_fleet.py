@@ -0,0 +1,94 @@
+"""Waiting on emulated pumps across several ports with a Fleet."""
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from conftest import BAUDRATE
+from runze_control.device_group import DeviceGroup
+from runze_control.emulator import EmulatedBus, EmulatedSY08
+from runze_control.fleet import Fleet
+from runze_control.runze_bus import RunzeBus
+from runze_control.runze_protocol import ReplyStatus
+from runze_control.syringe_pump import SY08
+from serial import SerialException
+from time import perf_counter, sleep
+import pytest
+
+
+@pytest.fixture
+def pumps():
+    """Two pumps on each of two ports."""
+    emulated_buses, buses, pumps = [], [], []
+    for _ in range(2):
+        emulated_bus = EmulatedBus()
+        bus = RunzeBus(emulated_bus.serial(BAUDRATE))
+        for address in (0x00, 0x01):
+            emulated_bus.add_device(EmulatedSY08(address=address,
+                                                 syringe_volume_ul=5000,
+                                                 baudrate=BAUDRATE))
+            pumps.append(SY08(bus, address=address, syringe_volume_ul=5000))
+        emulated_buses.append(emulated_bus)
+        buses.append(bus)
+    yield pumps
+    for bus in buses:
+        bus.close()
+    for emulated_bus in emulated_buses:
+        emulated_bus.close()
+
+
+def test_wait_all(pumps):
+    with Fleet(pumps) as fleet:
+        fleet.submit(pumps, "move_absolute_in_steps", 300)
+        fleet.wait_all(timeout_s=5)
+    assert all(p.cmd_send_time_s is None for p in pumps)
+    assert [p.get_position_steps() for p in pumps] == [300] * 4
+
+
+def test_wait_all_overlaps_moves(pumps):
+    # 600 steps at 360 [rpm] takes 0.5 [s]. Moving 4 pumps one after the
+    # other would take 2 [s].
+    with Fleet(pumps) as fleet:
+        start_s = perf_counter()
+        fleet.submit(pumps, "move_absolute_in_steps", 600)
+        fleet.wait_all(timeout_s=5)
+        assert perf_counter() - start_s < 1.5
+
+
+def test_wait_any_returns_first_done(pumps):
+    fast, slow = pumps[0], pumps[2]
+    with Fleet(pumps) as fleet:
+        fleet.submit([fast], "move_absolute_in_steps", 10)
+        fleet.submit([slow], "move_absolute_in_steps", 600)
+        assert fleet.wait_any([fast, slow], timeout_s=5) == [fast]
+        fleet.wait_all([slow], timeout_s=5)
+
+
+def test_wait_all_times_out(pumps):
+    with Fleet(pumps) as fleet:
+        fleet.submit(pumps[:1], "move_absolute_in_steps", 600)
+        with pytest.raises(SerialException):
+            fleet.wait_all(pumps[:1], timeout_s=0.05)
+        fleet.wait_all(pumps[:1], timeout_s=5)
+
+
+def test_wait_all_polls_a_move_that_outruns_its_prediction(pumps):
+    group = DeviceGroup(pumps[:2], multicast_address=0x80)
+    group.configure(multicast_channel=1)
+    for pump in group.devices:
+        pump.set_speed_percent(100)
+        pump.motion.correction = 0.5  # Predict half the actual duration.
+    group.move_absolute_in_steps(1200)
+    with Fleet(pumps) as fleet:
+        fleet.wait_all(group.devices, timeout_s=5)
+    assert [p.get_motor_status() for p in group.devices] \
+        == [ReplyStatus.NormalState] * 2
+    assert [p.get_position_steps() for p in group.devices] == [1200] * 2
+
+
+def test_close_cancels_pending_waits(pumps):
+    fleet = Fleet(pumps)
+    fleet.submit(pumps[:1], "move_absolute_in_steps", 1200)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        waiting = executor.submit(fleet.wait_all, pumps[:1])
+        sleep(0.1)
+        fleet.close()
+        with pytest.raises(CancelledError):
+            waiting.result(timeout=1)
+    pumps[0].wait_until_idle()
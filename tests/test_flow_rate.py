@@ -0,0 +1,54 @@
+"""Flow rate tables and the nearest achievable flow rate."""
+from runze_control.flow_rate import FlowRateTable, nominal_table
+from runze_control.syringe_pump import SY08
+import pytest
+
+
+@pytest.fixture
+def table():
+    return FlowRateTable(max_speed_rpm=500, ul_per_revolution=100)
+
+
+def test_nearest_rounds_to_closest_speed(table):
+    setting = table.nearest(1040)
+    assert setting.speed_rpm == 10
+    assert setting.actual_ul_per_min == pytest.approx(1000)
+    assert setting.error_ul_per_min == pytest.approx(-40)
+    assert table.nearest(1060).speed_rpm == 11
+
+
+@pytest.mark.parametrize("requested", [60, 100, 12345.6, 50000])
+def test_nearest_is_closest_achievable_rate(table, requested):
+    setting = table.nearest(requested)
+    best = min(table.rates_ul_per_min[1:],
+               key=lambda rate: abs(rate - requested))
+    assert setting.actual_ul_per_min == pytest.approx(best)
+
+
+@pytest.mark.parametrize("requested", [10, 50001])
+def test_nearest_rejects_out_of_range(table, requested):
+    with pytest.raises(ValueError):
+        table.nearest(requested)
+
+
+def test_calibration_corrects_rates():
+    table = FlowRateTable(max_speed_rpm=500, ul_per_revolution=100,
+                          calibration={100: 9000, 300: 30000})
+    assert table.rate_ul_per_min(100) == pytest.approx(9000)
+    assert table.rate_ul_per_min(200) == pytest.approx(200 * 100 * 0.95)
+    assert table.rate_ul_per_min(500) == pytest.approx(50000)
+    setting = table.nearest(9000)
+    assert setting.speed_rpm == 100
+
+
+def test_calibration_must_increase_with_speed():
+    with pytest.raises(ValueError):
+        FlowRateTable(max_speed_rpm=500, ul_per_revolution=100,
+                      calibration={100: 9000, 101: 8000})
+
+
+def test_nominal_table():
+    table = nominal_table(SY08, 5000)
+    # 5 [mL] over 12000 steps, 200 steps per revolution.
+    assert table.ul_per_revolution == pytest.approx(5000 / 60)
+    assert table.max_speed_rpm == 600
@@ -0,0 +1,60 @@
+"""Command counters and latency histograms."""
+from conftest import BAUDRATE
+from runze_control.emulator import EmulatedSY08
+from runze_control.metrics import LatencyHistogram, fleet_snapshot
+from runze_control.syringe_pump import SY08
+from serial import SerialException
+import pytest
+
+
+@pytest.fixture
+def sy08(emulated_bus, runze_bus):
+    emulated_bus.add_device(EmulatedSY08(address=0x00, syringe_volume_ul=5000,
+                                         baudrate=BAUDRATE))
+    pump = SY08(runze_bus, address=0x00, syringe_volume_ul=5000)
+    pump.metrics.reset()  # Forget the connection's queries.
+    return pump
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for duration_s in [0.00015] * 90 + [0.003] * 9 + [0.5]:
+        histogram.record(duration_s)
+    assert histogram.count == 100
+    assert histogram.percentile(50) == 0.0002  # Bucket upper bound.
+    assert histogram.percentile(99) == 0.0032
+    assert histogram.percentile(100) == 0.5  # Never past the largest sample.
+    assert sum(histogram.snapshot()["bucket_counts"]) == 100
+    assert LatencyHistogram().percentile(50) is None
+
+
+def test_replies_are_counted_per_command(sy08):
+    for _ in range(3):
+        sy08.get_position_steps()
+    stats = sy08.get_metrics()["commands"]["GetSyringePosition"]
+    assert (stats["sent"], stats["replies"], stats["timeouts"]) == (3, 3, 0)
+    assert stats["bytes_sent"] == stats["bytes_received"] == 3 * 8
+    latency = stats["reply_latency"]
+    assert latency["count"] == 3
+    assert 0 < stats["first_byte_latency"]["max_s"] <= latency["max_s"] < 0.1
+
+
+def test_errors_and_timeouts_are_counted(emulated_bus, sy08):
+    with pytest.raises(RuntimeError):
+        sy08._send_common_cmd_runze(sy08.codes.CommonCmd.SetDynamicSpeed, 0)
+    emulated_bus.devices[0].baudrate = 9600  # Stops hearing the host.
+    sy08._timeout_s = 0.05
+    with pytest.raises(SerialException):
+        sy08.get_position_steps()
+    snapshot = sy08.get_metrics()
+    assert snapshot["commands"]["SetDynamicSpeed"]["errors"] \
+        == {"ParameterError": 1}
+    assert snapshot["commands"]["GetSyringePosition"]["timeouts"] == 1
+    assert snapshot["totals"]["errors"] == snapshot["totals"]["timeouts"] == 1
+
+
+def test_fleet_snapshot_keys_devices_by_port_and_address(sy08):
+    sy08.get_position_steps()
+    snapshot = fleet_snapshot([sy08])
+    assert list(snapshot) == [f"{sy08.bus.com_port}.0x00"]
+    assert snapshot[f"{sy08.bus.com_port}.0x00"]["totals"]["replies"] == 1
@@ -0,0 +1,110 @@
+"""Retransmission of OEM Protocol commands whose replies are lost or late."""
+from runze_control import oem_protocol
+from runze_control.emulator import EmulatedBus, EmulatedSerial
+from runze_control.protocol import Protocol
+from runze_control.runze_bus import RunzeBus
+from runze_control.runze_device import RunzeDevice
+from serial import SerialException
+from threading import Timer
+from time import sleep
+import pytest
+
+REPLY_DELAY_S = 0.005
+TIMEOUT_S = RunzeDevice.OEM_REPLY_TIMEOUT_S
+
+
+def oem_reply(data: bytes):
+    frame = bytes([oem_protocol.PacketFields.STX, 0x30, 0x60]) + data \
+        + bytes([oem_protocol.PacketFields.ETX])
+    return frame + bytes([oem_protocol.checksum(frame)])
+
+
+class OEMDevicePort(EmulatedSerial):
+    """Host port of a device that answers each OEM packet with the command
+    string it carried, after a scripted delay."""
+
+    def __init__(self, bus: EmulatedBus):
+        super().__init__(bus)
+        self.packets = []
+        self.reply_delays_s = {}  # packet index -> delay [s] or None to drop.
+        self.corrupted = set()  # Indices of packets to reply to with a bad
+                                # checksum.
+
+    def write(self, data: bytes):
+        index = len(self.packets)
+        self.packets.append(bytes(data))
+        delay_s = self.reply_delays_s.get(index, REPLY_DELAY_S)
+        if delay_s is not None:
+            reply = oem_reply(bytes(data[3:-2]).rstrip(b"R"))
+            if index in self.corrupted:
+                reply = reply[:-1] + bytes([reply[-1] ^ 0xFF])
+            timer = Timer(delay_s, self._receive, args=(reply,))
+            timer.daemon = True
+            timer.start()
+        return len(data)
+
+
+@pytest.fixture
+def port():
+    emulated_bus = EmulatedBus()
+    port = OEMDevicePort(emulated_bus)
+    yield port
+    port.close()
+    emulated_bus.close()
+
+
+@pytest.fixture
+def device(port):
+    bus = RunzeBus(port, protocol=Protocol.OEM)
+    device = RunzeDevice(bus, address="1", protocol=Protocol.OEM)
+    yield device
+    bus.close()
+
+
+def test_reply_without_retransmission(port, device):
+    packets_sent = len(port.packets)
+    assert device._send_cmd_oem("A", execute=False).data == "A"
+    assert len(port.packets) == packets_sent + 1
+    assert device.oem_retransmissions == 0
+
+
+def test_lost_reply_is_retransmitted(port, device):
+    first = len(port.packets)
+    port.reply_delays_s[first] = None  # Drop the first reply.
+    assert device._send_cmd_oem("A", execute=False).data == "A"
+    original, repeat = port.packets[first:]
+    assert original[2] & oem_protocol.SEQUENCE_MASK \
+        == repeat[2] & oem_protocol.SEQUENCE_MASK
+    assert not original[2] & oem_protocol.SEQUENCE_REPEAT_FLAG
+    assert repeat[2] & oem_protocol.SEQUENCE_REPEAT_FLAG
+    assert device.oem_retransmissions == 1
+
+
+def test_late_duplicate_reply_is_not_read_by_the_next_command(port, device):
+    first = len(port.packets)
+    # The original reply is only late. It arrives after the repeat's reply.
+    port.reply_delays_s[first] = TIMEOUT_S * 1.5
+    assert device._send_cmd_oem("A", execute=False).data == "A"
+    assert device.oem_retransmissions == 1
+    sleep(TIMEOUT_S)  # Idle while the late reply lands.
+    assert device._send_cmd_oem("B", execute=False).data == "B"
+    assert device._send_cmd_oem("C", execute=False).data == "C"
+
+
+def test_corrupted_reply_is_retransmitted(port, device):
+    first = len(port.packets)
+    port.corrupted.add(first)
+    assert device._send_cmd_oem("A", execute=False).data == "A"
+    assert device.oem_retransmissions == 1
+    assert device._send_cmd_oem("B", execute=False).data == "B"
+
+
+def test_gives_up_after_max_retransmissions(port, device):
+    first = len(port.packets)
+    attempts = RunzeDevice.OEM_MAX_RETRANSMISSIONS + 1
+    for index in range(first, first + attempts):
+        port.reply_delays_s[index] = None
+    with pytest.raises(SerialException):
+        device._send_cmd_oem("A", execute=False)
+    assert len(port.packets) == first + attempts
+    assert device.oem_retransmissions == RunzeDevice.OEM_MAX_RETRANSMISSIONS
@@ -0,0 +1,279 @@
+"""Framing and parsing of Runze, DT and OEM Protocol replies."""
+from runze_control import dt_protocol, oem_protocol, runze_protocol
+from runze_control.emulator import EmulatedBus, reply_frame
+from runze_control.runze_bus import RunzeBus
+import random
+import pytest
+
+STX = runze_protocol.PacketFields.STX
+ETX = runze_protocol.PacketFields.ETX
+
+
+def feed_in_chunks(framer, data: bytes, chunk_sizes):
+    """Feed `data` to `framer` split at `chunk_sizes` and collect frames."""
+    frames = []
+    start = 0
+    for size in chunk_sizes:
+        frames += framer.feed(data[start:start + size])
+        start += size
+    frames += framer.feed(data[start:])
+    return frames
+
+
+# Runze Protocol.
+def test_parse_reply():
+    reply = runze_protocol.parse_reply(reply_frame(0x01, 0x00, 0x1234))
+    assert reply.addr == 0x01
+    assert reply.status == 0x00
+    assert reply.parameter == 0x1234
+    assert reply["parameter"] == 0x1234
+
+
+def test_parse_reply_rejects_bad_checksum():
+    frame = bytearray(reply_frame(0x01, 0x00, 0x1234))
+    frame[-2] ^= 0x01
+    with pytest.raises(ValueError, match="checksum"):
+        runze_protocol.parse_reply(frame)
+
+
+def test_parse_reply_rejects_bad_etx():
+    frame = bytearray(reply_frame(0x01, 0x00, 0x1234))
+    frame[5] = 0x00
+    with pytest.raises(ValueError, match="malformed"):
+        runze_protocol.parse_reply(frame)
+
+
+def test_parse_reply_rejects_bad_stx():
+    frame = bytearray(reply_frame(0x01, 0x00, 0x1234))
+    frame[0] = 0x00
+    with pytest.raises(ValueError, match="malformed"):
+        runze_protocol.parse_reply(frame)
+
+
+def test_encode_common_frame_checksum():
+    frame = runze_protocol.encode_common_frame_into(
+        bytearray(runze_protocol.COMMON_FRAME.size), 0x02, 0x42, 0x0304)
+    assert frame == bytes([STX, 0x02, 0x42, 0x04, 0x03, ETX]) \
+        + sum(frame[:6]).to_bytes(2, "little")
+
+
+def test_encode_factory_frame_checksum():
+    frame = runze_protocol.encode_factory_frame(0x02, 0xFF, 0x01)
+    assert len(frame) == runze_protocol.FACTORY_FRAME.size
+    assert frame[3:7] == runze_protocol.FACTORY_CMD_PWD_CODE.to_bytes(4, "little")
+    assert int.from_bytes(frame[-2:], "little") == sum(frame[:-2])
+
+
+def test_framer_reassembles_split_frames():
+    frames = [reply_frame(address, 0x00, address * 100)
+              for address in range(3)]
+    framer = runze_protocol.ReplyFramer()
+    assert feed_in_chunks(framer, b"".join(frames), [3, 7, 1, 9]) == frames
+    assert framer.resync_count == 0
+    assert framer.buffered_bytes == 0
+
+
+def test_framer_holds_partial_frame():
+    framer = runze_protocol.ReplyFramer()
+    frame = reply_frame(0x00, 0x00, 1)
+    assert framer.feed(frame[:5]) == []
+    assert framer.buffered_bytes == 5
+    assert framer.feed(frame[5:]) == [frame]
+
+
+def test_framer_skips_stray_stx():
+    frame = reply_frame(0x01, 0x00, 0x0102)
+    framer = runze_protocol.ReplyFramer()
+    assert framer.feed(bytes([STX, STX, 0x55]) + frame) == [frame]
+    assert framer.resync_count == 1  # One realignment, two candidates.
+    assert framer.discarded_bytes == 3
+
+
+def test_framer_counts_each_realignment_once():
+    frame = reply_frame(0x01, 0x00, 0x0102)
+    framer = runze_protocol.ReplyFramer()
+    assert framer.feed(bytes(9)) == []  # Stray bytes split across reads.
+    assert framer.feed(bytes([STX, 0x55]) + frame) == [frame]
+    assert framer.resync_count == 1
+    assert framer.feed(bytes([STX, STX]) + frame) == [frame]
+    assert framer.resync_count == 2
+
+
+def test_framer_reports_corrupted_frame():
+    first, second = reply_frame(0x01, 0x00, 7), reply_frame(0x02, 0x00, 8)
+    corrupted = bytearray(first)
+    corrupted[3] ^= 0x01
+    framer = runze_protocol.ReplyFramer()
+    assert framer.feed(bytes(corrupted) + second) == [second]
+    assert framer.corrupted == [bytes(corrupted)]
+    assert framer.resync_count == 0
+    assert framer.feed(second) == [second]
+    assert framer.corrupted == []
+
+
+def test_framer_prefers_a_valid_frame_to_a_corrupted_one():
+    # A stray STX whose B5 lands on an ETX byte of the frame after it.
+    frame = reply_frame(0x01, 0x00, ETX << 8)
+    framer = runze_protocol.ReplyFramer()
+    assert framer.feed(bytes([STX]) + frame[:6]) == []  # Can't tell yet.
+    assert framer.feed(frame[6:]) == [frame]
+    assert framer.corrupted == []
+
+
+def test_framer_recovers_after_truncated_frame():
+    first, second = reply_frame(0x01, 0x00, 7), reply_frame(0x02, 0x00, 8)
+    framer = runze_protocol.ReplyFramer()
+    assert framer.feed(first[:4] + second) == [second]
+
+
+def test_framer_fuzz():
+    """Valid frames survive any mix of stray bytes (including stray STX)
+    between them and any split into reads."""
+    rng = random.Random(0)
+    for _ in range(200):
+        frames = [reply_frame(rng.randrange(0x80), rng.choice((0x00, 0x04)),
+                              rng.randrange(0x10000))
+                  for _ in range(rng.randrange(1, 6))]
+        stream = bytearray()
+        for frame in frames:
+            stray = bytes(rng.choice((STX, rng.randrange(0x100)))
+                          for _ in range(rng.randrange(4)))
+            stream += stray + frame
+        chunk_sizes = [rng.randrange(1, 10) for _ in range(len(stream))]
+        framer = runze_protocol.ReplyFramer()
+        assert feed_in_chunks(framer, bytes(stream), chunk_sizes) == frames
+
+
+def test_bus_routes_replies_after_resync():
+    emulated_bus = EmulatedBus()
+    port = emulated_bus.serial()
+    bus = RunzeBus(port)
+    first, second = reply_frame(0x01, 0x00, 1), reply_frame(0x02, 0x00, 2)
+    port._receive(bytes([STX, 0x02]) + first[:3])  # Stray bytes, split frame.
+    port._receive(first[3:] + bytes([STX]) + second)
+    assert bus.get_reply(0x02, timeout_s=1.0) == second
+    assert bus.get_reply(0x01, timeout_s=1.0) == first
+    assert bus.resync_count > 0
+    bus.close()
+    emulated_bus.close()
+
+
+def test_bus_delivers_corrupted_replies_to_their_address():
+    emulated_bus = EmulatedBus()
+    port = emulated_bus.serial()
+    bus = RunzeBus(port)
+    corrupted = bytearray(reply_frame(0x01, 0x00, 1))
+    corrupted[-1] ^= 0x01
+    port._receive(bytes(corrupted))
+    assert bus.get_reply(0x02) == bytes()
+    assert bus.get_reply(0x01, timeout_s=1.0) == corrupted
+    bus.close()
+    emulated_bus.close()
+
+
+# DT Protocol.
+def dt_reply(status: int, data: str = ""):
+    return f"/0{chr(status)}{data}\x03\r\n".encode("ascii")
+
+
+def test_dt_encode_command():
+    assert dt_protocol.encode_command("1", "P100") == b"/1P100R\r"
+    assert dt_protocol.encode_command("1", "?", execute=False) == b"/1?\r"
+
+
+def test_dt_parse_reply():
+    reply = dt_protocol.parse_reply(dt_reply(0x60, "1200"))
+    assert reply.data == "1200"
+    assert reply.ready
+    assert reply.error == dt_protocol.Status.NoError
+
+
+def test_dt_parse_reply_reports_error():
+    reply = dt_protocol.parse_reply(dt_reply(0x43))
+    assert not reply.ready
+    assert reply.error == dt_protocol.Status.InvalidOperand
+
+
+def test_dt_parse_reply_rejects_malformed_frame():
+    with pytest.raises(ValueError):
+        dt_protocol.parse_reply(b"/0`12\r")  # Missing LF.
+    with pytest.raises(ValueError):
+        dt_protocol.parse_reply(b"x0`12\r\n")
+
+
+def test_dt_framer_resyncs_and_reassembles():
+    first, second = dt_reply(0x60, "12"), dt_reply(0x40)
+    framer = dt_protocol.ReplyFramer()
+    frames = feed_in_chunks(framer, b"\xff\x00" + first + b"junk" + second,
+                            [1, 4, 2, 6])
+    assert frames == [first, second]
+    assert framer.discarded_bytes == 6
+    assert framer.buffered_bytes == 0
+
+
+# OEM Protocol.
+def oem_reply(status: int, data: str = ""):
+    frame = bytes([oem_protocol.PacketFields.STX, 0x30, status]) \
+        + data.encode("ascii") + bytes([oem_protocol.PacketFields.ETX])
+    return frame + bytes([oem_protocol.checksum(frame)])
+
+
+def test_oem_encode_command():
+    packet = oem_protocol.encode_command(0x31, 1, "P100")
+    assert packet[:3] == bytes([0x02, 0x31, 0x31])
+    assert packet[3:-2] == b"P100R"
+    assert packet[-2] == oem_protocol.PacketFields.ETX
+    assert packet[-1] == oem_protocol.checksum(packet[:-1])
+
+
+def test_oem_encode_repeat_sets_flag():
+    packet = oem_protocol.encode_command(0x31, 3, "Q", execute=False,
+                                         repeat=True)
+    assert packet[2] == oem_protocol.SEQUENCE_BASE | 3 \
+        | oem_protocol.SEQUENCE_REPEAT_FLAG
+
+
+def test_oem_encode_rejects_bad_sequence_number():
+    with pytest.raises(ValueError):
+        oem_protocol.encode_command(0x31, 0, "Q")
+
+
+def test_oem_next_sequence_number_wraps():
+    assert oem_protocol.next_sequence_number(1) == 2
+    assert oem_protocol.next_sequence_number(7) == 1
+
+
+def test_oem_parse_reply():
+    reply = oem_protocol.parse_reply(oem_reply(0x60, "300"))
+    assert reply.data == "300"
+    assert reply.ready
+
+
+def test_oem_parse_reply_rejects_bad_checksum():
+    frame = bytearray(oem_reply(0x60, "300"))
+    frame[-1] ^= 0xFF
+    with pytest.raises(ValueError, match="checksum"):
+        oem_protocol.parse_reply(bytes(frame))
+
+
+def test_oem_parse_reply_rejects_bad_etx():
+    frame = bytearray(oem_reply(0x60, "300"))
+    frame[-2] = 0x00
+    with pytest.raises(ValueError, match="malformed"):
+        oem_protocol.parse_reply(bytes(frame))
+
+
+def test_oem_framer_waits_for_checksum():
+    frame = oem_reply(0x60, "1")
+    framer = oem_protocol.ReplyFramer()
+    assert framer.feed(frame[:-1]) == []
+    assert framer.feed(frame[-1:]) == [frame]
+
+
+def test_oem_framer_resyncs_and_reassembles():
+    first, second = oem_reply(0x60, "12"), oem_reply(0x40)
+    framer = oem_protocol.ReplyFramer()
+    frames = feed_in_chunks(framer, b"\xff" + first + b"\x00\x00" + second,
+                            [2, 3, 5])
+    assert frames == [first, second]
+    assert framer.discarded_bytes == 3
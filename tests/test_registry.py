@@ -0,0 +1,77 @@
+"""Caching device connection settings across restarts."""
+from runze_control.emulator import EmulatedSY08
+from runze_control.registry import DeviceRegistry
+from runze_control.runze_device import RunzeDevice
+from runze_control.syringe_pump import SY08
+from time import perf_counter
+import pytest
+
+PORT = "/dev/ttyUSB7"  # Not a USB device here, so entries key on the name.
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return DeviceRegistry(tmp_path / "devices.json")
+
+
+@pytest.fixture
+def device(emulated_bus, monkeypatch):
+    """An RS232 device at 38400[bps], reachable by opening `PORT`."""
+    def open_port(port, baudrate=9600, **kwargs):
+        assert port == PORT
+        serial = emulated_bus.serial(baudrate)
+        serial.port = port
+        return serial
+
+    monkeypatch.setattr("runze_control.runze_bus.Serial", open_port)
+    return emulated_bus.add_device(EmulatedSY08(address=0x04,
+                                                syringe_volume_ul=5000,
+                                                baudrate=38400))
+
+
+def connect(registry):
+    start_s = perf_counter()
+    pump = SY08.from_registry(registry, PORT, syringe_volume_ul=5000)
+    elapsed_s = perf_counter() - start_s
+    pump.close()
+    return pump, elapsed_s
+
+
+def test_cached_settings_skip_probing(registry, device):
+    pump, probe_s = connect(registry)
+    assert (pump.address, pump.bus.baudrate) == (0x04, 38400)
+    assert probe_s > RunzeDevice.DEFAULT_TIMEOUT_S  # Tried 9600, 19200.
+    # After a restart.
+    pump, cached_s = connect(DeviceRegistry(registry.path))
+    assert (pump.address, pump.bus.baudrate) == (0x04, 38400)
+    assert cached_s < RunzeDevice.DEFAULT_TIMEOUT_S
+
+
+def test_stale_settings_fall_back_to_probing(registry, device):
+    connect(registry)
+    device.baudrate = 9600  # Reconfigured by another program.
+    pump, _ = connect(registry)
+    assert pump.bus.baudrate == 9600
+    assert registry.lookup(PORT)["baudrate"] == 9600
+    assert len(registry.entries()) == 1
+
+
+def test_devices_sharing_a_port(registry, emulated_bus, runze_bus):
+    for address in (0x00, 0x01):
+        emulated_bus.add_device(EmulatedSY08(address=address,
+                                             syringe_volume_ul=5000,
+                                             baudrate=runze_bus.baudrate))
+        registry.record(SY08(runze_bus, address=address,
+                             syringe_volume_ul=5000))
+    port = runze_bus.com_port
+    assert registry.lookup(port) is None  # Ambiguous.
+    assert registry.lookup(port, address=0x01)["address"] == 0x01
+    registry.forget(port, address=0x00)
+    assert DeviceRegistry(registry.path).lookup(port)["address"] == 0x01
+
+
+@pytest.mark.parametrize("contents", ["{not json", '{"version": 99}'])
+def test_unusable_registry_is_ignored(tmp_path, contents):
+    path = tmp_path / "devices.json"
+    path.write_text(contents)
+    assert DeviceRegistry(path).entries() == []
@@ -0,0 +1,86 @@
+"""Shortest-rotation moves on an emulated rotary valve, and port visit
+ordering."""
+from conftest import BAUDRATE
+from itertools import permutations
+from runze_control.emulator import EmulatedRotaryValve
+from runze_control.port_sequence import _shortest_order, plan_port_visits
+from runze_control.rotary_valve import RotaryValve, rotation_table
+import pytest
+
+
+@pytest.fixture
+def valve(emulated_bus, runze_bus):
+    emulated_bus.add_device(EmulatedRotaryValve(address=0x00,
+                                                position_count=12,
+                                                baudrate=BAUDRATE))
+    return RotaryValve(runze_bus, address=0x00, position_count=12,
+                       position_map={"waste": 12})
+
+
+def test_rotation_table():
+    table = rotation_table(12)
+    assert table[1][4] == (3, True)
+    assert table[1][12] == (1, False)
+    assert table[3][3] == (0, True)
+    assert table[1][7] == (6, True)  # Halfway ties go clockwise.
+
+
+@pytest.mark.parametrize("target, travelled", [(4, 3), (11, 2), ("waste", 1)])
+def test_move_takes_shortest_rotation(emulated_bus, valve, target, travelled):
+    device = emulated_bus.devices[0]
+    valve.move_to_position(target)
+    assert device.ports_travelled == travelled
+    assert valve.get_position() == valve._to_port(target)
+
+
+def test_move_to_current_port_is_skipped(emulated_bus, valve):
+    valve.move_to_position(1)
+    assert emulated_bus.devices[0].ports_travelled == 0
+
+
+@pytest.mark.parametrize("current_port", [0, 13])
+def test_move_from_unknown_port_lets_device_pick_path(emulated_bus, valve,
+                                                      current_port):
+    emulated_bus.devices[0].position = current_port  # i.e: after a reset.
+    assert valve.plan_rotation(4) is None
+    valve.move_to_position(4)
+    assert valve.get_position() == 4
+    valve.move_to_position(3)  # Planned again once the port is known.
+    assert valve.get_position() == 3
+
+
+def test_out_of_range_port_is_rejected(valve):
+    with pytest.raises(ValueError):
+        valve.move_to_position(13)
+
+
+def brute_force_travel(start_port, ports, position_count):
+    table = rotation_table(position_count)
+    return min(sum(table[a][b].ports
+                   for a, b in zip((start_port,) + order[:-1], order))
+               for order in permutations(ports))
+
+
+@pytest.mark.parametrize("start_port, ports", [
+    (1, [2, 12, 3, 11]),
+    (5, [1, 9, 6]),
+    (1, [7]),
+    (3, [4, 5, 6, 10, 11, 2]),
+    (12, [1, 6, 7, 8]),
+])
+def test_shortest_order_is_optimal(start_port, ports):
+    order = _shortest_order(start_port, ports, 12)
+    table = rotation_table(12)
+    travel = sum(table[a][b].ports
+                 for a, b in zip([start_port] + order[:-1], order))
+    assert sorted(order) == sorted(ports)
+    assert travel == brute_force_travel(start_port, ports, 12)
+
+
+def test_visit_plan_travels_less_than_given_order(valve):
+    ports = [7, 2, 12, 3]
+    plan = plan_port_visits(valve, ports, start=1)
+    naive = plan_port_visits(valve, ports, start=1, optimize=False)
+    assert plan.travel_ports == brute_force_travel(1, ports, 12)
+    assert plan.travel_ports < naive.travel_ports
+    assert plan.duration_s < naive.duration_s
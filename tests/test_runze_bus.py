@@ -0,0 +1,67 @@
+"""Several emulated devices sharing one RunzeBus."""
+from conftest import BAUDRATE
+from runze_control.emulator import EmulatedSY08
+from runze_control.runze_protocol import PacketFields
+from runze_control.syringe_pump import SY08
+from threading import Thread
+import pytest
+
+
+@pytest.fixture
+def pumps(emulated_bus, runze_bus):
+    for address in (0x00, 0x01, 0x02):
+        emulated_bus.add_device(EmulatedSY08(address=address,
+                                             syringe_volume_ul=5000,
+                                             baudrate=BAUDRATE))
+    return [SY08(runze_bus, address=address, syringe_volume_ul=5000)
+            for address in (0x00, 0x01, 0x02)]
+
+
+def test_replies_are_routed_by_address(emulated_bus, pumps):
+    for steps, pump in zip((100, 200, 300), pumps):
+        pump.move_absolute_in_steps(steps)
+    assert [pump.get_position_steps() for pump in pumps] == [100, 200, 300]
+    assert [d.position_at(float("inf")) for d in emulated_bus.devices] \
+        == [100, 200, 300]
+
+
+def test_out_of_order_replies_reach_their_device(pumps):
+    slow, fast = pumps[0], pumps[1]
+    slow.move_absolute_in_steps(600, wait=False)  # Replies when done.
+    fast.move_absolute_in_steps(10, wait=False)
+    assert fast.wait_for_reply() is not None  # Arrives first.
+    assert slow.is_busy()
+    slow.wait_until_idle()
+    assert slow.get_position_steps() == 600
+
+
+def test_devices_share_the_bus_across_threads(pumps):
+    positions = {}
+
+    def move(pump, steps):
+        pump.move_absolute_in_steps(steps)
+        positions[pump.address] = pump.get_position_steps()
+
+    threads = [Thread(target=move, args=(pump, 50 * (i + 1)))
+               for i, pump in enumerate(pumps)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert positions == {0x00: 50, 0x01: 100, 0x02: 150}
+
+
+def test_line_noise_is_skipped_between_replies(runze_bus, pumps):
+    mover, querier = pumps[0], pumps[1]
+    mover.move_absolute_in_steps(300, wait=False)
+    # Noise (starting with a stray STX) ahead of the replies still due.
+    runze_bus.ser._receive(bytes([PacketFields.STX, 0x00, 0x55, 0x12, 0x34]))
+    assert querier.get_position_steps() == 0
+    mover.wait_for_reply()
+    assert mover.get_position_steps() == 300
+    assert runze_bus.resync_count == 1
+
+
+def test_device_must_match_bus_baudrate(runze_bus, pumps):
+    with pytest.raises(ValueError):
+        SY08(runze_bus, address=0x00, baudrate=9600, syringe_volume_ul=5000)
@@ -0,0 +1,90 @@
+"""Plunger moves on emulated syringe pumps."""
+from conftest import BAUDRATE
+from runze_control.emulator import EmulatedSY01B, EmulatedSY08
+from runze_control.multichannel_syringe_pump import SY01B
+from runze_control.protocol import Protocol
+from runze_control.protocol_codes import sy01_codes
+from runze_control.syringe_pump import SY08
+from runze_control.trace import TX
+from serial import SerialException
+import pytest
+
+
+@pytest.fixture
+def sy08(emulated_bus, runze_bus):
+    emulated_bus.add_device(EmulatedSY08(address=0x00, syringe_volume_ul=5000,
+                                         baudrate=BAUDRATE))
+    return SY08(runze_bus, address=0x00, syringe_volume_ul=5000)
+
+
+@pytest.fixture
+def sy01b(emulated_bus, runze_bus):
+    device = emulated_bus.add_device(EmulatedSY01B(address=0x00,
+                                                   syringe_volume_ul=25,
+                                                   position_count=9,
+                                                   baudrate=BAUDRATE))
+    device.steps_per_revolution *= 20  # Full strokes in a fraction of a [s].
+    pump = SY01B(runze_bus, address=0x00, syringe_volume_ul=25,
+                 position_count=9)
+    pump.set_speed_percent(100)
+    return pump
+
+
+def test_move_reply_ends_prediction(sy08):
+    sy08.move_absolute_in_steps(300)
+    assert sy08.motion.end_time_s is None
+    assert not sy08.is_busy()
+
+
+def test_failed_move_leaves_no_prediction(sy08, monkeypatch):
+    sy08.set_speed_percent(100)
+    sy08.move_absolute_in_steps(300, wait=False)
+    end_time_s = sy08.motion.end_time_s
+    with pytest.raises(RuntimeError):  # Previous move hasn't replied.
+        sy08.move_absolute_in_steps(0, wait=False)
+    assert sy08.motion.end_time_s == end_time_s
+    sy08.wait_until_idle()
+
+    def unplugged(data):
+        raise SerialException("Device unplugged.")
+
+    monkeypatch.setattr(sy08.bus.ser, "write", unplugged)
+    with pytest.raises(SerialException):
+        sy08.move_absolute_in_steps(0, wait=False)
+    assert sy08.motion.end_time_s is None
+
+
+def test_sy01b_plunger_moves_leave_valve_alone(emulated_bus, sy01b):
+    device = emulated_bus.devices[0]
+    sy01b.move_valve_to_position(3)
+    sy01b.aspirate_steps(600)
+    sy01b.dispense_steps(200)
+    assert sy01b.get_position_steps() == 400
+    assert device.valve_position == 3
+
+
+def test_sy01b_transfer(emulated_bus, sy01b):
+    device = emulated_bus.devices[0]
+    trace = sy01b.bus.enable_trace()
+    sy01b.transfer(1, 4, 60)  # 2.4 syringes: 3 strokes.
+    assert device.valve_position == 4
+    assert sy01b.get_position_steps() == 0
+    funcs = {data[2] for _, direction, data in trace.records()
+             if direction == TX}
+    assert sy01_codes.CommonCmd.MovePlungerAbsolute in funcs
+    assert sy01_codes.CommonCmd.RunInCCW not in funcs
+
+
+def test_sy01b_transfer_plan_compiles_to_absolute_moves(sy01b):
+    plan = sy01b.plan_transfer(1, 4, 60)
+    assert str(sy01b._plan_to_program(plan)) == "gI1A4800I4A0G3"
+
+
+def test_only_the_move_reply_teaches_the_motion_model(sy08):
+    sy08.set_speed_percent(100)
+    sy08.move_absolute_in_steps(600)
+    correction = sy08.motion.correction
+    assert correction != 1.0  # Learned from the move's reply.
+    sy08.get_motor_status()
+    sy08.get_position_steps()
+    assert sy08.motion.correction == correction
@@ -0,0 +1,57 @@
+"""Binary trace of bus traffic."""
+from conftest import BAUDRATE
+from io import StringIO
+from runze_control.emulator import EmulatedSY08
+from runze_control.syringe_pump import SY08
+from runze_control.trace import FrameTrace, RX, TX
+import logging
+import pytest
+
+
+@pytest.fixture
+def sy08(emulated_bus, runze_bus):
+    emulated_bus.add_device(EmulatedSY08(address=0x00, syringe_volume_ul=5000,
+                                         baudrate=BAUDRATE))
+    return SY08(runze_bus, address=0x00, syringe_volume_ul=5000)
+
+
+def test_trace_records_both_directions(sy08):
+    trace = sy08.bus.enable_trace()
+    sy08.get_position_steps()
+    (tx_time_s, tx, command), (rx_time_s, rx, reply) = trace.records()
+    assert (tx, rx) == (TX, RX)
+    assert tx_time_s <= rx_time_s
+    assert command[1:3] == bytes([0x00, sy08.codes.CommonCmd.GetSyringePosition])
+    assert len(command) == len(reply) == 8
+    out = StringIO()
+    trace.dump(out)
+    lines = out.getvalue().splitlines()
+    assert [line.split()[1] for line in lines] == ["TX", "RX"]
+    assert lines[1].endswith(reply.hex(' '))
+    sy08.bus.disable_trace()
+    sy08.get_position_steps()
+    assert len(trace) == 2
+
+
+def test_ring_buffer_keeps_the_newest_records():
+    trace = FrameTrace(capacity=4)
+    trace.record(RX, bytes(range(40)))  # Spans three records.
+    assert [data for _, _, data in trace.records()] \
+        == [bytes(range(0, 16)), bytes(range(16, 32)), bytes(range(32, 40))]
+    for value in range(3):
+        trace.record(TX, bytes([value]))
+    assert len(trace) == 4
+    assert [data for _, _, data in trace.records()] \
+        == [bytes(range(32, 40)), b"\x00", b"\x01", b"\x02"]
+    trace.clear()
+    assert trace.records() == []
+
+
+def test_frames_are_logged_only_at_debug_level(sy08, caplog):
+    with caplog.at_level(logging.INFO):
+        sy08.get_position_steps()
+    assert not caplog.records
+    with caplog.at_level(logging.DEBUG):
+        sy08.get_position_steps()
+    assert any(r.getMessage().startswith("Sending (hex)")
+               for r in caplog.records)